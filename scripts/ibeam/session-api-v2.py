@@ -8,153 +8,481 @@ not just the session ID from logs.
 """
 from flask import Flask, jsonify, request
 import requests
-import subprocess
 import time
 import re
 import sqlite3
 import os
 import shutil
 import tempfile
+import json
+import threading
+import socket
+import http.client
+import base64
+import tarfile
+import io
+import sys
+import random
+import hmac
+from collections import Counter, deque
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Tuple
 from pathlib import Path
+from urllib.parse import quote, urlsplit
 
 app = Flask(__name__)
 
-# Cache session info to avoid hammering IBeam
+# Cookies are re-extracted when the cookie database changes (see watch_cookie_db).
+# CACHE_TTL only applies when there is no database to watch (log fallback).
 _cookie_cache: Optional[Dict] = None
 _cache_time = 0
 CACHE_TTL = 30  # Cache for 30 seconds
 
+# The IBeam auth status ('ok') in a cached response is re-checked after
+# STATUS_TTL even while the cookies themselves are still current
+STATUS_TTL = 5
+_status_time = 0
+_status_lock = threading.Lock()
+
+# One refresh at a time: callers arriving mid-refresh wait on the same Future.
+# The IBeam status check and log read run on the pool alongside DB extraction.
+_refresh_lock = threading.Lock()
+_refresh_future: Optional[Future] = None
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='session-api')
+
+COOKIE_WATCH_INTERVAL = 2  # Seconds between cookie database mtime/size checks
+COOKIE_DISCOVERY_MAX_BACKOFF = 60  # Cap on the delay between container scans while no database exists
+_cookie_db_signature: Optional[tuple] = None
+_watcher_thread: Optional[threading.Thread] = None
+
+# Pushed the new cookie header whenever it changes: {url: extra_headers}
+_subscribers: Dict[str, Dict[str, str]] = {}
+
+# /subscribe needs the bridge key (X-Bridge-Key) and a URL on an allowed host,
+# since subscribers are sent the session cookies. /session-reauth needs the key
+# and a caller on an allowed host.
+BRIDGE_KEY = os.environ.get('BRIDGE_KEY', 'agentyc-bridge-9u1Px')  # MUST match the bridge's BRIDGE_KEY
+SUBSCRIBER_HOSTS = {'127.0.0.1', 'localhost', '::1'} | {
+    h.strip().lower() for h in os.environ.get('SESSION_API_SUBSCRIBER_HOSTS', '').split(',') if h.strip()
+}
+MAX_SUBSCRIBERS = 16
+
+# IBeam's _maintenance() loop re-authenticates when this flag file exists
+TRIGGER_AUTH_FLAG = '/srv/outputs/trigger_auth.flag'
+
+# Remembers where the cookie database lives so restarts skip the container scan
+STATE_FILE = Path(__file__).resolve().parent / '.session-api-state.json'
+_cookie_db_path: Optional[str] = None
+
+# Docker Engine API (unix socket) instead of forking the docker CLI per call
+DOCKER_SOCKET = '/var/run/docker.sock'
+IBEAM_CONTAINER = 'ibeam_ibeam_1'
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection over a unix domain socket"""
+    def __init__(self, socket_path: str, timeout: float):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+    
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+def docker_stream_frames(data: bytes) -> List[Tuple[int, bytes]]:
+    """
+    Split Docker's multiplexed stream into (stream, chunk) frames in order;
+    stream 1 = stdout, 2 = stderr. Containers with a TTY send raw output.
+    """
+    if len(data) < 8 or data[0] not in (0, 1, 2) or data[1:4] != b'\x00\x00\x00':
+        return [(1, data)]
+    frames = []
+    i = 0
+    while i + 8 <= len(data):
+        size = int.from_bytes(data[i + 4:i + 8], 'big')
+        frames.append((data[i], data[i + 8:i + 8 + size]))
+        i += 8 + size
+    return frames
+
+class DockerClient:
+    """
+    Minimal Docker Engine API client: exec, file stat/read and logs.
+    Keeps up to pool_size idle connections to the daemon; each call takes
+    its own, so concurrent steps (see build_cookie_response) run in parallel.
+    """
+    def __init__(self, socket_path: str = DOCKER_SOCKET, pool_size: int = 4):
+        self.socket_path = socket_path
+        self.pool_size = pool_size
+        self._idle: List[UnixHTTPConnection] = []
+        self._lock = threading.Lock()
+    
+    def _checkout(self, timeout: float) -> Tuple[UnixHTTPConnection, bool]:
+        """An idle connection (reused=True) or a new one"""
+        with self._lock:
+            if self._idle:
+                conn, reused = self._idle.pop(), True
+            else:
+                conn, reused = None, False
+        if conn is None:
+            conn = UnixHTTPConnection(self.socket_path, timeout)
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, reused
+    
+    def _checkin(self, conn: UnixHTTPConnection):
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(conn)
+                return
+        conn.close()
+    
+    def request(self, method: str, path: str, body: Optional[Dict] = None, timeout: float = 15) -> Tuple[int, Dict, bytes]:
+        """Send one API request; retries once on a fresh connection if a kept-alive one went away"""
+        payload = json.dumps(body) if body is not None else None
+        headers = {'Content-Type': 'application/json'} if payload is not None else {}
+        while True:
+            conn, reused = self._checkout(timeout)
+            try:
+                conn.request(method, path, body=payload, headers=headers)
+                resp = conn.getresponse()
+                data = resp.read()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                conn.close()
+                if reused:
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+            self._checkin(conn)
+            return resp.status, dict(resp.headers), data
+    
+    def exec(self, container: str, cmd: List[str], timeout: float = 15) -> Tuple[int, str, str]:
+        """Run a command in the container. Returns (exit_code, stdout, stderr)"""
+        status, _, data = self.request('POST', f'/containers/{container}/exec', {
+            'Cmd': cmd, 'AttachStdout': True, 'AttachStderr': True,
+        }, timeout)
+        if status != 201:
+            raise RuntimeError(f"exec create failed ({status}): {data[:200]!r}")
+        exec_id = json.loads(data)['Id']
+        
+        status, _, data = self.request('POST', f'/exec/{exec_id}/start', {'Detach': False, 'Tty': False}, timeout)
+        if status != 200:
+            raise RuntimeError(f"exec start failed ({status}): {data[:200]!r}")
+        frames = docker_stream_frames(data)
+        stdout = b''.join(chunk for stream, chunk in frames if stream != 2)
+        stderr = b''.join(chunk for stream, chunk in frames if stream == 2)
+        
+        status, _, info = self.request('GET', f'/exec/{exec_id}/json', timeout=timeout)
+        exit_code = json.loads(info).get('ExitCode') if status == 200 else None
+        return (exit_code if exit_code is not None else -1), stdout.decode(errors='replace'), stderr.decode(errors='replace')
+    
+    def stat(self, container: str, path: str) -> Optional[Dict]:
+        """
+        Stat a file in the container without exec: {name, size, mode, mtime, ...}
+        Returns None if it doesn't exist.
+        """
+        status, headers, _ = self.request('HEAD', f'/containers/{container}/archive?path={quote(path)}', timeout=5)
+        if status != 200:
+            return None
+        encoded = headers.get('X-Docker-Container-Path-Stat')
+        return json.loads(base64.b64decode(encoded)) if encoded else None
+    
+    def read_file(self, container: str, path: str) -> Optional[bytes]:
+        """Copy one file out of the container into memory (like docker cp, no temp file)"""
+        status, _, data = self.request('GET', f'/containers/{container}/archive?path={quote(path)}')
+        if status != 200:
+            return None
+        with tarfile.open(fileobj=io.BytesIO(data)) as archive:
+            for member in archive:
+                if member.isfile():
+                    return archive.extractfile(member).read()
+        return None
+    
+    def logs(self, container: str, since: Optional[float] = None, tail: Optional[int] = None) -> str:
+        """Container logs (stdout + stderr, timestamped), optionally only since a unix time"""
+        params = 'stdout=1&stderr=1&timestamps=1'
+        if since is not None:
+            params += f'&since={since:.9f}'
+        if tail is not None:
+            params += f'&tail={tail}'
+        status, _, data = self.request('GET', f'/containers/{container}/logs?{params}', timeout=5)
+        if status != 200:
+            raise RuntimeError(f"logs failed ({status}): {data[:200]!r}")
+        return b''.join(chunk for _, chunk in docker_stream_frames(data)).decode(errors='replace')
+
+docker = DockerClient()
+
+# Per-step debug prints only with SESSION_API_DEBUG=1; otherwise one structured
+# (JSON) line per extraction, sampled, plus every failure
+DEBUG = os.environ.get('SESSION_API_DEBUG') == '1'
+LOG_SAMPLE_RATE = float(os.environ.get('SESSION_API_LOG_SAMPLE_RATE', '0.1'))
+
 def debug_log(message: str):
     """Debug logging (print to stderr so it appears in logs)"""
-    print(f"[DEBUG] {message}", file=__import__('sys').stderr, flush=True)
+    if DEBUG:
+        print(f"[DEBUG] {message}", file=sys.stderr, flush=True)
+
+def log_event(event: str, sampled: bool = False, **fields):
+    """One JSON log line on stderr; sampled events are kept at LOG_SAMPLE_RATE"""
+    if sampled and not DEBUG and random.random() >= LOG_SAMPLE_RATE:
+        return
+    line = {'ts': datetime.utcnow().isoformat(), 'event': event, **fields}
+    print(json.dumps(line, default=str), file=sys.stderr, flush=True)
+
+# Timings per extraction phase, cache results, cookie counts, failure reasons
+PHASE_SAMPLES = 200  # Recent durations kept per phase for percentiles
+_metrics_lock = threading.Lock()
+_phase_stats: Dict[str, Dict] = {}
+_cache_stats = Counter()
+_failure_reasons = Counter()
+_last_extraction: Dict = {}
+
+@contextmanager
+def timed_phase(phase: str):
+    """Time a block as one extraction phase; exceptions count as phase failures"""
+    started = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except Exception:
+        failed = True
+        raise
+    finally:
+        record_phase(phase, time.perf_counter() - started, failed)
+
+def record_phase(phase: str, elapsed: float, failed: bool = False):
+    with _metrics_lock:
+        stats = _phase_stats.get(phase)
+        if stats is None:
+            stats = _phase_stats[phase] = {'count': 0, 'failures': 0, 'total': 0.0, 'max': 0.0,
+                                           'samples': deque(maxlen=PHASE_SAMPLES)}
+        stats['count'] += 1
+        stats['failures'] += failed
+        stats['total'] += elapsed
+        stats['max'] = max(stats['max'], elapsed)
+        stats['last'] = elapsed
+        stats['last_at'] = time.perf_counter()
+        stats['samples'].append(elapsed)
+
+def record_failure(reason: str, detail: str = ''):
+    with _metrics_lock:
+        _failure_reasons[reason] += 1
+    log_event('failure', reason=reason, detail=detail[:300])
+
+def phase_summary() -> Dict:
+    """{phase: {count, failures, mean, p50, p95, max, last}} in seconds"""
+    summary = {}
+    with _metrics_lock:
+        for phase, stats in _phase_stats.items():
+            samples = sorted(stats['samples'])
+            summary[phase] = {
+                'count': stats['count'],
+                'failures': stats['failures'],
+                'mean': round(stats['total'] / stats['count'], 4),
+                'p50': round(samples[len(samples) // 2], 4),
+                'p95': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 4),
+                'max': round(stats['max'], 4),
+                'last': round(stats['last'], 4),
+            }
+    return summary
+
+def metrics_snapshot() -> Dict:
+    lookups = _cache_stats['hit'] + _cache_stats['miss']
+    return {
+        'phases': phase_summary(),
+        'cache': {
+            **_cache_stats,
+            'hit_ratio': round(_cache_stats['hit'] / lookups, 4) if lookups else None,
+        },
+        'failures': dict(_failure_reasons),
+        'last_extraction': _last_extraction,
+    }
+
+def load_state() -> Dict:
+    """Read persisted state (cookie DB location). Missing or corrupt file -> {}"""
+    try:
+        return json.loads(STATE_FILE.read_text())
+    except (OSError, ValueError):
+        return {}
+
+def save_state(state: Dict):
+    """Write persisted state atomically"""
+    try:
+        tmp = STATE_FILE.with_suffix('.tmp')
+        tmp.write_text(json.dumps(state))
+        os.replace(tmp, STATE_FILE)
+    except OSError as e:
+        debug_log(f"Could not save state: {e}")
+
+def cookie_db_signature(cookie_db_path: str) -> Optional[tuple]:
+    """
+    Cheap (mtime, size) of the cookie database - a stat, no scan.
+    Returns None if the file is missing.
+    """
+    try:
+        info = docker.stat(IBEAM_CONTAINER, cookie_db_path)
+    except Exception as e:
+        debug_log(f"Could not stat cookie database: {e}")
+        return None
+    if info is None:
+        return None
+    return (info.get('mtime'), info.get('size'))
 
 def find_chrome_cookie_database() -> Optional[Path]:
     """
-    Find Chrome cookie database in IBeam container.
+    Return the Chrome cookie database path in the IBeam container.
+    Uses the remembered location (memory, then state file) while it still
+    exists, and only scans the container when it has gone missing.
+    """
+    global _cookie_db_path
+    
+    if _cookie_db_path is None:
+        _cookie_db_path = load_state().get('cookie_db_path')
+    
+    if _cookie_db_path:
+        if cookie_db_signature(_cookie_db_path) is not None:
+            return Path(_cookie_db_path)
+        debug_log(f"Remembered cookie database is gone: {_cookie_db_path}")
+    
+    with timed_phase('container_find'):
+        cookie_db = discover_chrome_cookie_database()
+    _cookie_db_path = str(cookie_db) if cookie_db else None
+    save_state({'cookie_db_path': _cookie_db_path})
+    return cookie_db
+
+def discover_chrome_cookie_database() -> Optional[Path]:
+    """
+    Scan IBeam container for the Chrome cookie database.
     Returns path to Cookies SQLite file.
     """
     debug_log("Searching for Chrome cookie database...")
     
-    # Try to find via docker exec
     try:
-        result = subprocess.run(
-            ['docker', 'exec', 'ibeam_ibeam_1', 'find', '/', '-name', 'Cookies', '-type', 'f', '2>/dev/null'],
-            capture_output=True,
-            text=True,
+        exit_code, stdout, stderr = docker.exec(
+            IBEAM_CONTAINER,
+            ['find', '/', '-path', '/proc', '-prune', '-o', '-name', 'Cookies', '-type', 'f', '-print'],
             timeout=15
         )
         
-        cookie_files = [line.strip() for line in result.stdout.split('\n') if line.strip()]
+        cookie_files = [line.strip() for line in stdout.split('\n') if line.strip()]
         debug_log(f"Found {len(cookie_files)} potential cookie files in container")
         
-        for cookie_file in cookie_files:
-            debug_log(f"  Checking: {cookie_file}")
-            
-            # Verify it's actually a SQLite database
-            try:
-                result = subprocess.run(
-                    ['docker', 'exec', 'ibeam_ibeam_1', 'file', cookie_file],
-                    capture_output=True,
-                    text=True,
-                    timeout=5
-                )
-                if 'SQLite' in result.stdout or cookie_file.endswith('Cookies'):
-                    debug_log(f"  ✓ Found SQLite cookie database: {cookie_file}")
-                    return Path(cookie_file)
-            except:
-                continue
+        # Chrome names its SQLite cookie store "Cookies"; take the first one
+        if cookie_files:
+            debug_log(f"  ✓ Found SQLite cookie database: {cookie_files[0]}")
+            return Path(cookie_files[0])
                 
     except Exception as e:
-        debug_log(f"Error searching container: {e}")
+        record_failure('container_find_error', str(e))
     
     return None
 
+# Hosts whose cookies belong to the Gateway session (matched as substrings)
+GATEWAY_HOST_KEYWORDS = ['127.0.0.1', 'localhost', '5000', '.ibkr', 'interactivebrokers']
+
+# Chrome timestamps (expires_utc) are microseconds since 1601-01-01, not 1970
+CHROME_EPOCH_OFFSET = 11644473600  # seconds from 1601-01-01 to 1970-01-01
+
+# One pass over unexpired cookies; the gateway flag is computed in SQL so the
+# "few gateway cookies" fallback can reuse the same rows instead of re-querying
+COOKIE_QUERY = (
+    "SELECT name, value, host_key, ("
+    + " OR ".join("instr(lower(host_key), ?) > 0" for _ in GATEWAY_HOST_KEYWORDS)
+    + ") AS is_gateway FROM cookies"
+    " WHERE expires_utc IS NULL OR expires_utc = 0 OR expires_utc > ?"
+    " ORDER BY is_gateway DESC"
+)
+
+def open_sqlite_bytes(data: bytes) -> sqlite3.Connection:
+    """
+    Open a copied SQLite database from memory (no temp file).
+    Falls back to a temp file on Python < 3.11, which lacks deserialize().
+    """
+    # A WAL-mode header makes an in-memory copy unreadable; the WAL itself
+    # wasn't copied, so mark the file as rollback-journal mode
+    if data[18:20] == b'\x02\x02':
+        data = data[:18] + b'\x01\x01' + data[20:]
+    
+    if hasattr(sqlite3.Connection, 'deserialize'):
+        conn = sqlite3.connect(':memory:')
+        conn.deserialize(data)
+        return conn
+    
+    with tempfile.NamedTemporaryFile(suffix='.db') as temp_db:
+        temp_db.write(data)
+        temp_db.flush()
+        disk = sqlite3.connect(temp_db.name)
+        conn = sqlite3.connect(':memory:')
+        disk.backup(conn)
+        disk.close()
+    return conn
+
 def extract_all_cookies_from_chrome_db(cookie_db_path: str) -> Dict[str, str]:
     """
     Extract ALL cookies from Chrome cookie database.
     Returns dict of {cookie_name: cookie_value}
     """
     cookies = {}
-    temp_db = None
     
     try:
         debug_log(f"Extracting cookies from: {cookie_db_path}")
         
         # Copy database out of container to avoid locking
-        temp_db = tempfile.NamedTemporaryFile(delete=False, suffix='.db')
-        temp_path = temp_db.name
-        temp_db.close()
-        
-        result = subprocess.run(
-            ['docker', 'cp', f'ibeam_ibeam_1:{cookie_db_path}', temp_path],
-            capture_output=True,
-            timeout=15
-        )
-        
-        if result.returncode != 0:
-            debug_log(f"Failed to copy cookie database: {result.stderr}")
+        with timed_phase('db_copy'):
+            data = docker.read_file(IBEAM_CONTAINER, cookie_db_path)
+        if data is None:
+            record_failure('db_copy_failed', cookie_db_path)
             return cookies
         
-        debug_log(f"Copied cookie DB to temp file: {temp_path}")
-        
-        # Connect to SQLite database
-        conn = sqlite3.connect(temp_path)
-        cursor = conn.cursor()
+        debug_log(f"Copied cookie DB into memory ({len(data)} bytes)")
         
         try:
-            # Get all cookies (Chrome stores cookies in 'cookies' table)
-            # Schema: name, value, host_key, path, expires_utc, is_secure, is_httponly, ...
-            cursor.execute("SELECT name, value, host_key, expires_utc FROM cookies")
-            
-            rows = cursor.fetchall()
-            debug_log(f"Found {len(rows)} total cookies in database")
-            
-            current_time_us = int(time.time() * 1000000)  # Chrome uses microseconds
+            # Chrome stores cookies in the 'cookies' table and uses microseconds
+            with timed_phase('sqlite_query'):
+                conn = open_sqlite_bytes(data)
+                current_time_us = int((time.time() + CHROME_EPOCH_OFFSET) * 1000000)
+                rows = conn.execute(COOKIE_QUERY, (*GATEWAY_HOST_KEYWORDS, current_time_us)).fetchall()
+            debug_log(f"Found {len(rows)} unexpired cookies in database")
+            _last_extraction['db_bytes'] = len(data)
+            _last_extraction['db_rows'] = len(rows)
+            _last_extraction['gateway_cookies'] = sum(1 for row in rows if row[3])
             
-            for name, value, host_key, expires_utc in rows:
-                # Filter expired cookies
-                if expires_utc and expires_utc > 0 and expires_utc < current_time_us:
-                    continue
-                
-                # Accept cookies for Gateway (127.0.0.1, localhost, or port 5000)
-                # Also accept all cookies initially, we'll filter if needed
-                if any(kw in str(host_key).lower() for kw in ['127.0.0.1', 'localhost', '5000', '.ibkr', 'interactivebrokers']):
+            # Accept cookies for Gateway (127.0.0.1, localhost, or port 5000)
+            for name, value, host_key, is_gateway in rows:
+                if is_gateway:
                     cookies[name] = value
                     debug_log(f"  ✓ Cookie: {name} = {value[:20]}... (host: {host_key})")
             
-            # If we didn't find Gateway-specific cookies, try all non-expired cookies
+            # If we didn't find Gateway-specific cookies, use all non-expired cookies
             # Sometimes Gateway uses cookies without obvious domain hints
             if len(cookies) < 2:
-                debug_log("Few Gateway-specific cookies found, checking all cookies...")
-                cursor.execute("SELECT name, value, host_key, expires_utc FROM cookies WHERE expires_utc = 0 OR expires_utc > ?", (current_time_us,))
-                for name, value, host_key, expires_utc in cursor.fetchall():
+                debug_log("Few Gateway-specific cookies found, using all cookies...")
+                for name, value, host_key, is_gateway in rows:
                     if name not in cookies:  # Don't overwrite
                         cookies[name] = value
                         debug_log(f"  + Cookie: {name} = {value[:20]}... (host: {host_key})")
             
-        except sqlite3.OperationalError as e:
-            debug_log(f"SQLite error: {e}")
+        except sqlite3.DatabaseError as e:
             # Try alternative table/column names
+            schema = None
             try:
-                cursor.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='cookies'")
-                debug_log(f"Table schema: {cursor.fetchone()}")
-            except:
+                conn = open_sqlite_bytes(data)
+                schema = conn.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='cookies'").fetchone()
+                conn.close()
+            except Exception:
                 pass
-        finally:
+            record_failure('sqlite_error', f"{e}; cookies table: {schema}")
+        else:
             conn.close()
             
     except Exception as e:
-        debug_log(f"Error extracting cookies: {e}")
         import traceback
-        debug_log(traceback.format_exc())
-    finally:
-        if temp_db and os.path.exists(temp_path):
-            try:
-                os.unlink(temp_path)
-            except:
-                pass
+        record_failure('extract_error', traceback.format_exc())
     
     debug_log(f"Extracted {len(cookies)} cookies total")
     return cookies
@@ -162,64 +490,82 @@ def extract_all_cookies_from_chrome_db(cookie_db_path: str) -> Dict[str, str]:
 def get_ibeam_status() -> Optional[Dict]:
     """Get IBeam status from health endpoint"""
     try:
-        resp = requests.get('http://127.0.0.1:5001/status', timeout=5)
+        with timed_phase('status_check'):
+            resp = requests.get('http://127.0.0.1:5001/status', timeout=5)
         if resp.status_code == 200:
             return resp.json()
+        record_failure('status_http_error', str(resp.status_code))
     except Exception as e:
-        debug_log(f"Could not get IBeam status: {e}")
+        record_failure('status_unreachable', str(e))
     return None
 
+# Logs are read incrementally: only lines since the previous read
+_log_cursor: Optional[float] = None
+_log_session_id: Optional[str] = None
+
 def extract_session_id_from_logs() -> Optional[str]:
     """Extract session ID from IBeam Docker logs (fallback only)"""
+    global _log_cursor, _log_session_id
     try:
-        result = subprocess.run(
-            ['docker', 'logs', '--tail', '100', 'ibeam_ibeam_1'],
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
-        
-        for line in result.stdout.split('\n'):
-            if 'session id:' in line.lower():
-                match = re.search(r'session id:\s*([a-f0-9]{32})', line, re.IGNORECASE)
-                if match:
-                    return match.group(1)
+        with timed_phase('log_scrape'):
+            read_at = time.time()
+            if _log_cursor is None:
+                output = docker.logs(IBEAM_CONTAINER, tail=100)
+            else:
+                output = docker.logs(IBEAM_CONTAINER, since=_log_cursor)
+            _log_cursor = read_at
+            
+            # Keep the newest session id seen so far
+            for line in output.split('\n'):
+                if 'session id:' in line.lower():
+                    match = re.search(r'session id:\s*([a-f0-9]{32})', line, re.IGNORECASE)
+                    if match:
+                        _log_session_id = match.group(1)
     except Exception as e:
-        debug_log(f"Could not extract session ID from logs: {e}")
-    return None
+        record_failure('log_scrape_error', str(e))
+    return _log_session_id
 
-@app.route('/session-cookies', methods=['GET'])
-def session_cookies():
+def is_authenticated(cookies: Dict, status: Optional[Dict]) -> bool:
+    """IBeam's reported auth status, or whether any cookies were found"""
+    authenticated = bool(cookies) and len(cookies) > 0
+    if status and isinstance(status, dict):
+        authenticated = status.get('authenticated', authenticated)
+    return authenticated
+
+def build_cookie_response(cookie_db_path: Optional[Path] = None) -> Dict:
     """
-    Return REAL Gateway cookies from Selenium browser session.
-    
-    This endpoint extracts actual cookies from Chrome's cookie database.
+    Extract cookies, check IBeam status and build the /session-cookies body.
+    The status check and log read run concurrently with the cookie database
+    lookup/extraction, so a cold refresh takes as long as the slowest step.
     """
-    global _cookie_cache, _cache_time
-    
-    # Use cache if fresh
-    current_time = time.time()
-    if _cookie_cache and (current_time - _cache_time) < CACHE_TTL:
-        debug_log("Returning cached cookies")
-        return jsonify(_cookie_cache)
-    
     debug_log("=== Starting cookie extraction ===")
+    started = time.perf_counter()
+    status_future = _executor.submit(get_ibeam_status)
+    session_id_future = _executor.submit(extract_session_id_from_logs)
     cookies = {}
     
+    if cookie_db_path is None:
+        with timed_phase('db_lookup'):
+            cookie_db_path = find_chrome_cookie_database()
+        if cookie_db_path is None:
+            record_failure('no_cookie_db')
+    
     # Method 1: Extract from Chrome cookie database
-    cookie_db_path = find_chrome_cookie_database()
+    source = None
     if cookie_db_path:
         debug_log(f"Found cookie database: {cookie_db_path}")
         cookies = extract_all_cookies_from_chrome_db(str(cookie_db_path))
+        source = 'database' if cookies else None
     else:
         debug_log("No cookie database found, trying fallback...")
     
     # Method 2: Fallback to session ID from logs (less reliable)
+    session_id = session_id_future.result()
     if not cookies:
         debug_log("No cookies from database, using session ID fallback...")
-        session_id = extract_session_id_from_logs()
         if session_id:
             cookies['JSESSIONID'] = session_id
+            source = 'logs'
             debug_log(f"Using session ID fallback: {session_id}")
     
     # Construct cookie header
@@ -228,16 +574,25 @@ def session_cookies():
         cookie_header = '; '.join([f'{k}={v}' for k, v in cookies.items()])
         debug_log(f"Constructed cookie header with {len(cookies)} cookies")
     else:
-        debug_log("WARNING: No cookies extracted!")
+        record_failure('no_cookies')
     
     # Check authentication status
-    status = get_ibeam_status()
-    authenticated = bool(cookies) and len(cookies) > 0
-    
-    if status and isinstance(status, dict):
-        authenticated = status.get('authenticated', authenticated)
+    authenticated = is_authenticated(cookies, status_future.result())
     
-    response = {
+    elapsed = time.perf_counter() - started
+    record_phase('refresh_total', elapsed)
+    _last_extraction.update({
+        'at': datetime.utcnow().isoformat(),
+        'seconds': round(elapsed, 4),
+        'cookie_count': len(cookies),
+        'source': source,
+        'authenticated': authenticated,
+    })
+    with _metrics_lock:
+        phases = {phase: round(stats['last'], 4) for phase, stats in _phase_stats.items()
+                  if stats['last_at'] >= started}
+    log_event('cookie_extraction', sampled=True, **_last_extraction, phases=phases)
+    return {
         'ok': authenticated,
         'cookies': cookies,
         'cookie_header': cookie_header,
@@ -245,13 +600,185 @@ def session_cookies():
         'cookie_db_found': cookie_db_path is not None,
         'timestamp': datetime.utcnow().isoformat(),
     }
+
+def refresh_cookie_cache(cookie_db_path: Optional[Path] = None, join: bool = True) -> Dict:
+    """
+    Re-extract cookies into the cache; notify subscribers if the header changed.
+    
+    Single-flight: with join=True a caller arriving during a refresh gets that
+    refresh's result. join=False (the watcher, after a database change) waits
+    for it to finish and then runs a fresh one, since it may predate the change.
+    """
+    global _cookie_cache, _cache_time, _status_time, _refresh_future
+    while True:
+        with _refresh_lock:
+            future = _refresh_future
+            if future is None:
+                future = _refresh_future = Future()
+                break
+        if join:
+            _cache_stats['joined'] += 1
+            return future.result()
+        future.exception()  # wait without raising
+    
+    try:
+        previous_header = _cookie_cache.get('cookie_header') if _cookie_cache else None
+        response = build_cookie_response(cookie_db_path)
+        _cookie_cache = response
+        _cache_time = _status_time = time.time()
+        future.set_result(response)
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _refresh_lock:
+            _refresh_future = None
+    
+    if response['cookie_header'] != previous_header:
+        notify_subscribers('cookies-changed', response)
+    return response
+
+def refresh_auth_status(cache: Dict) -> Dict:
+    """
+    Re-check IBeam's auth status for a cached response whose cookies are
+    still current. Only one check runs at a time; concurrent callers get
+    the cached response as it is.
+    """
+    global _cookie_cache, _status_time
+    if not _status_lock.acquire(blocking=False):
+        return cache
+    try:
+        authenticated = is_authenticated(cache['cookies'], get_ibeam_status())
+        fresh = dict(cache, ok=authenticated, timestamp=datetime.utcnow().isoformat())
+        with _refresh_lock:
+            # A full refresh may have replaced the cache meanwhile
+            if _cookie_cache is cache:
+                _cookie_cache = fresh
+                _status_time = time.time()
+            elif _cookie_cache is not None:
+                fresh = _cookie_cache
+        _last_extraction['authenticated'] = fresh['ok']
+        return fresh
+    finally:
+        _status_lock.release()
+
+def notify_subscribers(event: str, data: Optional[Dict] = None):
+    """POST the current cookie state to every subscriber, in the background"""
+    payload = {
+        'event': event,
+        'ok': bool(data and data.get('ok')),
+        'cookie_header': data.get('cookie_header', '') if data else '',
+        'cookie_count': data.get('cookie_count', 0) if data else 0,
+        'timestamp': datetime.utcnow().isoformat(),
+    }
+    
+    def send(url: str, headers: Dict[str, str]):
+        try:
+            requests.post(url, json=payload, headers=headers, timeout=5)
+        except Exception as e:
+            record_failure('notify_failed', f"{url}: {e}")
+    
+    for url, headers in list(_subscribers.items()):
+        threading.Thread(target=send, args=(url, headers), daemon=True).start()
+
+def watch_cookie_db():
+    """
+    Background loop: stat the cookie database every COOKIE_WATCH_INTERVAL
+    seconds and re-extract cookies only when its mtime or size changes.
+    While there is no database, the container scan (a full find) backs off
+    exponentially up to COOKIE_DISCOVERY_MAX_BACKOFF.
+    """
+    global _cookie_db_signature
+    discovery_backoff = 0.0
+    next_discovery = 0.0
+    while True:
+        try:
+            signature = cookie_db_signature(_cookie_db_path) if _cookie_db_path else None
+            if signature is None and time.time() >= next_discovery:
+                # Not found yet, or the browser profile moved. Scheduled before
+                # scanning so a failing scan backs off too.
+                discovery_backoff = min(max(discovery_backoff * 2, COOKIE_WATCH_INTERVAL), COOKIE_DISCOVERY_MAX_BACKOFF)
+                next_discovery = time.time() + discovery_backoff
+                cookie_db = find_chrome_cookie_database()
+                signature = cookie_db_signature(str(cookie_db)) if cookie_db else None
+            if signature is not None:
+                discovery_backoff = next_discovery = 0.0
+            
+            if signature is not None and signature != _cookie_db_signature:
+                debug_log(f"Cookie database changed: {_cookie_db_signature} -> {signature}")
+                _cookie_db_signature = signature
+                _cache_stats['watcher_refresh'] += 1
+                refresh_cookie_cache(Path(_cookie_db_path), join=False)
+            elif signature is None:
+                _cookie_db_signature = None
+        except Exception as e:
+            record_failure('watcher_error', str(e))
+        time.sleep(COOKIE_WATCH_INTERVAL)
+
+def ensure_watcher():
+    """Start the cookie database watcher once per process"""
+    global _watcher_thread
+    if _watcher_thread is None or not _watcher_thread.is_alive():
+        _watcher_thread = threading.Thread(target=watch_cookie_db, daemon=True)
+        _watcher_thread.start()
+
+@app.route('/session-cookies', methods=['GET'])
+def session_cookies():
+    """
+    Return REAL Gateway cookies from Selenium browser session.
+    
+    This endpoint extracts actual cookies from Chrome's cookie database.
+    The cache stays valid until the watcher sees the database change;
+    without a database it expires after CACHE_TTL. The auth status in a
+    cached response is re-checked every STATUS_TTL.
+    """
+    ensure_watcher()
+    
+    cache = _cookie_cache
+    if cache:
+        watched = cache.get('cookie_db_found') and _cookie_db_signature is not None
+        if watched or (time.time() - _cache_time) < CACHE_TTL:
+            debug_log("Returning cached cookies")
+            _cache_stats['hit'] += 1
+            if time.time() - _status_time >= STATUS_TTL:
+                cache = refresh_auth_status(cache)
+            return jsonify(cache)
+    
+    _cache_stats['miss'] += 1
+    return jsonify(refresh_cookie_cache())
+
+@app.route('/subscribe', methods=['POST', 'DELETE'])
+def subscribe():
+    """
+    Register (POST) or remove (DELETE) a URL that is POSTed the new
+    cookie_header whenever cookies change or the session is cleared.
+    Body: {"url": "...", "headers": {...optional request headers...}}
+    Requires X-Bridge-Key; the URL's host must be local or listed in
+    SESSION_API_SUBSCRIBER_HOSTS.
+    """
+    if not hmac.compare_digest(request.headers.get('X-Bridge-Key', ''), BRIDGE_KEY):
+        return jsonify({'ok': False, 'error': 'Unauthorized'}), 401
     
-    # Cache response
-    _cookie_cache = response
-    _cache_time = current_time
+    body = request.get_json(silent=True) or {}
+    url = body.get('url')
+    if not url or not isinstance(url, str):
+        return jsonify({'ok': False, 'error': 'url is required'}), 400
     
-    debug_log(f"=== Cookie extraction complete: {len(cookies)} cookies ===")
-    return jsonify(response)
+    if request.method == 'DELETE':
+        _subscribers.pop(url, None)
+    else:
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or (parts.hostname or '').lower() not in SUBSCRIBER_HOSTS:
+            return jsonify({'ok': False, 'error': 'url host is not allowed'}), 403
+        headers = body.get('headers') or {}
+        if not isinstance(headers, dict):
+            return jsonify({'ok': False, 'error': 'headers must be an object'}), 400
+        if url not in _subscribers and len(_subscribers) >= MAX_SUBSCRIBERS:
+            return jsonify({'ok': False, 'error': f'at most {MAX_SUBSCRIBERS} subscribers'}), 429
+        _subscribers[url] = headers
+        ensure_watcher()
+    
+    return jsonify({'ok': True, 'subscribers': len(_subscribers)})
 
 @app.route('/test-gateway', methods=['GET'])
 def test_gateway():
@@ -310,6 +837,22 @@ def debug():
         'cookie_db_path': str(cookie_db) if cookie_db else None,
         'cache_active': _cookie_cache is not None,
         'cache_time': datetime.fromtimestamp(_cache_time).isoformat() if _cache_time else None,
+        'cookie_db_signature': _cookie_db_signature,
+        'watcher_running': _watcher_thread is not None and _watcher_thread.is_alive(),
+        'subscribers': list(_subscribers.keys()),
+        'metrics': metrics_snapshot(),
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Extraction metrics: per-phase timings (container_find, db_copy,
+    sqlite_query, status_check, log_scrape, db_lookup, refresh_total),
+    cache hit ratio, cookie counts and failure reasons.
+    """
+    return jsonify({
+        **metrics_snapshot(),
+        'timestamp': datetime.utcnow().isoformat(),
     })
 
 @app.route('/session-info', methods=['GET'])
@@ -335,12 +878,47 @@ def session_clear():
     _cookie_cache = None
     _cache_time = 0
     debug_log("Session cookie cache cleared")
+    notify_subscribers('cookies-cleared')
     return jsonify({
         'ok': True,
         'message': 'Session cache cleared',
         'timestamp': datetime.utcnow().isoformat(),
     })
 
+@app.route('/session-reauth', methods=['POST'])
+def session_reauth():
+    """
+    Ask IBeam to log in to the Gateway again.
+    Used by the Bridge keepalive when the Gateway session has dropped.
+    Requires X-Bridge-Key from a host in SESSION_API_SUBSCRIBER_HOSTS.
+    """
+    global _cookie_cache, _cache_time
+    if not hmac.compare_digest(request.headers.get('X-Bridge-Key', ''), BRIDGE_KEY):
+        return jsonify({'ok': False, 'error': 'Unauthorized'}), 401
+    if (request.remote_addr or '').lower() not in SUBSCRIBER_HOSTS:
+        return jsonify({'ok': False, 'error': 'caller host is not allowed'}), 403
+    
+    try:
+        exit_code, _, stderr = docker.exec(IBEAM_CONTAINER, ['touch', TRIGGER_AUTH_FLAG], timeout=10)
+    except Exception as e:
+        record_failure('reauth_failed', str(e))
+        return jsonify({'ok': False, 'error': str(e)}), 500
+    
+    if exit_code != 0:
+        record_failure('reauth_failed', stderr)
+        return jsonify({'ok': False, 'error': stderr.strip()}), 500
+    
+    # Cookies will change once IBeam logs in again
+    _cookie_cache = None
+    _cache_time = 0
+    debug_log("IBeam re-authentication triggered")
+    notify_subscribers('cookies-cleared')
+    return jsonify({
+        'ok': True,
+        'message': 'IBeam re-authentication triggered',
+        'timestamp': datetime.utcnow().isoformat(),
+    })
+
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
@@ -356,8 +934,12 @@ if __name__ == '__main__':
     print("Endpoints:")
     print("  GET /health - Health check")
     print("  GET /debug - Debug information")
+    print("  GET /metrics - Extraction phase timings, cache and failure counters")
     print("  GET /session-info - Session information")
     print("  GET /session-cookies - Real cookies from Selenium")
     print("  GET /test-gateway - Test cookies against Gateway")
     print("  POST/DELETE /session-clear - Clear session cache")
-    app.run(host='0.0.0.0', port=5002, debug=False)
+    print("  POST /session-reauth - Trigger IBeam re-authentication")
+    print("  POST/DELETE /subscribe - Register for cookie change pushes")
+    ensure_watcher()
+    app.run(host='0.0.0.0', port=5002, debug=False, threaded=True)
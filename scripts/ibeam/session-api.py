@@ -8,19 +8,88 @@ that Bridge can call to get current Gateway session cookies.
 """
 from flask import Flask, jsonify
 import requests
-import subprocess
 import time
 import re
-from datetime import datetime
+import json
+import threading
+import socket
+import http.client
+import os
+from datetime import datetime, timezone
+from pathlib import Path
 from typing import Optional, Dict
 
 app = Flask(__name__)
 
-# Cache session info to avoid hammering IBeam
-_session_cache: Optional[Dict] = None
+# Cache IBeam status to avoid hammering IBeam
+_status_cache: Optional[Dict] = None
 _cache_time = 0
 CACHE_TTL = 30  # Cache for 30 seconds
 
+# Latest session id / auth state seen in IBeam's log, kept by follow_ibeam_logs()
+_log_state: Dict = {'session_id': None, 'authenticated': None, 'since': None}
+_log_follower: Optional[threading.Thread] = None
+LOG_STATE_FILE = Path(__file__).resolve().parent / '.session-api-log-state.json'
+LOG_STATE_SAVE_INTERVAL = 30  # Seconds between saves of the log position
+LOG_FOLLOW_RETRY = 5  # Seconds before re-attaching to the log stream
+LOGGED_OUT_MARKERS = ['not authenticated', 'gateway not running', 'logged out', 'authentication failed']
+
+# Docker Engine API (unix socket) instead of forking the docker CLI per call
+DOCKER_SOCKET = '/var/run/docker.sock'
+IBEAM_CONTAINER = 'ibeam_ibeam_1'
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection over a unix domain socket"""
+    def __init__(self, socket_path: str, timeout: float):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+    
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+class DockerClient:
+    """Minimal Docker Engine API client: follows container logs over the unix socket."""
+    def __init__(self, socket_path: str = DOCKER_SOCKET):
+        self.socket_path = socket_path
+
+    def follow_logs(self, container: str, since: Optional[float] = None):
+        """
+        Yield (timestamp, line) for each log line as it is written (follow=1).
+        Holds its connection open for the stream; returns when the container
+        stops.
+        """
+        conn = UnixHTTPConnection(self.socket_path, timeout=None)
+        try:
+            params = 'stdout=1&stderr=1&timestamps=1&follow=1'
+            if since is not None:
+                params += f'&since={since:.9f}'
+            conn.request('GET', f'/containers/{container}/logs?{params}')
+            resp = conn.getresponse()
+            if resp.status != 200:
+                raise RuntimeError(f"logs failed ({resp.status}): {resp.read()[:200]!r}")
+            
+            pending = b''
+            while True:
+                header = resp.read(8)
+                if len(header) < 8:
+                    return
+                if header[0] in (0, 1, 2) and header[1:4] == b'\x00\x00\x00':
+                    pending += resp.read(int.from_bytes(header[4:8], 'big'))
+                else:
+                    # TTY container: raw stream without frame headers
+                    pending += header + resp.readline()
+                while b'\n' in pending:
+                    raw, pending = pending.split(b'\n', 1)
+                    ts, _, line = raw.decode(errors='replace').partition(' ')
+                    yield ts, line
+        finally:
+            conn.close()
+
+docker = DockerClient()
+
 def get_ibeam_status() -> Optional[Dict]:
     """Get IBeam status from health endpoint"""
     try:
@@ -31,41 +100,87 @@ def get_ibeam_status() -> Optional[Dict]:
         print(f"Warning: Could not get IBeam status: {e}")
     return None
 
-def extract_session_id_from_logs() -> Optional[str]:
-    """Extract session ID from IBeam Docker logs"""
+def docker_timestamp_to_unix(ts: str) -> Optional[float]:
+    """'2024-05-01T12:00:00.123456789Z' -> unix seconds (nanosecond fraction kept)"""
     try:
-        result = subprocess.run(
-            ['docker', 'logs', '--tail', '100', 'ibeam_ibeam_1'],
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
-        
-        # Look for session ID pattern in logs
+        seconds = datetime.strptime(ts[:19], '%Y-%m-%dT%H:%M:%S').replace(tzinfo=timezone.utc).timestamp()
+        fraction = ts[19:].rstrip('Z').split('+')[0]
+        return seconds + (float(fraction) if fraction.startswith('.') else 0.0)
+    except ValueError:
+        return None
+
+def load_log_state() -> Dict:
+    try:
+        return json.loads(LOG_STATE_FILE.read_text())
+    except (OSError, ValueError):
+        return {}
+
+def save_log_state():
+    try:
+        tmp = LOG_STATE_FILE.with_suffix('.tmp')
+        tmp.write_text(json.dumps(_log_state))
+        os.replace(tmp, LOG_STATE_FILE)
+    except OSError as e:
+        print(f"Warning: Could not save log state: {e}")
+
+def apply_log_line(line: str) -> bool:
+    """Update _log_state from one IBeam log line. Returns True if the session changed."""
+    lowered = line.lower()
+    if 'session id:' in lowered:
         # Format: "Gateway running and authenticated, session id: e4440b157282330a0b2ab95347139d5f"
-        for line in result.stdout.split('\n'):
-            if 'session id:' in line.lower():
-                # Extract session ID (32-char hex string)
-                match = re.search(r'session id:\s*([a-f0-9]{32})', line, re.IGNORECASE)
-                if match:
-                    return match.group(1)
-    except Exception as e:
-        print(f"Warning: Could not extract session ID from logs: {e}")
-    return None
+        match = re.search(r'session id:\s*([a-f0-9]{32})', line, re.IGNORECASE)
+        if match and (match.group(1) != _log_state['session_id'] or not _log_state['authenticated']):
+            _log_state['session_id'] = match.group(1)
+            _log_state['authenticated'] = True
+            return True
+    elif any(marker in lowered for marker in LOGGED_OUT_MARKERS):
+        if _log_state['authenticated'] is not False:
+            _log_state['authenticated'] = False
+            return True
+    return False
+
+def follow_ibeam_logs():
+    """
+    Background loop: stream IBeam's log once and keep only the latest
+    session id and authentication state. Resumes from the last seen
+    timestamp after a restart or when the container restarts.
+    """
+    _log_state.update(load_log_state())
+    last_saved = time.time()
+    while True:
+        try:
+            for ts, line in docker.follow_logs(IBEAM_CONTAINER, since=_log_state.get('since')):
+                changed = apply_log_line(line)
+                seen_at = docker_timestamp_to_unix(ts)
+                if seen_at is not None:
+                    _log_state['since'] = seen_at  # replaying this one line on resume is harmless
+                if changed or time.time() - last_saved > LOG_STATE_SAVE_INTERVAL:
+                    save_log_state()
+                    last_saved = time.time()
+        except Exception as e:
+            print(f"Warning: IBeam log follower error: {e}")
+        save_log_state()
+        time.sleep(LOG_FOLLOW_RETRY)
+
+def ensure_log_follower():
+    """Start the IBeam log follower once per process"""
+    global _log_follower
+    if _log_follower is None or not _log_follower.is_alive():
+        _log_follower = threading.Thread(target=follow_ibeam_logs, daemon=True)
+        _log_follower.start()
 
 @app.route('/session-info', methods=['GET'])
 def session_info():
     """Return session information for Bridge"""
-    global _session_cache, _cache_time
+    global _status_cache, _cache_time
+    ensure_log_follower()
     
-    # Use cache if fresh
+    # IBeam status is cached; the session id is kept current by the log follower
     current_time = time.time()
-    if _session_cache and (current_time - _cache_time) < CACHE_TTL:
-        return jsonify(_session_cache)
-    
-    # Get fresh status
-    status = get_ibeam_status()
-    session_id = extract_session_id_from_logs()
+    if (current_time - _cache_time) >= CACHE_TTL:
+        _status_cache = get_ibeam_status()
+        _cache_time = current_time
+    status = _status_cache
     
     # Determine authentication status
     authenticated = False
@@ -74,22 +189,16 @@ def session_info():
         if isinstance(status, dict):
             authenticated = status.get('authenticated', False)
     
-    # If we have a session ID, assume authenticated
+    # If the logs show a live session id, assume authenticated
+    session_id = _log_state['session_id'] if _log_state['authenticated'] else None
     if session_id:
         authenticated = True
     
-    # Construct response
-    response = {
+    return jsonify({
         'authenticated': authenticated,
         'session_id': session_id,
         'timestamp': datetime.utcnow().isoformat(),
-    }
-    
-    # Cache response
-    _session_cache = response
-    _cache_time = current_time
-    
-    return jsonify(response)
+    })
 
 @app.route('/session-cookies', methods=['GET'])
 def session_cookies():
@@ -139,5 +248,6 @@ if __name__ == '__main__':
     print("  GET /health - Health check")
     print("  GET /session-info - Session information")
     print("  GET /session-cookies - Cookies for Bridge")
+    ensure_log_follower()
     app.run(host='0.0.0.0', port=5002, debug=False)
 
@@ -1,13 +1,67 @@
-from fastapi import FastAPI, Header, HTTPException, Query
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+
+from fastapi.encoders import jsonable_encoder
+
+from fastapi.responses import Response, StreamingResponse
+
+from starlette.routing import Match
 
 from pydantic import BaseModel
 
 from typing import List, Optional
 
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+
+import asyncio
+
+import functools
+
+import contextlib
+
+import copy
+
+import itertools
+
+import gzip
+
+import hashlib
+
+import json
+
+import os
+
+import time
+
+import bisect
+
+import heapq
+
+import math
+
+import re
+
+import sqlite3
+
+import fcntl
+
+import multiprocessing
+
+import queue
+
+import threading
+
+from collections import OrderedDict, deque
+
+from concurrent.futures import ProcessPoolExecutor
+
+from urllib.parse import quote
+
+from zoneinfo import ZoneInfo
 
 import httpx
 
+import numpy as np
+
 
 
 # -------------------------------------------------
@@ -20,8 +74,90 @@ import httpx
 
 BRIDGE_KEY = "agentyc-bridge-9u1Px"  # MUST match Vercel IBKR_BRIDGE_KEY
 
-IB_GATEWAY_URL = "https://localhost:5000/v1/api"
-SESSION_API_URL = "http://127.0.0.1:5002"
+# Overridable so bench/ can point the bridge at a fake gateway
+IB_GATEWAY_URL = os.environ.get("IB_GATEWAY_URL", "https://localhost:5000/v1/api")
+SESSION_API_URL = os.environ.get("SESSION_API_URL", "http://127.0.0.1:5002")
+# When set, every gateway response is appended to this file (.jsonl or .jsonl.gz)
+# for bench/replay_gateway.py. Recordings contain account data - keep them private.
+# With WEB_CONCURRENCY > 1 each worker writes its own file, suffixed with its pid.
+GATEWAY_RECORD_FILE = os.environ.get("GATEWAY_RECORD_FILE")
+
+# Multi-worker mode: set SHARED_CACHE_FILE (e.g. /dev/shm/ibkr-bridge.db) and
+# WEB_CONCURRENCY=N (uvicorn's default for --workers). One worker polls the gateway;
+# every worker reads gateway responses and quote snapshots from the shared SQLite file.
+SHARED_CACHE_FILE = os.environ.get("SHARED_CACHE_FILE")
+# Worker count, read the way uvicorn reads its --workers default. Pacing token
+# buckets live in the shared file, so all workers draw on one gateway budget.
+BRIDGE_WORKERS = max(1, int(os.environ.get("WEB_CONCURRENCY") or 1)) if SHARED_CACHE_FILE else 1
+SHARED_REFRESH_INTERVAL = 1.0  # Seconds between the poller's sweeps of recently read keys
+SHARED_HOT_WINDOW = 30         # Keys read within this many seconds are kept fresh by the poller
+SHARED_MARK_INTERVAL = 1.0     # Seconds between each worker's batched read_at writes
+SNAPSHOT_SHARED_TTL = 2.0      # Quote snapshot rows younger than this are served from the shared cache
+# Where the Session API pushes cookie changes (this bridge, as seen from the Session API)
+SESSION_COOKIE_PUSH_URL = "http://127.0.0.1:8000/gateway/session-cookies"
+
+KEEPALIVE_INTERVAL = 60        # Seconds between gateway /tickle calls
+REAUTH_AFTER_FAILURES = 2      # Consecutive unauthenticated checks before asking IBeam to re-login
+REAUTH_COOLDOWN = 300          # Minimum seconds between IBeam re-auth triggers
+AUTH_RECHECK_INTERVAL = 5      # Seconds between auth checks while the session is down
+AUTH_STREAM_HEARTBEAT = 15     # Seconds between SSE keepalive comments on /gateway/auth-status/stream
+
+GATEWAY_TIMEOUT = 10.0         # Upper bound for a single gateway call (seconds)
+GATEWAY_TIMEOUT_MIN = 1.0      # Lower bound for the adaptive timeout
+TIMEOUT_P99_MULTIPLIER = 3.0   # Adaptive timeout = observed p99 latency x this
+LATENCY_WINDOW = 200           # Latency samples kept per endpoint family
+LATENCY_MIN_SAMPLES = 20       # Samples needed before the timeout adapts
+CIRCUIT_FAILURE_THRESHOLD = 5  # Consecutive failures that open a circuit
+CIRCUIT_RESET_TIMEOUT = 5.0    # Seconds an open circuit waits before a half-open probe
+CIRCUIT_RESET_TIMEOUT_MAX = 60.0
+LAST_GOOD_MAX_AGE = 300        # Oldest last-good response served while a circuit is open
+LAST_GOOD_MAX_ENTRIES = 256
+
+GATEWAY_RATE_LIMIT = 10.0      # Gateway-wide requests per second (Client Portal limit)
+GATEWAY_RATE_BURST = 10
+PACING_BACKOFF = 15.0          # Seconds an endpoint is paused after a 429
+
+RESPONSE_CACHE_MAX_ENTRIES = 512   # LRU bound for cached route responses
+
+# Equity curve: net liquidation sampled into an append-only SQLite file
+EQUITY_DB_FILE = os.environ.get("EQUITY_DB_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "equity.db"))
+EQUITY_SAMPLE_INTERVAL = 300   # Seconds between samples
+
+# History bars kept for /history/indicators (and anything else reading the bar store)
+BARS_DB_FILE = os.environ.get("BARS_DB_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "bars.db"))
+
+QUOTE_FEED_INTERVAL = 1.0      # Seconds between snapshot sweeps of the watched conids
+QUOTE_FEED_BATCH = 100         # Conids per snapshot call
+QUOTE_FEED_RETAIN = 60.0       # Seconds a conid's last quote is kept after nothing watches it
+
+SCANNER_MAX_SYMBOLS = 1000
+SCANNER_MATCH_HISTORY = 200    # Recent matches kept per scanner
+SCANNER_QUEUE_SIZE = 1000      # Matches buffered per stream client before dropping
+SCANNER_STREAM_HEARTBEAT = 15  # Seconds between SSE keepalive comments on /scanner/{id}/stream
+SCANNER_VOLUME_WINDOW = 20     # Ticks averaged for volume_spike (and needed before it fires)
+
+ALERTS_DB_FILE = os.environ.get("ALERTS_DB_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "alerts.db"))
+ALERT_HISTORY = 200            # Recent triggers kept in memory
+ALERT_SYNC_INTERVAL = 2.0      # Seconds between alert file syncs in multi-worker mode
+
+# Paper trading: /orders/*, /trades and /account/{summary,positions} run on the
+# in-process matching engine. Set SIM_TRADING=0 to turn it off. The engine's state
+# is per process, so it is off with more than one worker.
+SIM_TRADING = os.environ.get("SIM_TRADING", "1") != "0"
+if SIM_TRADING and BRIDGE_WORKERS > 1:
+    print(f"Warning: paper trading disabled: its state is per worker and WEB_CONCURRENCY={BRIDGE_WORKERS}")
+    SIM_TRADING = False
+SIM_STARTING_CASH = 100000.0
+SIM_FEE_PER_SHARE = 0.005      # IBKR fixed-rate commission
+SIM_FEE_MIN = 1.0
+SIM_QUOTE_MAX_AGE = 5.0        # Feed quotes older than this are re-fetched for an arriving order
+SIM_EXCHANGE_TZ = "America/New_York"
+SIM_SESSION_CLOSE = (16, 0)    # DAY orders expire, and pnl_day restarts, at this exchange-local time
+
+BACKTEST_WORKERS = os.cpu_count() or 2   # Processes running /backtest parameter sets
+
+# Histogram bucket bounds (seconds) for /metrics latency histograms
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
 
 
 
@@ -50,47 +186,1010 @@ def verify_key(header_key: Optional[str]):
 verify = verify_key
 
 
-async def ib_get(path: str) -> dict:
+# -------------------------------------------------
+# METRICS
+# -------------------------------------------------
 
+# Minimal Prometheus text-format metrics, kept in plain dicts so recording
+# on the hot path is a dict lookup and an add. Labels are passed
+# positionally in the order given at creation.
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name, self.help, self.labels = name, help, labels
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1.0):
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in self.values.items():
+            lines.append(f"{self.name}{format_labels(self.labels, labels)} {value:g}")
+        return lines
+
+
+class Gauge(Counter):
+    def dec(self, *labels, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value: float):
+        self.values[labels] = value
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help, labels, buckets
+        # labels -> [per-bucket counts (non-cumulative, last is +Inf), sum, count]
+        self.values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                le = "+Inf" if bound == math.inf else f"{bound:g}"
+                lines.append(
+                    f"{self.name}_bucket{format_labels(self.labels + ('le',), labels + (le,))} {cumulative}"
+                )
+            lines.append(f"{self.name}_sum{format_labels(self.labels, labels)} {total:.6f}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, labels)} {count}")
+        return lines
+
+
+def format_labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{escape_label(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+HTTP_REQUESTS = Histogram(
+    "bridge_http_request_duration_seconds", "Bridge route latency", ("route", "method", "status")
+)
+HTTP_INFLIGHT = Gauge("bridge_http_requests_in_flight", "Bridge requests being handled", ("route",))
+GATEWAY_REQUESTS = Histogram(
+    "bridge_gateway_request_duration_seconds",
+    "Gateway call latency per endpoint family (excludes pacing wait)",
+    ("family", "method", "status"),
+)
+GATEWAY_PACING_WAIT = Histogram(
+    "bridge_gateway_pacing_wait_seconds", "Time spent waiting for a pacing token", ("family",)
+)
+GATEWAY_FALLBACKS = Counter(
+    "bridge_gateway_fallbacks_total", "Last-good responses served instead of a gateway call", ("family", "reason")
+)
+CACHE_RESULTS = Counter("bridge_response_cache_total", "Route cache lookups", ("route", "result"))
+GATEWAY_COALESCED = Counter(
+    "bridge_gateway_coalesced_total", "Gateway GETs that joined an identical call already in flight", ("family",)
+)
+
+METRICS = [
+    HTTP_REQUESTS, HTTP_INFLIGHT, GATEWAY_REQUESTS, GATEWAY_PACING_WAIT, GATEWAY_FALLBACKS, CACHE_RESULTS,
+    GATEWAY_COALESCED,
+]
+
+_route_paths: Optional[set] = None
+
+
+def route_label(scope: dict) -> str:
     """
+    Route template for a request, e.g. /scanner/{scanner_id}. Unknown paths
+    share "other" so scanners can't grow the label set.
+    """
+    global _route_paths
+    if _route_paths is None:
+        _route_paths = {getattr(r, "path", None) for r in app.router.routes}
+    if scope["path"] in _route_paths:
+        return scope["path"]
+    for route in app.router.routes:
+        if route.matches(scope)[0] != Match.NONE:
+            return route.path
+    return "other"
+
+
+@app.middleware("http")
+async def record_route_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    # In-flight needs a label before routing; the histogram uses the route that handled it
+    route = route_label(request.scope)
+    HTTP_INFLIGHT.inc(route)
+    status = "500"
+    try:
+        response = await call_next(request)
+        status = str(response.status_code)
+        return response
+    finally:
+        HTTP_INFLIGHT.dec(route)
+        matched = request.scope.get("route")
+        HTTP_REQUESTS.observe(time.perf_counter() - started, getattr(matched, "path", route), request.method, status)
 
-    Call IBKR Client Portal Gateway GET /v1/api/{path}
 
-    - Verify=False because IBKR uses a self-signed cert by default
+# -------------------------------------------------
+# GATEWAY CLIENT
+# -------------------------------------------------
 
-    - Raises HTTPException on non-2xx responses
+# One pooled client for all gateway calls (keep-alive connections to :5000)
+_gateway_client: Optional[httpx.AsyncClient] = None
 
-    """
 
-    url = f"{IB_GATEWAY_URL.rstrip('/')}/{path.lstrip('/')}"
+def get_gateway_client() -> httpx.AsyncClient:
+    global _gateway_client
+    if _gateway_client is None or _gateway_client.is_closed:
+        _gateway_client = httpx.AsyncClient(
+            verify=False,
+            timeout=GATEWAY_TIMEOUT,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+        apply_session_cookies()
+    return _gateway_client
+
+
+# Separate small pool for the local Session API (:5002)
+_session_api_client: Optional[httpx.AsyncClient] = None
+
+
+def get_session_api_client() -> httpx.AsyncClient:
+    global _session_api_client
+    if _session_api_client is None or _session_api_client.is_closed:
+        _session_api_client = httpx.AsyncClient(
+            base_url=SESSION_API_URL,
+            timeout=5.0,
+            limits=httpx.Limits(max_connections=4, max_keepalive_connections=2),
+        )
+    return _session_api_client
+
+
+# Gateway cookie header from the Session API, set on the pooled gateway client.
+# Fetched from /session-cookies at startup and on a 401, otherwise only
+# replaced when the Session API pushes a change. version bumps on every change.
+_session_cookies = {
+    "header": None,
+    "version": 0,
+    "updated_at": None,
+    "source": None,
+    "fetches": 0,
+    "pushes": 0,
+}
+_session_cookie_lock = asyncio.Lock()
+
+
+def apply_session_cookies():
+    """Attach (or remove) the current cookie header on the pooled gateway client."""
+    if _gateway_client is None:
+        return
+    if _session_cookies["header"]:
+        _gateway_client.headers["Cookie"] = _session_cookies["header"]
+    else:
+        _gateway_client.headers.pop("Cookie", None)
+
+
+def set_session_cookies(header: Optional[str], source: str):
+    header = header or None
+    if header != _session_cookies["header"]:
+        _session_cookies["version"] += 1
+    _session_cookies["header"] = header
+    _session_cookies["updated_at"] = datetime.utcnow()
+    _session_cookies["source"] = source
+    apply_session_cookies()
+    if _shared is not None and source != "shared":
+        _shared.put("state:cookies", {"header": header})
 
+
+async def refresh_session_cookies(seen_version: Optional[int] = None) -> bool:
+    """
+    Fetch the cookie header from the Session API's /session-cookies.
+    Pass the version a failed request was sent with: if the cookies have
+    changed since (another 401 or a push got there first) nothing is fetched.
+    Returns True if the caller now has different cookies to retry with.
+    """
+    async with _session_cookie_lock:
+        if seen_version is not None and _session_cookies["version"] != seen_version:
+            return True
+        try:
+            resp = await get_session_api_client().get("/session-cookies")
+            data = resp.json() if resp.status_code == 200 else {}
+        except Exception as e:
+            print(f"Warning: Session API cookie fetch failed: {e}")
+            return False
+        _session_cookies["fetches"] += 1
+        before = _session_cookies["version"]
+        set_session_cookies(data.get("cookie_header"), "fetch")
+        return _session_cookies["version"] != before
+
+
+async def subscribe_session_cookies() -> bool:
+    """Ask the Session API to push cookie changes to this bridge (idempotent)."""
     try:
+        resp = await get_session_api_client().post(
+            "/subscribe",
+            json={"url": SESSION_COOKIE_PUSH_URL, "headers": {"X-Bridge-Key": BRIDGE_KEY}},
+            headers={"X-Bridge-Key": BRIDGE_KEY},
+        )
+        return resp.status_code == 200
+    except Exception as e:
+        print(f"Warning: Session API subscribe failed: {e}")
+        return False
 
-        async with httpx.AsyncClient(verify=False, timeout=10) as client:
 
-            resp = await client.get(url)
+def endpoint_family(path: str) -> str:
+    """
+    Group gateway paths for circuit breaking:
+    iserver/account/orders -> iserver/account, portfolio/U123/summary -> portfolio
+    """
+    parts = [p for p in path.split("?", 1)[0].strip("/").split("/") if p]
+    if not parts:
+        return ""
+    if parts[0] == "iserver" and len(parts) > 1:
+        return f"iserver/{parts[1]}"
+    return parts[0]
 
-    except httpx.RequestError as e:
 
-        raise HTTPException(
+class CircuitBreaker:
+    """
+    Circuit breaker for one gateway endpoint family.
+    - closed: calls go through; CIRCUIT_FAILURE_THRESHOLD consecutive failures open it
+    - open: calls fail fast until the reset timeout passes
+    - half_open: a single probe call decides between closed and open again
+      (a failed probe doubles the reset timeout up to CIRCUIT_RESET_TIMEOUT_MAX)
+    Also keeps recent latencies so the per-call timeout tracks the observed p99.
+    """
 
-            status_code=502,
+    def __init__(self, family: str):
+        self.family = family
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.open_for = CIRCUIT_RESET_TIMEOUT
+        self.probe_in_flight = False
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self._timeout = GATEWAY_TIMEOUT
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.open_for:
+                return False
+            self.state = "half_open"
+        if self.probe_in_flight:
+            return False
+        self.probe_in_flight = True
+        return True
+
+    def timeout(self) -> float:
+        return self._timeout
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+    def record_success(self, elapsed: float):
+        self.latencies.append(elapsed)
+        self.failures = 0
+        self.probe_in_flight = False
+        self.state = "closed"
+        self.open_for = CIRCUIT_RESET_TIMEOUT
+        # Re-derive the timeout every few samples rather than sorting per call
+        if len(self.latencies) >= LATENCY_MIN_SAMPLES and len(self.latencies) % 10 == 0:
+            p99 = self.percentile(0.99)
+            self._timeout = min(GATEWAY_TIMEOUT, max(GATEWAY_TIMEOUT_MIN, p99 * TIMEOUT_P99_MULTIPLIER))
+
+    def record_failure(self):
+        self.failures += 1
+        was_probe = self.state == "half_open"
+        self.probe_in_flight = False
+        if was_probe:
+            self.open_for = min(self.open_for * 2, CIRCUIT_RESET_TIMEOUT_MAX)
+        if was_probe or self.failures >= CIRCUIT_FAILURE_THRESHOLD:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """Give up a probe slot without a verdict (e.g. the caller was cancelled)."""
+        self.probe_in_flight = False
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "open_for": self.open_for,
+            "timeout": round(self._timeout, 3),
+            "p50": self.percentile(0.50),
+            "p99": self.percentile(0.99),
+            "samples": len(self.latencies),
+        }
 
-            detail=f"IBKR gateway connection error: {str(e)}"
 
+# Priority classes for gateway requests (lower runs first)
+PRIORITY_ORDER = 0
+PRIORITY_QUOTE = 1
+PRIORITY_PORTFOLIO = 2
+PRIORITY_HISTORY = 3
+
+# Global tokens each class must leave in the bucket, so background load
+# can't drain the budget order actions need
+PRIORITY_HEADROOM = {
+    PRIORITY_ORDER: 0,
+    PRIORITY_QUOTE: 1,
+    PRIORITY_PORTFOLIO: 2,
+    PRIORITY_HISTORY: 4,
+}
+
+# Per-endpoint pacing limits from the Client Portal API docs:
+# (path regex, requests per second, burst)
+PACING_RULES = [
+    (r"^iserver/marketdata/snapshot", 10.0, 10),
+    (r"^iserver/marketdata/history", 2.0, 5),   # docs: max 5 concurrent
+    (r"^iserver/account/orders$", 0.2, 1),      # 1 req / 5 s
+    (r"^iserver/trades", 0.2, 1),
+    (r"^iserver/account/pnl/partitioned", 0.2, 1),
+    (r"^iserver/scanner/run", 1.0, 1),
+    (r"^portfolio/accounts$", 0.2, 1),
+    (r"^portfolio/subaccounts", 0.2, 1),
+    (r"^tickle$", 1.0, 1),
+    (r"^sso/validate", 1 / 60, 1),
+]
+_pacing_rules = [(re.compile(pattern), rate, burst) for pattern, rate, burst in PACING_RULES]
+
+
+def request_priority(method: str, path: str) -> int:
+    """Classify a gateway call: orders > quotes > portfolio > history."""
+    p = path.split("?", 1)[0].strip("/")
+    if p.startswith("iserver/reply") or ("/order" in p and method != "GET"):
+        return PRIORITY_ORDER
+    if p.startswith("iserver/marketdata/snapshot") or p.startswith("iserver/secdef"):
+        return PRIORITY_QUOTE
+    if p.startswith("iserver/marketdata/history") or p.startswith("hmds"):
+        return PRIORITY_HISTORY
+    return PRIORITY_PORTFOLIO
+
+
+class TokenBucket:
+    """Refills at `rate` tokens per second up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float, need: float = 1.0) -> float:
+        """Seconds until `need` tokens are available (0 if available now)."""
+        blocked = max(0.0, self.blocked_until - now)
+        if self.tokens >= need:
+            return blocked
+        return max(blocked, (need - self.tokens) / self.rate)
+
+    def block(self, seconds: float):
+        """Pause this bucket, e.g. after the gateway answered 429."""
+        self.tokens = 0.0
+        self.blocked_until = time.monotonic() + seconds
+
+
+class PacingScheduler:
+    """
+    Central token-bucket scheduler for gateway calls.
+    A call needs a token from the global bucket (leaving its class's
+    headroom) and from its endpoint's bucket, if it has one. Waiting calls
+    are granted in priority order by a single dispatcher task.
+    With a SharedStore attached (multi-worker mode) the bucket state is kept
+    in the shared file and every check-and-take is one transaction, so the
+    workers share one budget and an idle worker's tokens stay usable.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.global_bucket = TokenBucket(rate, burst)
+        self.buckets: dict[str, TokenBucket] = {}
+        self.store: Optional["SharedStore"] = None
+        self._waiters: list = []  # sorted (priority, seq, bucket, future)
+        self._seq = 0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def bucket_for(self, path: str) -> Optional[TokenBucket]:
+        p = path.split("?", 1)[0].strip("/")
+        for pattern, rate, burst in _pacing_rules:
+            if pattern.search(p):
+                bucket = self.buckets.get(pattern.pattern)
+                if bucket is None:
+                    bucket = self.buckets[pattern.pattern] = TokenBucket(rate, burst)
+                return bucket
+        return None
+
+    def named(self, bucket: Optional[TokenBucket]) -> dict[str, TokenBucket]:
+        named = {"global": self.global_bucket}
+        if bucket is not None:
+            named[next(name for name, b in self.buckets.items() if b is bucket)] = bucket
+        return named
+
+    def _wait_time(self, priority: int, bucket: Optional[TokenBucket], now: float) -> float:
+        self.global_bucket.refill(now)
+        need = min(1.0 + PRIORITY_HEADROOM[priority], self.global_bucket.capacity)
+        wait = self.global_bucket.wait_time(now, need)
+        if bucket is not None:
+            bucket.refill(now)
+            wait = max(wait, bucket.wait_time(now))
+        return wait
+
+    def _take(self, bucket: Optional[TokenBucket]):
+        self.global_bucket.tokens -= 1.0
+        if bucket is not None:
+            bucket.tokens -= 1.0
+
+    def _try_take(self, priority: int, bucket: Optional[TokenBucket], now: float) -> float:
+        """Take the call's tokens if available; else seconds until they may be."""
+        if self.store is None:
+            wait = self._wait_time(priority, bucket, now)
+            if wait == 0:
+                self._take(bucket)
+            return wait
+        named = self.named(bucket)
+        with self.store.pacing(named):
+            wait = self._wait_time(priority, bucket, now)
+            if wait == 0:
+                self._take(bucket)
+        return wait
+
+    def block(self, bucket: TokenBucket, seconds: float):
+        """Pause a bucket after a 429 (for every worker in multi-worker mode)."""
+        if self.store is None:
+            bucket.block(seconds)
+            return
+        with self.store.pacing(self.named(None if bucket is self.global_bucket else bucket)):
+            bucket.block(seconds)
+
+    def would_wait(self, path: str, priority: int) -> bool:
+        bucket = self.bucket_for(path)
+        if self.store is not None:
+            self.store.load_pacing(self.named(bucket))
+        return bool(self._waiters) or self._wait_time(priority, bucket, time.monotonic()) > 0
+
+    async def acquire(self, path: str, priority: int):
+        """Wait until the call may be sent to the gateway."""
+        bucket = self.bucket_for(path)
+        if not self._waiters and self._try_take(priority, bucket, time.monotonic()) == 0:
+            return
+
+        fut = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        bisect.insort(self._waiters, (priority, self._seq, bucket, fut), key=lambda w: (w[0], w[1]))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._dispatch_loop())
+        self._wakeup.set()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            self._waiters = [w for w in self._waiters if w[3] is not fut]
+            raise
+
+    def _dispatch(self) -> Optional[float]:
+        """Grant every waiter that can run now; return seconds until the next one can."""
+        now = time.monotonic()
+        next_wait = None
+        remaining = []
+        for waiter in self._waiters:
+            priority, _, bucket, fut = waiter
+            if fut.done():
+                continue
+            wait = self._try_take(priority, bucket, now)
+            if wait == 0:
+                fut.set_result(None)
+                continue
+            remaining.append(waiter)
+            next_wait = wait if next_wait is None else min(next_wait, wait)
+        self._waiters = remaining
+        return next_wait
+
+    async def _dispatch_loop(self):
+        while True:
+            self._wakeup.clear()
+            delay = self._dispatch()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def stop(self):
+        """Cancel the dispatcher task (shutdown)."""
+        if self._task is not None:
+            self._task.cancel()
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        if self.store is not None:
+            self.store.load_pacing({"global": self.global_bucket, **self.buckets})
+        for bucket in (self.global_bucket, *self.buckets.values()):
+            bucket.refill(now)
+        return {
+            "shared": self.store is not None,
+            "global_tokens": round(self.global_bucket.tokens, 2),
+            "waiting": len(self._waiters),
+            "endpoints": {
+                name: {
+                    "tokens": round(b.tokens, 2),
+                    "blocked_for": round(max(0.0, b.blocked_until - now), 2),
+                }
+                for name, b in self.buckets.items()
+            },
+        }
+
+
+_scheduler = PacingScheduler(GATEWAY_RATE_LIMIT, GATEWAY_RATE_BURST)
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+
+# Last successful GET response per path, served while a family's circuit is open
+_last_good: "OrderedDict[str, tuple[float, object]]" = OrderedDict()
+
+
+def get_breaker(path: str) -> CircuitBreaker:
+    family = endpoint_family(path)
+    breaker = _breakers.get(family)
+    if breaker is None:
+        breaker = _breakers[family] = CircuitBreaker(family)
+    return breaker
+
+
+def remember_last_good(path: str, data):
+    _last_good[path] = (time.monotonic(), data)
+    _last_good.move_to_end(path)
+    while len(_last_good) > LAST_GOOD_MAX_ENTRIES:
+        _last_good.popitem(last=False)
+
+
+def last_good(path: str):
+    """Return the cached response for path if it is recent enough, else None."""
+    entry = _last_good.get(path)
+    if entry is None or time.monotonic() - entry[0] > LAST_GOOD_MAX_AGE:
+        return None
+    return entry[1]
+
+
+class GatewayRecorder:
+    """
+    Appends gateway exchanges to a JSON-lines file, one object per call:
+    {"t": unix time, "method", "path", "request": json body or null,
+     "status", "elapsed": seconds, "content_type", "body": response text}
+    record() only queues the exchange; a writer thread encodes and
+    compresses it, so the event loop never blocks on the file.
+    """
+
+    def __init__(self, filename: str):
+        opener = gzip.open if filename.endswith(".gz") else open
+        self.file = opener(filename, "at", encoding="utf-8")
+        self.count = 0
+        self._queue: "queue.SimpleQueue[Optional[dict]]" = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._write_loop, name="gateway-recorder", daemon=True)
+        self._thread.start()
+
+    def record(self, method: str, path: str, request_json, resp: httpx.Response, elapsed: float):
+        self._queue.put({
+            "t": round(time.time(), 3),
+            "method": method,
+            "path": path,
+            "request": request_json,
+            "status": resp.status_code,
+            "elapsed": round(elapsed, 4),
+            "content_type": resp.headers.get("content-type"),
+            "body": resp.text,
+        })
+        self.count += 1
+
+    def _write_loop(self):
+        while True:
+            exchange = self._queue.get()
+            if exchange is None:
+                break
+            self.file.write(json.dumps(exchange, separators=(",", ":")) + "\n")
+        self.file.close()
+
+    def close(self):
+        """Write out everything queued so far and close the file."""
+        self._queue.put(None)
+        self._thread.join()
+
+
+def record_file_name(filename: str) -> str:
+    """GATEWAY_RECORD_FILE for this process: suffixed with the pid when several workers run."""
+    if int(os.environ.get("WEB_CONCURRENCY") or 1) <= 1:
+        return filename
+    stem, dot, ext = filename.partition(".jsonl")
+    return f"{stem}.{os.getpid()}{dot}{ext}" if dot else f"{filename}.{os.getpid()}"
+
+
+_recorder: Optional[GatewayRecorder] = (
+    GatewayRecorder(record_file_name(GATEWAY_RECORD_FILE)) if GATEWAY_RECORD_FILE else None
+)
+
+
+# How long a shared gateway GET response is served to other workers, by path.
+# Paths not listed (auth status, snapshots, history, writes) are never shared
+# here; snapshots are shared per conid by market_snapshots().
+SHARED_CACHE_RULES = [
+    (r"^iserver/secdef/search", 86400),
+    (r"^portfolio/accounts$", 60),
+    (r"^portfolio/[^/]+/(summary|positions|ledger)", 5),
+    (r"^iserver/account/orders", 2),
+]
+_shared_rules = [(re.compile(pattern), ttl) for pattern, ttl in SHARED_CACHE_RULES]
+
+
+def shared_ttl(path: str) -> Optional[float]:
+    for pattern, ttl in _shared_rules:
+        if pattern.search(path):
+            return ttl
+    return None
+
+
+class SharedStore:
+    """
+    Cross-process key/value cache in one SQLite file (WAL, so readers never
+    block the writer). Values are JSON; read_at marks keys that workers are
+    using so the poller knows what to keep fresh. The poller is whichever
+    worker holds the flock on FILE.leader; if it exits, another takes over.
+    Cache hits only note read_at in memory; shared_mark_loop writes them in
+    one transaction from a thread, off the event loop.
+    """
+
+    READ_MARK_INTERVAL = 5.0  # Throttle read_at updates to one per key per interval
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.conn = self.connect()
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, stored_at REAL NOT NULL, read_at REAL NOT NULL, value TEXT NOT NULL)"
+        )
+        # PacingScheduler token buckets shared by all workers (time.monotonic is host-wide)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS pacing ("
+            " name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, blocked_until REAL NOT NULL)"
+        )
+        self.leader_file = None
+        # key -> read time not yet written; flushed on its own connection
+        self.pending_reads: dict[str, float] = {}
+        self.mark_conn: Optional[sqlite3.Connection] = None
+
+    def connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.filename, timeout=5.0, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        return conn
+
+    def get(self, key: str, max_age: float):
+        """Return the value if stored within max_age seconds, else None."""
+        row = self.conn.execute("SELECT stored_at, read_at, value FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        stored_at, read_at, value = row
+        now = time.time()
+        if now - read_at > self.READ_MARK_INTERVAL:
+            self.pending_reads[key] = now
+        return json.loads(value) if now - stored_at <= max_age else None
+
+    def flush_reads(self, pending: dict[str, float]):
+        """Write read_at marks taken from pending_reads (called in a thread)."""
+        if self.mark_conn is None:
+            self.mark_conn = self.connect()
+        with self.mark_conn:
+            self.mark_conn.execute("BEGIN")
+            self.mark_conn.executemany(
+                "UPDATE entries SET read_at = ? WHERE key = ?", [(at, key) for key, at in pending.items()]
+            )
+
+    def put(self, key: str, value):
+        now = time.time()
+        self.conn.execute(
+            "INSERT INTO entries (key, stored_at, read_at, value) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT(key) DO UPDATE SET stored_at = excluded.stored_at, value = excluded.value",
+            (key, now, now, json.dumps(value, separators=(",", ":"), default=str)),
         )
 
-    if resp.status_code >= 400:
+    def load_pacing(self, buckets: dict[str, "TokenBucket"]):
+        """Copy the shared state of `buckets` (by name) into them; unknown names keep theirs."""
+        rows = self.conn.execute(
+            f"SELECT name, tokens, updated, blocked_until FROM pacing WHERE name IN ({', '.join('?' * len(buckets))})",
+            tuple(buckets),
+        ).fetchall()
+        for name, tokens, updated, blocked_until in rows:
+            bucket = buckets[name]
+            bucket.tokens, bucket.updated, bucket.blocked_until = tokens, updated, blocked_until
+
+    @contextlib.contextmanager
+    def pacing(self, buckets: dict[str, "TokenBucket"]):
+        """Load `buckets`, let the caller update them and write them back, in one write transaction."""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.load_pacing(buckets)
+            yield
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO pacing (name, tokens, updated, blocked_until) VALUES (?, ?, ?, ?)",
+                [(name, b.tokens, b.updated, b.blocked_until) for name, b in buckets.items()],
+            )
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def hot(self, prefix: str) -> list[tuple[str, float]]:
+        """(key, stored_at) for keys under prefix read within SHARED_HOT_WINDOW."""
+        return self.conn.execute(
+            "SELECT key, stored_at FROM entries WHERE key >= ? AND key < ? AND read_at > ?",
+            (prefix, prefix + "\uffff", time.time() - SHARED_HOT_WINDOW),
+        ).fetchall()
+
+    def delete_prefix(self, prefix: str):
+        self.conn.execute("DELETE FROM entries WHERE key >= ? AND key < ?", (prefix, prefix + "\uffff"))
+
+    def try_lead(self) -> bool:
+        """Take the poller role if no other worker holds it (non-blocking)."""
+        if self.leader_file is not None:
+            return True
+        f = open(self.filename + ".leader", "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self.leader_file = f
+        return True
+
+    @property
+    def is_leader(self) -> bool:
+        return self.leader_file is not None
+
 
+_shared: Optional[SharedStore] = SharedStore(SHARED_CACHE_FILE) if SHARED_CACHE_FILE else None
+_scheduler.store = _shared
+
+
+async def shared_mark_loop():
+    """Every worker: flush its batched read_at marks once per SHARED_MARK_INTERVAL."""
+    while True:
+        await asyncio.sleep(SHARED_MARK_INTERVAL)
+        if _shared.pending_reads:
+            # Swapped here on the loop, so get() never touches the dict being written
+            pending, _shared.pending_reads = _shared.pending_reads, {}
+            try:
+                await asyncio.to_thread(_shared.flush_reads, pending)
+            except Exception as e:
+                print(f"Warning: shared read marks not written: {e}")
+
+
+async def send_gateway_request(
+    method: str,
+    path: str,
+    json: Optional[dict] = None,
+    fallback: bool = False,
+    priority: Optional[int] = None,
+    use_shared: bool = True,
+):
+    """
+    Send one request to the IBKR Client Portal Gateway /v1/api/{path}
+    through the pacing scheduler and the endpoint family's circuit breaker.
+    - Waits for a pacing token; priority defaults to request_priority()
+    - Sends the Session API's cookie header; a 401 refetches it and, if it
+      changed, retries once
+    - In multi-worker mode, GETs listed in SHARED_CACHE_RULES are answered
+      from the shared cache while fresh (use_shared=False forces a call)
+      and successful ones are written back to it
+    - Connection errors, timeouts and 5xx count as failures; other
+      responses (including 401) mean the gateway is alive
+    - With fallback=True, failures and open circuits return the last good
+      response for this path when one is available, and so does a call
+      that would otherwise have to wait for its pacing budget
+    - Raises HTTPException on non-2xx responses, 502 on connection errors
+      and 503 when the circuit is open
+    """
+    url = f"{IB_GATEWAY_URL.rstrip('/')}/{path.lstrip('/')}"
+    breaker = get_breaker(path)
+    family = breaker.family or "/"
+    if priority is None:
+        priority = request_priority(method, path)
+
+    ttl = shared_ttl(path) if _shared is not None and method == "GET" else None
+    if ttl is not None and use_shared:
+        cached = _shared.get(f"gw:{path}", ttl)
+        if cached is not None:
+            return cached
+
+    if fallback and _scheduler.would_wait(path, priority):
+        cached = last_good(path)
+        if cached is not None:
+            GATEWAY_FALLBACKS.inc(family, "pacing")
+            return cached
+
+    if not breaker.allow():
+        cached = last_good(path) if fallback else None
+        if cached is not None:
+            GATEWAY_FALLBACKS.inc(family, "circuit_open")
+            return cached
         raise HTTPException(
+            status_code=503,
+            detail=f"IBKR gateway circuit open for {breaker.family or '/'}"
+        )
 
-            status_code=resp.status_code,
+    waited = time.perf_counter()
+    try:
+        await _scheduler.acquire(path, priority)
+    except BaseException:
+        breaker.release()
+        raise
+
+    started = time.perf_counter()
+    GATEWAY_PACING_WAIT.observe(started - waited, family)
+    cookie_version = _session_cookies["version"]
+    try:
+        resp = await get_gateway_client().request(method, url, json=json, timeout=breaker.timeout())
+        if resp.status_code == 401 and await refresh_session_cookies(cookie_version):
+            # Session API has newer cookies (e.g. IBeam logged in again): retry once
+            GATEWAY_REQUESTS.observe(time.perf_counter() - started, family, method, "401")
+            await _scheduler.acquire(path, priority)
+            started = time.perf_counter()
+            resp = await get_gateway_client().request(method, url, json=json, timeout=breaker.timeout())
+    except httpx.RequestError as e:
+        breaker.record_failure()
+        GATEWAY_REQUESTS.observe(time.perf_counter() - started, family, method, "error")
+        cached = last_good(path) if fallback else None
+        if cached is not None:
+            GATEWAY_FALLBACKS.inc(family, "error")
+            return cached
+        raise HTTPException(
+            status_code=502,
+            detail=f"IBKR gateway connection error: {str(e)}"
+        )
+    except BaseException:
+        breaker.release()
+        raise
+
+    elapsed = time.perf_counter() - started
+    GATEWAY_REQUESTS.observe(elapsed, family, method, str(resp.status_code))
+    if _recorder is not None:
+        _recorder.record(method, path, json, resp, elapsed)
+
+    if resp.status_code >= 500:
+        breaker.record_failure()
+        cached = last_good(path) if fallback else None
+        if cached is not None:
+            GATEWAY_FALLBACKS.inc(family, "error")
+            return cached
+    else:
+        breaker.record_success(elapsed)
 
-            detail=f"IBKR gateway error {resp.status_code}: {resp.text}"
+    if resp.status_code == 429:
+        # Paced anyway (e.g. another client on the same session): back off
+        _scheduler.block(_scheduler.bucket_for(path) or _scheduler.global_bucket, PACING_BACKOFF)
+        cached = last_good(path) if fallback else None
+        if cached is not None:
+            GATEWAY_FALLBACKS.inc(family, "pacing")
+            return cached
 
+    if resp.status_code >= 400:
+        raise HTTPException(
+            status_code=resp.status_code,
+            detail=f"IBKR gateway error {resp.status_code}: {resp.text}"
         )
 
-    return resp.json()
+    data = resp.json() if resp.content else {}
+    if fallback:
+        remember_last_good(path, data)
+    if ttl is not None:
+        _shared.put(f"gw:{path}", data)
+    return data
+
+
+# Identical GETs in flight: (path, fallback, use_shared, priority) -> [task, waiter count]
+_gateway_inflight: dict[tuple, list] = {}
+
+
+async def ib_request(
+    method: str,
+    path: str,
+    json: Optional[dict] = None,
+    fallback: bool = False,
+    priority: Optional[int] = None,
+    use_shared: bool = True,
+):
+    """
+    send_gateway_request() with single-flight GETs: concurrent identical
+    GETs at the same priority share one upstream call (keyed on priority
+    so a joined call never waits at a lower caller's priority). Joining
+    callers get their own copy of the response. A cancelled caller only
+    stops waiting; the call itself is cancelled once no caller is left
+    waiting for it.
+    """
+    if method != "GET":
+        return await send_gateway_request(method, path, json, fallback, priority, use_shared)
+
+    if priority is None:
+        priority = request_priority(method, path)
+    key = (path, fallback, use_shared, priority)
+    entry = _gateway_inflight.get(key)
+    joined = entry is not None
+    if entry is None:
+        task = asyncio.ensure_future(send_gateway_request(method, path, json, fallback, priority, use_shared))
+        entry = _gateway_inflight[key] = [task, 0]
+
+        def forget(_):
+            if _gateway_inflight.get(key) is entry:
+                del _gateway_inflight[key]
+
+        task.add_done_callback(forget)
+    else:
+        GATEWAY_COALESCED.inc(endpoint_family(path) or "/")
+
+    entry[1] += 1
+    try:
+        data = await asyncio.shield(entry[0])
+        return copy.deepcopy(data) if joined else data
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0 and not entry[0].done():
+            # Every caller gave up; new callers must not join a cancelled call
+            if _gateway_inflight.get(key) is entry:
+                del _gateway_inflight[key]
+            entry[0].cancel()
+
+
+async def ib_get(
+    path: str, fallback: bool = True, priority: Optional[int] = None, use_shared: bool = True
+) -> dict:
+    """
+    Call IBKR Client Portal Gateway GET /v1/api/{path}
+    - Verify=False because IBKR uses a self-signed cert by default
+    - Raises HTTPException on non-2xx responses
+    - Serves the last good response while the gateway is failing or the
+      endpoint is out of pacing budget (pass fallback=False where a stale
+      answer would be wrong)
+    """
+    return await ib_request("GET", path, fallback=fallback, priority=priority, use_shared=use_shared)
+
+
+async def ib_post(path: str, json: Optional[dict] = None, priority: Optional[int] = None) -> dict:
+    """
+    Call IBKR Client Portal Gateway POST /v1/api/{path}
+    - Same error handling as ib_get, never served from cache
+    """
+    return await ib_request("POST", path, json=json, priority=priority)
+
+
+def is_authenticated(auth_status: dict) -> bool:
+    """
+    Read the authenticated flag from an /iserver/auth/status or /tickle payload.
+    /tickle nests it under iserver.authStatus.
+    """
+    if not isinstance(auth_status, dict):
+        return False
+    return auth_status.get("authenticated") == True or \
+        auth_status.get("iserver", {}).get("authStatus", {}).get("authenticated") == True
 
 
 def summary_metric(summary: dict, key: str, default: float = 0.0) -> float:
@@ -384,259 +1483,1219 @@ class Trade(BaseModel):
 
 
 
-# -------------------------------------------------
+class ScanRule(BaseModel):
 
-# UTILITY ROUTES
+    kind: str                    # see SCAN_RULE_KINDS
 
-# -------------------------------------------------
+    value: float                 # price level, percent, or volume multiple
 
+    symbols: Optional[List[str]] = None   # default: the whole watchlist
 
+    name: Optional[str] = None
 
-@app.get("/health")
 
-async def health(x_bridge_key: str = Header(None)):
 
-    verify_key(x_bridge_key)
 
-    return {"ok": True, "service": "ibkr-bridge", "status": "running"}
 
+class ScannerRequest(BaseModel):
 
+    watchlist: List[str]
 
+    rules: List[ScanRule]
 
 
-@app.get("/ping")
 
-async def ping(x_bridge_key: str = Header(None)):
 
-    verify_key(x_bridge_key)
 
-    return {"ok": True, "pong": True, "ts": datetime.utcnow()}
+class AlertRequest(BaseModel):
 
+    symbol: str
 
-@app.get("/gateway/auth-status")
-async def gateway_auth_status(x_bridge_key: str = Header(None)):
-    """
-    Check Gateway authentication status by calling /iserver/auth/status.
-    Used by the frontend to detect when user has completed manual login.
-    """
-    verify_key(x_bridge_key)
-    
-    try:
-        auth_status = await ib_get("iserver/auth/status")
-        authenticated = auth_status.get("authenticated") == True or \
-                       auth_status.get("iserver", {}).get("authStatus", {}).get("authenticated") == True
-        
-        return {
-            "ok": True,
-            "authenticated": authenticated,
-            "status": auth_status,
-        }
-    except HTTPException as e:
-        # Gateway not reachable or returned error
-        return {
-            "ok": False,
-            "authenticated": False,
-            "error": f"Gateway check failed: {e.detail}",
-        }
-    except Exception as e:
-        return {
-            "ok": False,
-            "authenticated": False,
-            "error": f"Unexpected error: {str(e)}",
-        }
+    condition: str               # "above" | "below"
 
+    price: float
 
+    note: Optional[str] = None
 
+    repeat: bool = False         # fire on every cross instead of once
 
 
-# -------------------------------------------------
 
-# MARKET DATA
 
-# -------------------------------------------------
 
+class BacktestRequest(BaseModel):
 
+    strategy: str                # see BACKTEST_STRATEGIES
 
-@app.get("/price", response_model=PriceSnapshot)
+    symbol: Optional[str] = None
 
-async def get_price(
+    tf: str = "1d"
 
-    symbol: str = Query(..., description="Symbol, e.g. AAPL or BTC-USD"),
+    bars: int = 1000             # most recent bars from the bar store
 
-    x_bridge_key: str = Header(None),
+    candles: Optional[List[Candle]] = None   # backtest these instead of stored bars
 
-):
+    params: Optional[List[dict]] = None      # explicit parameter sets
 
-    verify_key(x_bridge_key)
+    param_grid: Optional[dict] = None        # {"fast": [5, 10], "slow": [20, 50]} -> every combination
 
+    starting_cash: float = 100000.0
 
+    fee_per_share: float = 0.005
 
-    # TODO: replace with real IBKR market data call
+    sort_by: str = "return"      # return | sharpe | max_drawdown | final_equity
 
-    now = datetime.utcnow()
+    points: int = 500            # equity curve points returned per run
 
-    return PriceSnapshot(
 
-        symbol=symbol,
 
-        last=123.45,
 
-        bid=123.40,
 
-        ask=123.50,
+# -------------------------------------------------
+# RESPONSE CACHE
+# -------------------------------------------------
 
-        timestamp=now,
+class CachedResponse:
+    def __init__(self, body: bytes):
+        self.body = body
+        self.stored_at = time.monotonic()
+        self.refreshing: Optional[asyncio.Task] = None
 
-    )
 
+# LRU of encoded responses keyed by (route, query params)
+_response_cache: "OrderedDict[tuple, CachedResponse]" = OrderedDict()
+# Misses currently being computed, so concurrent callers share one computation
+_response_inflight: dict[tuple, asyncio.Future] = {}
 
 
+def invalidate_response_cache():
+    """Drop every cached route response (e.g. after logout)."""
+    _response_cache.clear()
+    if _shared is not None:
+        # Account data from the old session; conid lookups stay valid
+        _shared.delete_prefix("gw:portfolio")
+        _shared.delete_prefix("gw:iserver/account")
 
 
-@app.post("/quotes")
+def store_response(key: tuple, body: bytes):
+    _response_cache[key] = CachedResponse(body)
+    _response_cache.move_to_end(key)
+    while len(_response_cache) > RESPONSE_CACHE_MAX_ENTRIES:
+        _response_cache.popitem(last=False)
 
-async def get_quotes(
 
-    req: QuoteRequest,
+def cached_json_response(body: bytes, status: str, age: float, ttl: float, stale: float) -> Response:
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers={
+            "Cache-Control": f"private, max-age={int(ttl)}, stale-while-revalidate={int(stale)}",
+            "Age": str(int(age)),
+            "X-Cache": status,
+        },
+    )
 
-    x_bridge_key: str = Header(None),
 
-):
+def cached_route(ttl: float, stale: float):
+    """
+    Stale-while-revalidate cache for read-only GET routes.
+    - Fresh for `ttl` seconds (X-Cache: HIT)
+    - Then served stale for up to `stale` more seconds while one
+      background call refreshes it (X-Cache: STALE)
+    - Otherwise computed inline (X-Cache: MISS); errors are not cached
+    Keys are the route name plus its query parameters. The bridge key is
+    checked before anything is served from cache.
+    """
+    def decorator(func):
+        async def compute(key: tuple, kwargs: dict) -> bytes:
+            result = await func(**kwargs)
+            body = json.dumps(jsonable_encoder(result)).encode()
+            store_response(key, body)
+            return body
+
+        async def refresh(key: tuple, kwargs: dict):
+            try:
+                await compute(key, kwargs)
+            except Exception as e:
+                print(f"Warning: background refresh of {func.__name__} failed: {e}")
 
-    verify_key(x_bridge_key)
+        @functools.wraps(func)
+        async def wrapper(**kwargs):
+            verify_key(kwargs.get("x_bridge_key"))
+            key = (func.__name__,) + tuple(
+                sorted((k, v) for k, v in kwargs.items() if k != "x_bridge_key")
+            )
 
+            entry = _response_cache.get(key)
+            if entry is not None:
+                age = time.monotonic() - entry.stored_at
+                if age < ttl:
+                    _response_cache.move_to_end(key)
+                    CACHE_RESULTS.inc(func.__name__, "hit")
+                    return cached_json_response(entry.body, "HIT", age, ttl, stale)
+                if age < ttl + stale:
+                    _response_cache.move_to_end(key)
+                    if entry.refreshing is None or entry.refreshing.done():
+                        entry.refreshing = asyncio.create_task(refresh(key, kwargs))
+                    CACHE_RESULTS.inc(func.__name__, "stale")
+                    return cached_json_response(entry.body, "STALE", age, ttl, stale)
 
+            CACHE_RESULTS.inc(func.__name__, "miss")
+            inflight = _response_inflight.get(key)
+            if inflight is None:
+                inflight = asyncio.ensure_future(compute(key, kwargs))
+                _response_inflight[key] = inflight
+                inflight.add_done_callback(lambda _: _response_inflight.pop(key, None))
+            # shield: a disconnecting caller must not cancel the shared computation
+            body = await asyncio.shield(inflight)
+            return cached_json_response(body, "MISS", 0, ttl, stale)
 
-    # TODO: real multi-symbol snapshot
+        return wrapper
 
-    now = datetime.utcnow()
+    return decorator
 
-    quotes = [
 
-        PriceSnapshot(
 
-            symbol=sym,
 
-            last=100.0 + i,
 
-            bid=99.5 + i,
+# -------------------------------------------------
+# MARKET DATA HELPERS
+# -------------------------------------------------
 
-            ask=100.5 + i,
+# Snapshot field ids: 31 = last, 84 = bid, 86 = ask
+SNAPSHOT_FIELDS = "31,84,86"
 
-            timestamp=now,
+# Contract ids never change, so symbol -> conid lookups are kept for the process lifetime
+_conid_cache: dict[str, int] = {}
 
-        )
 
-        for i, sym in enumerate(req.symbols)
+async def resolve_conid(symbol: str) -> int:
+    """Look up the IBKR contract id for a symbol via /iserver/secdef/search."""
+    key = symbol.strip().upper()
+    conid = _conid_cache.get(key)
+    if conid is not None:
+        return conid
 
-    ]
+    results = await ib_get(f"iserver/secdef/search?symbol={quote(key)}")
+    if not isinstance(results, list) or not results or not results[0].get("conid"):
+        raise HTTPException(status_code=404, detail=f"No IBKR contract found for {symbol}")
 
+    conid = int(results[0]["conid"])
+    _conid_cache[key] = conid
+    return conid
 
 
-    return {"ok": True, "data": quotes}
+def snapshot_price(row: dict, field: str) -> Optional[float]:
+    """
+    Parse a snapshot price field. IBKR sends strings and may prefix them
+    with "C" (previous close) or "H" (halted).
+    """
+    value = row.get(field)
+    if value is None:
+        return None
+    try:
+        return float(str(value).lstrip("CH").replace(",", ""))
+    except ValueError:
+        return None
 
 
+async def market_snapshots(conids: List[int], use_shared: bool = True) -> dict[int, dict]:
+    """
+    Fetch /iserver/marketdata/snapshot for several conids in one call.
+    The first request for a conid only starts the subscription and comes
+    back without prices, so conids missing a last price are asked once more.
+    In multi-worker mode rows are shared per conid for SNAPSHOT_SHARED_TTL.
+    """
+    shared_rows = {}
+    if _shared is not None and use_shared:
+        for conid in conids:
+            row = _shared.get(f"snapshot:{conid}", SNAPSHOT_SHARED_TTL)
+            if row is not None:
+                shared_rows[conid] = row
+        conids = [c for c in conids if c not in shared_rows]
+    if not conids:
+        return shared_rows
+
+    async def fetch(ids: List[int]) -> dict[int, dict]:
+        rows = await ib_get(
+            f"iserver/marketdata/snapshot?conids={','.join(str(c) for c in ids)}&fields={SNAPSHOT_FIELDS}",
+            fallback=False,
+        )
+        return {
+            int(row["conid"]): row
+            for row in (rows if isinstance(rows, list) else [])
+            if row.get("conid") is not None
+        }
 
+    rows = await fetch(conids)
+    missing = [c for c in conids if snapshot_price(rows.get(c, {}), "31") is None]
+    if missing:
+        rows.update(await fetch(missing))
 
+    if _shared is not None:
+        for conid, row in rows.items():
+            if snapshot_price(row, "31") is not None:
+                _shared.put(f"snapshot:{conid}", row)
+    rows.update(shared_rows)
+    return rows
 
-@app.get("/orderbook")
 
-async def get_orderbook(
+def snapshot_to_price(symbol: str, row: dict, now: datetime) -> Optional[PriceSnapshot]:
+    """Build a PriceSnapshot, using the bid/ask mid when there is no last trade."""
+    last = snapshot_price(row, "31")
+    bid = snapshot_price(row, "84")
+    ask = snapshot_price(row, "86")
+    if last is None and bid is not None and ask is not None:
+        last = (bid + ask) / 2
+    if last is None:
+        return None
+    return PriceSnapshot(symbol=symbol, last=last, bid=bid, ask=ask, timestamp=now)
 
-    symbol: str = Query(...),
 
-    depth: int = Query(25, ge=1, le=100),
+def parse_timeframe(tf: str) -> tuple[int, str]:
+    """'5m' -> (5, 'm'), '1h' -> (1, 'h'); units are m, h, d, w"""
+    m = re.fullmatch(r"(\d+)([mhdw])", tf.strip().lower())
+    if not m:
+        raise HTTPException(status_code=400, detail=f"Unsupported timeframe: {tf}")
+    return int(m.group(1)), m.group(2)
 
-    x_bridge_key: str = Header(None),
 
-):
+def timeframe_minutes(tf: str) -> int:
+    """'5m' -> 5, '1h' -> 60, '1d' -> 1440, '1w' -> 10080"""
+    n, unit = parse_timeframe(tf)
+    return n * {"m": 1, "h": 60, "d": 1440, "w": 10080}[unit]
 
-    verify_key(x_bridge_key)
 
+def history_bar_size(tf: str) -> str:
+    """Map our timeframe to an IBKR bar size: '5m' -> '5min', '1h' -> '1h'."""
+    n, unit = parse_timeframe(tf)
+    return f"{n}min" if unit == "m" else f"{n}{unit}"
 
 
-    # TODO: replace with real order book
+def history_period(tf: str, bars: int) -> str:
+    """
+    IBKR history period that covers `bars` bars of timeframe `tf`.
+    Intraday bars are counted against a 390 minute session, daily and
+    weekly bars against a 5 day week.
+    """
+    minutes = timeframe_minutes(tf)
+    if minutes < 1440:
+        days = math.ceil(bars * minutes / 390)
+    else:
+        days = math.ceil(bars * (minutes / 1440) * 7 / 5)
+    if days <= 1000:
+        return f"{max(days, 1)}d"
+    return f"{math.ceil(days / 365)}y"
 
-    mid = 100.0
 
-    bids = [
+async def price_history(symbol: str, tf: str, bars: int) -> List[Candle]:
+    """Fetch the last `bars` candles for symbol from /iserver/marketdata/history."""
+    conid = await resolve_conid(symbol)
+    candles: List[Candle] = []
+    for b in await fetch_history_bars(conid, tf, bars):
+        try:
+            candles.append(
+                Candle(
+                    ts=datetime.utcfromtimestamp(b["t"] / 1000),
+                    open=float(b["o"]),
+                    high=float(b["h"]),
+                    low=float(b["l"]),
+                    close=float(b["c"]),
+                    volume=float(b.get("v") or 0.0),
+                )
+            )
+        except (KeyError, TypeError, ValueError):
+            continue
+    return candles[-bars:]
 
-        OrderBookLevel(price=mid - 0.1 * i, size=0.5 + i * 0.1)
 
-        for i in range(depth)
 
-    ]
 
-    asks = [
 
-        OrderBookLevel(price=mid + 0.1 * i, size=0.4 + i * 0.1)
+# -------------------------------------------------
+# BAR STORE
+# -------------------------------------------------
 
-        for i in range(depth)
+# History bars per (conid, timeframe), persisted in SQLite and held in memory
+# as NumPy columns. Every history fetch is merged in, so /history/indicators
+# only asks the gateway for bars newer than the last one stored.
 
-    ]
+BAR_COLUMNS = ("ts", "open", "high", "low", "close", "volume")
 
 
+class BarSeries:
+    """
+    Bars for one (conid, timeframe), oldest first. `revision` bumps on every
+    merge that changes something and `changes` remembers the first index each
+    revision touched, so indicators can recompute from there instead of from 0.
+    """
 
-    return {"ok": True, "symbol": symbol, "bids": bids, "asks": asks}
+    def __init__(self, rows: Optional[list] = None):
+        data = np.array(rows or [], dtype=float).reshape(-1, len(BAR_COLUMNS))
+        self.ts = data[:, 0].astype(np.int64)
+        self.open, self.high, self.low, self.close, self.volume = (data[:, i].copy() for i in range(1, 6))
+        self.revision = 0
+        self.changes: deque = deque(maxlen=64)
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    def changed_since(self, revision: int) -> int:
+        """First bar index changed after `revision` (0 if that is no longer known)."""
+        if revision == self.revision:
+            return len(self)
+        if not self.changes or self.changes[0][0] > revision + 1:
+            return 0
+        return min(index for rev, index in self.changes if rev > revision)
+
+    def merge(self, rows: np.ndarray) -> int:
+        """
+        Merge (n, 6) rows sorted by ts; incoming bars replace stored bars with
+        the same ts (the last bar is still forming). Returns the first changed
+        index, or len(self) if nothing changed.
+        """
+        if not len(rows):
+            return len(self)
+        first = int(np.searchsorted(self.ts, rows[0, 0]))
+        old = np.column_stack([self.ts[first:], self.open[first:], self.high[first:],
+                               self.low[first:], self.close[first:], self.volume[first:]])
+        keep = old[~np.isin(old[:, 0], rows[:, 0])]
+        tail = np.concatenate([keep, rows])
+        tail = tail[np.argsort(tail[:, 0], kind="stable")]
+
+        common = min(len(old), len(tail))
+        mismatch = np.flatnonzero(np.any(old[:common] != tail[:common], axis=1))
+        if len(mismatch):
+            changed = first + int(mismatch[0])
+        elif len(tail) != len(old):
+            changed = first + common
+        else:
+            return len(self)
+
+        self.ts = np.concatenate([self.ts[:first], tail[:, 0].astype(np.int64)])
+        for i, name in enumerate(BAR_COLUMNS[1:], start=1):
+            setattr(self, name, np.concatenate([getattr(self, name)[:first], tail[:, i]]))
+        self.revision += 1
+        self.changes.append((self.revision, changed))
+        return changed
+
+
+class BarStore:
+    def __init__(self, filename: str):
+        self.conn = sqlite3.connect(filename, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS bars ("
+            " conid INTEGER NOT NULL, tf TEXT NOT NULL, ts INTEGER NOT NULL,"
+            " open REAL NOT NULL, high REAL NOT NULL, low REAL NOT NULL, close REAL NOT NULL, volume REAL NOT NULL,"
+            " PRIMARY KEY (conid, tf, ts)) WITHOUT ROWID"
+        )
+        self.series: dict[tuple[int, str], BarSeries] = {}
+
+    def get(self, conid: int, tf: str) -> BarSeries:
+        key = (conid, tf)
+        series = self.series.get(key)
+        if series is None:
+            rows = self.conn.execute(
+                "SELECT ts, open, high, low, close, volume FROM bars WHERE conid = ? AND tf = ? ORDER BY ts",
+                key,
+            ).fetchall()
+            series = self.series[key] = BarSeries(rows)
+        return series
+
+    def merge(self, conid: int, tf: str, raw_bars: list) -> BarSeries:
+        """Merge gateway history bars ({"t" ms, "o", "h", "l", "c", "v"}) and persist the changed ones."""
+        rows = []
+        for b in raw_bars:
+            try:
+                rows.append((int(b["t"]) // 1000, float(b["o"]), float(b["h"]), float(b["l"]),
+                             float(b["c"]), float(b.get("v") or 0.0)))
+            except (KeyError, TypeError, ValueError):
+                continue
+        rows.sort()
 
+        series = self.get(conid, tf)
+        changed = series.merge(np.array(rows, dtype=float).reshape(-1, len(BAR_COLUMNS)))
+        if changed < len(series):
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO bars VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (conid, tf, int(series.ts[i]), float(series.open[i]), float(series.high[i]),
+                     float(series.low[i]), float(series.close[i]), float(series.volume[i]))
+                    for i in range(changed, len(series))
+                ],
+            )
+        return series
 
 
+_bar_store: Optional[BarStore] = None
 
 
-@app.get("/history/price")
+def get_bar_store() -> BarStore:
+    global _bar_store
+    if _bar_store is None:
+        _bar_store = BarStore(BARS_DB_FILE)
+    return _bar_store
 
-async def get_price_history(
 
-    symbol: str = Query(...),
+async def fetch_history_bars(conid: int, tf: str, bars: int) -> list:
+    """Raw /iserver/marketdata/history bars covering the last `bars` bars, merged into the bar store."""
+    raw = await ib_get(
+        f"iserver/marketdata/history?conid={conid}&bar={history_bar_size(tf)}"
+        f"&period={history_period(tf, bars)}&outsideRth=false"
+    )
+    data = (raw.get("data") if isinstance(raw, dict) else None) or []
+    get_bar_store().merge(conid, tf, data)
+    return data
 
-    tf: str = Query("1h", description="Timeframe, e.g. 1m, 5m, 1h, 1d"),
 
-    bars: int = Query(200, ge=1, le=5000),
 
-    x_bridge_key: str = Header(None),
 
-):
 
-    verify_key(x_bridge_key)
+# -------------------------------------------------
+# QUOTE FEED
+# -------------------------------------------------
 
+# One poller for every in-process quote consumer (scanners, ...). Watched
+# conids are swept in batched snapshot calls and each conid whose quote
+# changed is published as a Tick to the callbacks watching it, so consumers
+# work per tick instead of each polling /quotes for all of their symbols.
+
+# Snapshot field ids: 31 = last, 84 = bid, 86 = ask, 7762 = day volume, 7741 = prior close
+QUOTE_FEED_FIELDS = "31,84,86,7762,7741"
+
+
+class Tick:
+    __slots__ = ("conid", "last", "bid", "ask", "volume", "prior_close", "ts")
+
+    def __init__(self, conid: int, last: float, bid: Optional[float] = None, ask: Optional[float] = None,
+                 volume: Optional[float] = None, prior_close: Optional[float] = None, ts: Optional[float] = None):
+        self.conid, self.last, self.bid, self.ask = conid, last, bid, ask
+        self.volume, self.prior_close = volume, prior_close
+        self.ts = ts if ts is not None else time.time()
+
+    def same_quote(self, other: "Tick") -> bool:
+        return (self.last, self.bid, self.ask, self.volume) == (other.last, other.bid, other.ask, other.volume)
+
+
+class QuoteFeed:
+    def __init__(self):
+        # conid -> {owner: callback(tick)}
+        self.subscribers: dict[int, dict[str, object]] = {}
+        self.latest: dict[int, Tick] = {}
+        # conid -> when its last owner left; its quote is kept until QUOTE_FEED_RETAIN
+        self.unwatched: dict[int, float] = {}
+        self.task: Optional[asyncio.Task] = None
+        self.sweeps = 0
+        self.ticks = 0
+        self.last_error: Optional[str] = None
+
+    def subscribe(self, owner: str, conids, callback):
+        """Call callback(tick) for every changed quote of `conids` (replaces owner's earlier subscription)."""
+        wanted = set(conids)
+        for conid in [c for c, owners in self.subscribers.items() if owner in owners and c not in wanted]:
+            self.unwatch(owner, conid)
+        for conid in wanted:
+            self.watch(owner, conid, callback)
+
+    def unsubscribe(self, owner: str):
+        for conid in [c for c, owners in self.subscribers.items() if owner in owners]:
+            self.unwatch(owner, conid)
+
+    def watch(self, owner: str, conid: int, callback):
+        """Add one conid to owner's subscription; quotes already seen are kept."""
+        self.subscribers.setdefault(conid, {})[owner] = callback
+        dropped_at = self.unwatched.pop(conid, None)
+        if dropped_at is not None and time.time() - dropped_at > QUOTE_FEED_RETAIN:
+            self.latest.pop(conid, None)
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def unwatch(self, owner: str, conid: int):
+        owners = self.subscribers.get(conid)
+        if owners is None or owners.pop(owner, None) is None or owners:
+            return
+        del self.subscribers[conid]
+        now = time.time()
+        self.unwatched[conid] = now
+        # Keep recently dropped quotes so a re-subscribe (next alert, next order) starts
+        # from the current price, and forget ones nothing has watched for a while
+        for stale in [c for c, at in self.unwatched.items() if now - at > QUOTE_FEED_RETAIN]:
+            del self.unwatched[stale]
+            self.latest.pop(stale, None)
+
+    def publish(self, tick: Tick) -> bool:
+        """Deliver a tick if the quote changed. Also the entry point for replayed or injected ticks."""
+        previous = self.latest.get(tick.conid)
+        if previous is not None and previous.same_quote(tick):
+            return False
+        self.latest[tick.conid] = tick
+        self.ticks += 1
+        for owner, callback in list(self.subscribers.get(tick.conid, {}).items()):
+            try:
+                callback(tick)
+            except Exception as e:
+                print(f"Warning: quote feed subscriber {owner} failed: {e}")
+        return True
+
+    async def sweep(self):
+        conids = sorted(self.subscribers)
+        batches = [conids[i:i + QUOTE_FEED_BATCH] for i in range(0, len(conids), QUOTE_FEED_BATCH)]
+        results = await asyncio.gather(*(
+            ib_get(
+                f"iserver/marketdata/snapshot?conids={','.join(str(c) for c in batch)}&fields={QUOTE_FEED_FIELDS}",
+                fallback=False,
+                use_shared=False,
+            )
+            for batch in batches
+        ), return_exceptions=True)
+
+        now = time.time()
+        for rows in results:
+            if isinstance(rows, Exception):
+                self.last_error = str(getattr(rows, "detail", rows))
+                continue
+            for row in rows if isinstance(rows, list) else []:
+                last = snapshot_price(row, "31")
+                if row.get("conid") is None or last is None:
+                    # First snapshot of a conid only starts the subscription
+                    continue
+                self.publish(Tick(
+                    int(row["conid"]), last,
+                    snapshot_price(row, "84"), snapshot_price(row, "86"),
+                    snapshot_price(row, "7762"), snapshot_price(row, "7741"), now,
+                ))
+        self.sweeps += 1
+
+    async def run(self):
+        while self.subscribers:
+            if not _session_health["authenticated"] and _session_health["state"] != "unknown":
+                await asyncio.sleep(AUTH_RECHECK_INTERVAL)
+                continue
+            try:
+                await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Warning: quote feed sweep failed: {e}")
+            await asyncio.sleep(QUOTE_FEED_INTERVAL)
+
+    def status(self) -> dict:
+        return {
+            "conids": len(self.subscribers),
+            "running": self.task is not None and not self.task.done(),
+            "sweeps": self.sweeps,
+            "ticks": self.ticks,
+            "last_error": self.last_error,
+        }
 
 
-    # TODO: replace with real historical data
+_quote_feed = QuoteFeed()
 
-    now = datetime.utcnow()
 
-    candles: List[Candle] = []
 
-    price = 100.0
 
-    for i in range(bars):
 
-        ts = now - timedelta(minutes=i)
+# -------------------------------------------------
 
-        c = Candle(
+# UTILITY ROUTES
 
-            ts=ts,
+# -------------------------------------------------
 
-            open=price,
 
-            high=price + 0.5,
 
-            low=price - 0.5,
+@app.get("/health")
+
+async def health(x_bridge_key: str = Header(None)):
+
+    verify_key(x_bridge_key)
+
+    return {"ok": True, "service": "ibkr-bridge", "status": "running"}
+
+
+
+
+
+@app.get("/ping")
 
-            close=price + 0.1,
+async def ping(x_bridge_key: str = Header(None)):
+
+    verify_key(x_bridge_key)
+
+    return {"ok": True, "pong": True, "ts": datetime.utcnow()}
+
+
+@app.get("/metrics")
+async def metrics(x_bridge_key: str = Header(None)):
+    """
+    Prometheus text-format metrics: route and gateway latency histograms,
+    gateway status codes, cache results, plus circuit and session state
+    read at scrape time.
+    """
+    verify_key(x_bridge_key)
+
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+
+    state = Gauge("bridge_gateway_circuit_open", "1 if the endpoint family's circuit is open", ("family",))
+    for family, breaker in _breakers.items():
+        state.set(family or "/", value=1 if breaker.state == "open" else 0)
+    lines.extend(state.render())
+
+    for name, help, value in (
+        ("bridge_gateway_authenticated", "1 if the last auth check was authenticated", int(_session_health["authenticated"])),
+        ("bridge_response_cache_entries", "Cached route responses", len(_response_cache)),
+        ("bridge_last_good_entries", "Last-good gateway responses kept", len(_last_good)),
+        ("bridge_session_cookie_version", "Bumps whenever the gateway cookie header changes", _session_cookies["version"]),
+    ):
+        lines.extend([f"# HELP {name} {help}", f"# TYPE {name} gauge", f"{name} {value}"])
+
+    return Response("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+
+# -------------------------------------------------
+# GATEWAY SESSION KEEPALIVE
+# -------------------------------------------------
+
+# Health of the gateway session, updated by the keepalive loop.
+# state: "unknown" | "authenticated" | "unauthenticated" | "unreachable"
+_session_health = {
+    "state": "unknown",
+    "authenticated": False,
+    "connected": False,
+    "competing": False,
+    "last_tickle_at": None,
+    "last_check_at": None,
+    "last_authenticated_at": None,
+    "consecutive_failures": 0,
+    "last_reauth_at": None,
+    "reauth_count": 0,
+    "last_error": None,
+}
+_keepalive_task: Optional[asyncio.Task] = None
+_equity_task: Optional[asyncio.Task] = None
+_shared_mark_task: Optional[asyncio.Task] = None
+
+# Last raw /iserver/auth/status payload and a version that bumps whenever
+# state or authenticated changes. Waiters block on _auth_changed until then.
+_auth_status_raw: Optional[dict] = None
+_auth_version = 0
+_auth_changed = asyncio.Event()
+
+
+def record_auth_state(state: str, authenticated: bool, raw: Optional[dict] = None):
+    """Store the latest auth check and wake waiters if the state changed."""
+    global _auth_status_raw, _auth_version, _auth_changed
+
+    changed = (
+        state != _session_health["state"]
+        or authenticated != _session_health["authenticated"]
+    )
+    _session_health["state"] = state
+    _session_health["authenticated"] = authenticated
+    _session_health["last_check_at"] = datetime.utcnow()
+    _auth_status_raw = raw
+
+    if changed:
+        _auth_version += 1
+        event, _auth_changed = _auth_changed, asyncio.Event()
+        event.set()
+
+
+def auth_status_payload() -> dict:
+    """Response body shared by /gateway/auth-status and its wait/stream variants."""
+    if _session_health["state"] == "unreachable":
+        return {
+            "ok": False,
+            "authenticated": False,
+            "error": f"Gateway check failed: {_session_health['last_error']}",
+            "version": _auth_version,
+            "checked_at": _session_health["last_check_at"],
+        }
+    return {
+        "ok": True,
+        "authenticated": _session_health["authenticated"],
+        "status": _auth_status_raw,
+        "version": _auth_version,
+        "checked_at": _session_health["last_check_at"],
+    }
 
-            volume=1000 + i * 10,
 
+async def trigger_ibeam_reauth() -> bool:
+    """
+    Ask the Session API to make IBeam log in again.
+    Returns True if the trigger was accepted.
+    """
+    try:
+        resp = await get_session_api_client().post(
+            "/session-reauth",
+            headers={"X-Bridge-Key": BRIDGE_KEY},
         )
+        return resp.status_code == 200
+    except Exception as e:
+        print(f"Warning: Session API re-auth trigger failed: {e}")
+        return False
 
-        candles.append(c)
 
-        price += 0.01
+async def refresh_auth_status() -> Optional[dict]:
+    """Read /iserver/auth/status and record it. Returns the raw payload, or None on failure."""
+    try:
+        auth_status = await ib_get("iserver/auth/status", fallback=False)
+    except HTTPException as e:
+        _session_health["connected"] = False
+        _session_health["last_error"] = f"auth status failed: {e.detail}"
+        record_auth_state("unreachable" if e.status_code in (502, 503) else "unauthenticated", False)
+        return None
 
+    authenticated = is_authenticated(auth_status)
+    _session_health["connected"] = auth_status.get("connected") == True
+    _session_health["competing"] = auth_status.get("competing") == True
+    record_auth_state("authenticated" if authenticated else "unauthenticated", authenticated, auth_status)
+    return auth_status
 
 
-    candles.reverse()
+async def keepalive_tick():
+    """
+    One keepalive cycle:
+    1) POST /tickle so the gateway session doesn't idle out
+    2) Read /iserver/auth/status and record session health
+    3) If the session has dropped, try /iserver/reauthenticate first, then
+       fall back to re-triggering IBeam through the Session API
+    Also re-registers for cookie pushes, in case the Session API restarted.
+    """
+    now = datetime.utcnow()
+    await subscribe_session_cookies()
 
+    try:
+        await ib_post("tickle")
+        _session_health["last_tickle_at"] = now
+    except HTTPException as e:
+        # 401 here means the SSO session is gone - auth/status will say the same
+        _session_health["last_error"] = f"tickle failed: {e.detail}"
+
+    await refresh_auth_status()
+
+    if _session_health["authenticated"]:
+        _session_health["last_authenticated_at"] = now
+        _session_health["consecutive_failures"] = 0
+        _session_health["last_error"] = None
+        return
+
+    _session_health["consecutive_failures"] += 1
+
+    # Gateway is down entirely - nothing to re-authenticate against
+    if _session_health["state"] == "unreachable":
+        return
+
+    # Brokerage session dropped but SSO may still be valid: cheap in-gateway reauth
+    if _session_health["consecutive_failures"] < REAUTH_AFTER_FAILURES:
+        try:
+            await ib_post("iserver/reauthenticate")
+        except HTTPException:
+            pass
+        return
+
+    last_reauth = _session_health["last_reauth_at"]
+    if last_reauth and (now - last_reauth).total_seconds() < REAUTH_COOLDOWN:
+        return
+
+    _session_health["last_reauth_at"] = now
+    if await trigger_ibeam_reauth():
+        _session_health["reauth_count"] += 1
+
+
+async def keepalive_loop():
+    """
+    Run keepalive_tick forever. Checks every AUTH_RECHECK_INTERVAL while the
+    session is down so a finished login is noticed quickly, otherwise every
+    KEEPALIVE_INTERVAL.
+    """
+    while True:
+        try:
+            await keepalive_tick()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _session_health["last_error"] = f"keepalive error: {str(e)}"
+        if _shared is not None:
+            _shared.put("state:session", {"health": jsonable_encoder(_session_health), "raw": _auth_status_raw})
+        if _session_health["authenticated"]:
+            await asyncio.sleep(KEEPALIVE_INTERVAL)
+        else:
+            await asyncio.sleep(AUTH_RECHECK_INTERVAL)
+
+
+def sync_shared_cookies():
+    """Pick up a cookie header another worker received (push, 401 refetch)."""
+    entry = _shared.get("state:cookies", math.inf)
+    if entry is not None and entry.get("header") != _session_cookies["header"]:
+        set_session_cookies(entry.get("header"), "shared")
+
+
+def sync_shared_session():
+    """Followers: mirror the poller's session health so auth routes answer locally."""
+    entry = _shared.get("state:session", math.inf)
+    if entry is None:
+        return
+    health = entry["health"]
+    record_auth_state(health["state"], health["authenticated"], entry["raw"])
+    for key, value in health.items():
+        if key in ("state", "authenticated"):
+            continue
+        # *_at fields are published as ISO strings; keepalive_tick does datetime math on them
+        if key.endswith("_at") and isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        _session_health[key] = value
+
+
+async def refresh_shared_entries():
+    """
+    Poller: re-fetch shared gateway responses and quote snapshots that some
+    worker read recently once they are past half their TTL, so readers keep
+    hitting the shared cache instead of calling the gateway themselves.
+    """
+    now = time.time()
+    paths = [
+        key[len("gw:"):]
+        for key, stored_at in _shared.hot("gw:")
+        if now - stored_at > (shared_ttl(key[len("gw:"):]) or 0) / 2
+    ]
+    conids = [
+        int(key[len("snapshot:"):])
+        for key, stored_at in _shared.hot("snapshot:")
+        if now - stored_at > SNAPSHOT_SHARED_TTL / 2
+    ]
+    # Background refresh: lowest pacing class
+    calls = [ib_get(path, priority=PRIORITY_HISTORY, use_shared=False) for path in paths]
+    if conids:
+        calls.append(market_snapshots(conids, use_shared=False))
+    for result in await asyncio.gather(*calls, return_exceptions=True):
+        if isinstance(result, Exception) and not isinstance(result, HTTPException):
+            print(f"Warning: shared cache refresh failed: {result}")
+
+
+async def shared_refresh_loop():
+    while True:
+        try:
+            sync_shared_cookies()
+            await refresh_shared_entries()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Warning: shared cache refresh error: {e}")
+        await asyncio.sleep(SHARED_REFRESH_INTERVAL)
+
+
+async def shared_worker_loop():
+    """
+    Multi-worker mode. Until this worker wins the poller lock it only mirrors
+    session state from the shared cache; the winner runs the keepalive and
+    keeps hot shared entries fresh. If the poller exits its lock is released
+    and the next follower to retry takes over.
+    """
+    while not _shared.try_lead():
+        try:
+            sync_shared_cookies()
+            sync_shared_session()
+        except Exception as e:
+            print(f"Warning: shared session sync failed: {e}")
+        await asyncio.sleep(AUTH_RECHECK_INTERVAL)
+
+    print(f"Worker {os.getpid()} is the gateway poller")
+    await asyncio.gather(keepalive_loop(), shared_refresh_loop(), equity_sampler_loop(), alert_sync_loop())
+
+
+@app.on_event("startup")
+async def start_keepalive():
+    global _keepalive_task, _equity_task, _shared_mark_task
+    await refresh_session_cookies()
+    if _shared is not None:
+        _keepalive_task = asyncio.create_task(shared_worker_loop())
+        _shared_mark_task = asyncio.create_task(shared_mark_loop())
+    else:
+        _keepalive_task = asyncio.create_task(keepalive_loop())
+        _equity_task = asyncio.create_task(equity_sampler_loop())
+        get_alert_engine().start()
+
+
+@app.on_event("shutdown")
+async def stop_keepalive():
+    if _keepalive_task:
+        _keepalive_task.cancel()
+    if _equity_task:
+        _equity_task.cancel()
+    if _shared_mark_task:
+        _shared_mark_task.cancel()
+    if _quote_feed.task:
+        _quote_feed.task.cancel()
+    _scheduler.stop()
+    if _backtest_pool is not None:
+        _backtest_pool.shutdown(wait=False, cancel_futures=True)
+    if _gateway_client is not None:
+        await _gateway_client.aclose()
+    if _session_api_client is not None:
+        await _session_api_client.aclose()
+    if _recorder is not None:
+        _recorder.close()
+
+
+@app.get("/gateway/session-health")
+async def gateway_session_health(x_bridge_key: str = Header(None)):
+    """
+    Session health as last observed by the keepalive loop.
+    Does not call the gateway.
+    """
+    verify_key(x_bridge_key)
+    return {"ok": True, **_session_health}
+
+
+@app.get("/gateway/circuits")
+async def gateway_circuits(x_bridge_key: str = Header(None)):
+    """Circuit breaker state and adaptive timeout per gateway endpoint family."""
+    verify_key(x_bridge_key)
+    return {
+        "ok": True,
+        "circuits": {family: b.snapshot() for family, b in _breakers.items()},
+        "last_good_entries": len(_last_good),
+        "pacing": _scheduler.snapshot(),
+        "shared_cache": None if _shared is None else {
+            "file": _shared.filename,
+            "poller": _shared.is_leader,
+            "pid": os.getpid(),
+        },
+    }
+
+
+@app.get("/gateway/auth-status")
+async def gateway_auth_status(x_bridge_key: str = Header(None)):
+    """
+    Gateway authentication status from the keepalive loop's last check.
+    Used by the frontend to detect when user has completed manual login.
+    Only calls /iserver/auth/status if no check has run yet.
+    """
+    verify_key(x_bridge_key)
+
+    if _session_health["last_check_at"] is None:
+        await refresh_auth_status()
+
+    return auth_status_payload()
+
+
+@app.get("/gateway/auth-status/wait")
+async def gateway_auth_status_wait(
+    version: int = Query(-1, description="Last version seen; returns as soon as it differs"),
+    timeout: float = Query(25.0, ge=0, le=60),
+    x_bridge_key: str = Header(None),
+):
+    """
+    Long-poll variant of /gateway/auth-status.
+    Returns immediately if the cached version differs from `version`,
+    otherwise waits up to `timeout` seconds for the next state change.
+    """
+    verify_key(x_bridge_key)
+
+    if version == _auth_version:
+        try:
+            await asyncio.wait_for(_auth_changed.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    return auth_status_payload()
+
+
+@app.get("/gateway/auth-status/stream")
+async def gateway_auth_status_stream(
+    request: Request,
+    x_bridge_key: str = Header(None),
+):
+    """
+    Server-Sent Events variant of /gateway/auth-status.
+    Sends the current status on connect and again on every state change.
+    """
+    verify_key(x_bridge_key)
+
+    async def events():
+        while True:
+            event = _auth_changed
+            yield f"event: auth-status\ndata: {json.dumps(jsonable_encoder(auth_status_payload()))}\n\n"
+            while not event.is_set():
+                if await request.is_disconnected():
+                    return
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=AUTH_STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    # SSE comment keeps proxies from closing an idle stream
+                    yield ": keepalive\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/gateway/session-cookies")
+async def gateway_session_cookies(x_bridge_key: str = Header(None)):
+    """State of the cookie header attached to gateway calls (never the cookie values)."""
+    verify_key(x_bridge_key)
+    return {
+        "ok": True,
+        "has_cookies": _session_cookies["header"] is not None,
+        "cookie_count": len(_session_cookies["header"].split(";")) if _session_cookies["header"] else 0,
+        **{k: v for k, v in _session_cookies.items() if k != "header"},
+    }
+
+
+@app.post("/gateway/session-cookies")
+async def gateway_session_cookies_push(request: Request, x_bridge_key: str = Header(None)):
+    """
+    Push target registered with the Session API's /subscribe.
+    Body: {"event": "cookies-changed" | "cookies-cleared", "cookie_header": "...", ...}
+    """
+    verify_key(x_bridge_key)
+    body = await request.json()
+    event = body.get("event")
+
+    _session_cookies["pushes"] += 1
+    if event == "cookies-cleared":
+        # The session is being torn down; the next 401 fetches the new cookies
+        set_session_cookies(None, "push")
+        invalidate_response_cache()
+    else:
+        set_session_cookies(body.get("cookie_header"), "push")
+
+    return {"ok": True, "version": _session_cookies["version"]}
+
+
+
+
+
+# -------------------------------------------------
+
+# MARKET DATA
+
+# -------------------------------------------------
+
+
+
+@app.get("/price", response_model=PriceSnapshot)
+
+async def get_price(
+
+    symbol: str = Query(..., description="Symbol, e.g. AAPL or BTC-USD"),
+
+    x_bridge_key: str = Header(None),
+
+):
+
+    verify_key(x_bridge_key)
+
+    conid = await resolve_conid(symbol)
+    rows = await market_snapshots([conid])
+    snap = snapshot_to_price(symbol, rows.get(conid, {}), datetime.utcnow())
+    if snap is None:
+        raise HTTPException(status_code=503, detail=f"No market data for {symbol}")
+    return snap
+
+
+
+
+
+@app.post("/quotes")
+
+async def get_quotes(
+
+    req: QuoteRequest,
+
+    x_bridge_key: str = Header(None),
+
+):
+
+    verify_key(x_bridge_key)
+
+    # Unknown symbols are left out rather than failing the whole batch
+    resolved = await asyncio.gather(
+        *(resolve_conid(sym) for sym in req.symbols), return_exceptions=True
+    )
+    conids = {sym: c for sym, c in zip(req.symbols, resolved) if isinstance(c, int)}
+    rows = await market_snapshots(list(dict.fromkeys(conids.values())))
+
+    now = datetime.utcnow()
+    quotes = []
+    for sym, conid in conids.items():
+        snap = snapshot_to_price(sym, rows.get(conid, {}), now)
+        if snap is not None:
+            quotes.append(snap)
+
+    return {"ok": True, "data": quotes}
+
+
+
+
+
+@app.get("/orderbook")
+
+async def get_orderbook(
+
+    symbol: str = Query(...),
+
+    depth: int = Query(25, ge=1, le=100),
+
+    x_bridge_key: str = Header(None),
+
+):
+
+    verify_key(x_bridge_key)
+
+
+
+    # TODO: replace with real order book
+
+    mid = 100.0
+
+    bids = [
+
+        OrderBookLevel(price=mid - 0.1 * i, size=0.5 + i * 0.1)
+
+        for i in range(depth)
+
+    ]
+
+    asks = [
+
+        OrderBookLevel(price=mid + 0.1 * i, size=0.4 + i * 0.1)
+
+        for i in range(depth)
+
+    ]
+
+
+
+    return {"ok": True, "symbol": symbol, "bids": bids, "asks": asks}
+
+
+
+
+
+@app.get("/history/price")
+
+async def get_price_history(
+
+    symbol: str = Query(...),
+
+    tf: str = Query("1h", description="Timeframe, e.g. 1m, 5m, 1h, 1d"),
+
+    bars: int = Query(200, ge=1, le=5000),
+
+    x_bridge_key: str = Header(None),
+
+):
+
+    verify_key(x_bridge_key)
+
+    candles = await price_history(symbol, tf, bars)
     return {"ok": True, "symbol": symbol, "tf": tf, "data": candles}
 
 
@@ -644,6 +2703,7 @@ async def get_price_history(
 
 
 @app.get("/instruments/search")
+@cached_route(ttl=3600, stale=86400)
 
 async def search_instruments(
 
@@ -685,6 +2745,894 @@ async def search_instruments(
 
 
 
+# -------------------------------------------------
+
+# INDICATORS
+
+# -------------------------------------------------
+
+
+# Technical indicators over the bar store. Each (conid, tf, indicator spec)
+# keeps its output columns; when bars are appended or the last bar changes,
+# only the tail from the first changed bar is recomputed. Recursive
+# indicators (EMA, RSI, ATR, VWAP) pick up from their own values at the
+# bar before, kept as extra columns.
+
+INDICATOR_CACHE_ENTRIES = 256
+INDICATOR_MAX_PERIOD = 500
+
+# name -> default parameters
+INDICATOR_DEFAULTS = {
+    "sma": (20,),
+    "ema": (20,),
+    "rsi": (14,),
+    "atr": (14,),
+    "vwap": (),
+    "bb": (20, 2.0),
+}
+
+
+class IndicatorState:
+    def __init__(self):
+        self.revision = -1
+        self.length = 0
+        self.columns: dict[str, np.ndarray] = {}
+
+
+# (conid, tf, name, params) -> IndicatorState, LRU
+_indicator_cache: "OrderedDict[tuple, IndicatorState]" = OrderedDict()
+
+
+def parse_indicator_specs(text: str) -> List[tuple]:
+    """'sma:20,ema:50,rsi,bb:20:2.5' -> [("sma", (20,)), ("ema", (50,)), ("rsi", (14,)), ("bb", (20, 2.5))]"""
+    specs = []
+    for item in (s.strip().lower() for s in text.split(",")):
+        if not item:
+            continue
+        name, *args = item.split(":")
+        defaults = INDICATOR_DEFAULTS.get(name)
+        if defaults is None:
+            raise HTTPException(status_code=400, detail=f"Unknown indicator: {name}")
+        if len(args) > len(defaults):
+            raise HTTPException(status_code=400, detail=f"Too many parameters for {name}: {item}")
+        try:
+            params = tuple(type(d)(a) for d, a in zip(defaults, args)) + defaults[len(args):]
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid parameters for {name}: {item}")
+        if params and not 1 <= params[0] <= INDICATOR_MAX_PERIOD:
+            raise HTTPException(status_code=400, detail=f"{name} period must be 1-{INDICATOR_MAX_PERIOD}")
+        specs.append((name, params))
+    if not specs:
+        raise HTTPException(status_code=400, detail="No indicators requested")
+    return list(dict.fromkeys(specs))
+
+
+def indicator_label(name: str, params: tuple) -> str:
+    """("bb", (20, 2.0)) -> 'bb_20_2'"""
+    return "_".join([name] + [f"{p:g}" for p in params])
+
+
+def indicator_warmup(name: str, params: tuple) -> int:
+    """Bars needed before the first value is reliable (recursive averages need ~3x their period)."""
+    if name in ("ema", "rsi", "atr"):
+        return 3 * params[0]
+    return params[0] if params else 0
+
+
+def rolling(values: np.ndarray, period: int, start: int, fn) -> np.ndarray:
+    """fn over each trailing window of `period`, for indices [start:] (NaN before the first full window)."""
+    n = len(values)
+    out = np.full(n - start, np.nan)
+    first = max(start, period - 1)
+    if first < n:
+        windows = np.lib.stride_tricks.sliding_window_view(values[first - period + 1:], period)
+        out[first - start:] = fn(windows)
+    return out
+
+
+def recursive_average(values: np.ndarray, period: int, alpha: float, start: int,
+                      previous: Optional[np.ndarray], first: int = 0) -> np.ndarray:
+    """
+    Exponential average (alpha = 2/(p+1) for EMA, 1/p for Wilder) for indices
+    [start:], seeded with the simple mean of the first `period` values from
+    `first`. Continues from previous[start - 1] when that is already known.
+    """
+    n = len(values)
+    out = np.full(n - start, np.nan)
+    seed = first + period - 1
+    prev = previous[start - 1] if start > seed and previous is not None else math.nan
+    data = values.tolist()
+    for i in range(max(start, seed), n):
+        if i == seed:
+            prev = sum(data[first:seed + 1]) / period
+        else:
+            prev += alpha * (data[i] - prev)
+        out[i - start] = prev
+    return out
+
+
+def compute_indicator(name: str, params: tuple, tf: str, bars: BarSeries, start: int, state: dict) -> dict:
+    """Columns of one indicator for bars [start:], given its columns for bars [:start] in `state`."""
+    close = bars.close
+
+    if name == "sma":
+        return {"value": rolling(close, params[0], start, lambda w: w.mean(axis=1))}
+
+    if name == "ema":
+        period = params[0]
+        return {"value": recursive_average(close, period, 2.0 / (period + 1), start, state.get("value"))}
+
+    if name == "bb":
+        period, width = params
+        mid = rolling(close, period, start, lambda w: w.mean(axis=1))
+        std = rolling(close, period, start, lambda w: w.std(axis=1))
+        return {"mid": mid, "upper": mid + width * std, "lower": mid - width * std}
+
+    if name == "rsi":
+        period = params[0]
+        change = np.diff(close, prepend=close[:1])
+        gain = recursive_average(np.maximum(change, 0.0), period, 1.0 / period, start, state.get("avg_gain"), first=1)
+        loss = recursive_average(np.maximum(-change, 0.0), period, 1.0 / period, start, state.get("avg_loss"), first=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rsi = np.where(loss == 0, np.where(gain == 0, 50.0, 100.0), 100.0 - 100.0 / (1.0 + gain / loss))
+        rsi[np.isnan(gain)] = np.nan
+        return {"value": rsi, "avg_gain": gain, "avg_loss": loss}
+
+    if name == "atr":
+        period = params[0]
+        prev_close = np.concatenate([close[:1], close[:-1]])
+        true_range = np.maximum(bars.high - bars.low,
+                                np.maximum(np.abs(bars.high - prev_close), np.abs(bars.low - prev_close)))
+        return {"value": recursive_average(true_range, period, 1.0 / period, start, state.get("value"))}
+
+    if name == "vwap":
+        # Session VWAP, reset each UTC day on intraday bars; anchored at the
+        # first stored bar on daily and longer bars
+        day = bars.ts // 86400 if timeframe_minutes(tf) < 1440 else np.zeros(len(bars), dtype=np.int64)
+        typical = (bars.high + bars.low + close) / 3.0
+
+        seg_day = day[start:]
+        pv = np.cumsum(typical[start:] * bars.volume[start:])
+        vol = np.cumsum(bars.volume[start:])
+        idx = np.arange(len(seg_day))
+        new_day = np.concatenate([[start == 0 or day[start - 1] != seg_day[0]], seg_day[1:] != seg_day[:-1]])
+        group = np.maximum.accumulate(np.where(new_day, idx, 0))
+        base_pv = np.where(group > 0, pv[group - 1], 0.0)
+        base_vol = np.where(group > 0, vol[group - 1], 0.0)
+        cum_pv, cum_vol = pv - base_pv, vol - base_vol
+        if not new_day[0]:
+            carried = group == 0
+            cum_pv[carried] += state["cum_pv"][start - 1]
+            cum_vol[carried] += state["cum_vol"][start - 1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            value = np.where(cum_vol > 0, cum_pv / cum_vol, np.nan)
+        return {"value": value, "cum_pv": cum_pv, "cum_vol": cum_vol}
+
+    raise HTTPException(status_code=400, detail=f"Unknown indicator: {name}")
+
+
+def update_indicator(conid: int, tf: str, name: str, params: tuple, bars: BarSeries) -> dict:
+    """Indicator columns over all stored bars, recomputing only from the first changed bar."""
+    key = (conid, tf, name, params)
+    state = _indicator_cache.get(key)
+    if state is None:
+        state = _indicator_cache[key] = IndicatorState()
+    _indicator_cache.move_to_end(key)
+    while len(_indicator_cache) > INDICATOR_CACHE_ENTRIES:
+        _indicator_cache.popitem(last=False)
+
+    if state.revision != bars.revision or state.length != len(bars):
+        start = 0 if state.revision < 0 else min(bars.changed_since(state.revision), state.length)
+        previous = {col: values[:start] for col, values in state.columns.items()}
+        tail = compute_indicator(name, params, tf, bars, start, previous)
+        state.columns = {
+            col: np.concatenate([previous[col], values]) if col in previous else values
+            for col, values in tail.items()
+        }
+        state.revision, state.length = bars.revision, len(bars)
+    return state.columns
+
+
+def json_floats(values: np.ndarray) -> list:
+    """NaN (not enough bars yet) -> None, since JSON has no NaN."""
+    return [None if math.isnan(v) else round(v, 6) for v in values.tolist()]
+
+
+@app.get("/history/indicators")
+@cached_route(ttl=5, stale=30)
+async def get_history_indicators(
+    symbol: str = Query(...),
+    tf: str = Query("1h", description="Timeframe, e.g. 1m, 5m, 1h, 1d"),
+    bars: int = Query(200, ge=1, le=5000),
+    indicators: str = Query("sma:20,ema:50,rsi:14", description="Comma list of name[:param...]: sma, ema, rsi, atr, vwap, bb"),
+    x_bridge_key: str = Header(None),
+):
+    """
+    Indicators over the last `bars` bars, computed from the local bar store.
+    Only bars newer than the last stored one are fetched from the gateway.
+    Columns: ts (unix seconds, bar start) and one per indicator output
+    (e.g. sma_20, bb_20_2_upper); null until enough bars exist.
+    """
+    verify_key(x_bridge_key)
+
+    specs = parse_indicator_specs(indicators)
+    conid = await resolve_conid(symbol)
+    store = get_bar_store()
+    series = store.get(conid, tf)
+
+    # Enough history for the first returned value to be warmed up
+    wanted = bars + max(indicator_warmup(name, params) for name, params in specs)
+    if len(series) < wanted:
+        await fetch_history_bars(conid, tf, wanted)
+    else:
+        since_last = math.ceil((time.time() - series.ts[-1]) / (timeframe_minutes(tf) * 60)) + 1
+        await fetch_history_bars(conid, tf, min(since_last, wanted))
+    series = store.get(conid, tf)
+
+    first = max(0, len(series) - bars)
+    data = {"ts": series.ts[first:].tolist()}
+    for name, params in specs:
+        columns = update_indicator(conid, tf, name, params, series)
+        label = indicator_label(name, params)
+        for col, values in columns.items():
+            if col == "value":
+                data[label] = json_floats(values[first:])
+            elif name == "bb":
+                data[f"{label}_{col}"] = json_floats(values[first:])
+
+    return {"ok": True, "symbol": symbol, "tf": tf, "bars": len(data["ts"]), "data": data}
+
+
+
+
+
+# -------------------------------------------------
+
+# SCANNER
+
+# -------------------------------------------------
+
+
+# Watchlist scanners on the quote feed. Rules are indexed by conid, so a tick
+# only evaluates the rules for its own symbol, each from O(1) state kept
+# since the previous tick. Level and percent rules fire when their condition
+# becomes true (not on every tick while it stays true); crosses fire on each
+# cross. Matches go to every /scanner/{id}/stream client.
+
+SCAN_RULE_KINDS = (
+    "above", "below",                       # last vs value
+    "cross_above", "cross_below",           # last crossed value since the previous tick
+    "pct_change_above", "pct_change_below", # % change vs prior close vs value (e.g. 3 or -3)
+    "volume_spike",                         # volume since the previous tick >= value x its running average
+)
+
+
+class RuleState:
+    __slots__ = ("rule", "active", "prev_last", "prev_volume", "avg_volume_delta", "samples")
+
+    def __init__(self, rule: ScanRule):
+        self.rule = rule
+        self.active = False
+        self.prev_last: Optional[float] = None
+        self.prev_volume: Optional[float] = None
+        self.avg_volume_delta = 0.0
+        self.samples = 0
+
+    def evaluate(self, tick: Tick) -> Optional[dict]:
+        """Match details if this tick fires the rule, else None."""
+        kind, value = self.rule.kind, self.rule.value
+        detail: dict = {"last": tick.last}
+
+        if kind in ("cross_above", "cross_below"):
+            prev, self.prev_last = self.prev_last, tick.last
+            if prev is None:
+                return None
+            crossed = prev <= value < tick.last if kind == "cross_above" else prev >= value > tick.last
+            return detail if crossed else None
+
+        if kind == "volume_spike":
+            if tick.volume is None:
+                return None
+            prev, self.prev_volume = self.prev_volume, tick.volume
+            if prev is None or tick.volume < prev:
+                # New session resets day volume
+                return None
+            delta = tick.volume - prev
+            average = self.avg_volume_delta
+            self.samples += 1
+            self.avg_volume_delta += (delta - average) / min(self.samples, SCANNER_VOLUME_WINDOW)
+            if self.samples <= SCANNER_VOLUME_WINDOW or average <= 0 or delta < value * average:
+                return None
+            return {**detail, "volume_delta": delta, "average_delta": round(average, 2)}
+
+        if kind in ("pct_change_above", "pct_change_below"):
+            if not tick.prior_close:
+                return None
+            pct = 100.0 * (tick.last / tick.prior_close - 1.0)
+            detail["pct_change"] = round(pct, 4)
+            condition = pct >= value if kind == "pct_change_above" else pct <= value
+        else:
+            condition = tick.last > value if kind == "above" else tick.last < value
+
+        fired = condition and not self.active
+        self.active = condition
+        return detail if fired else None
+
+
+class Scanner:
+    def __init__(self, scanner_id: str, symbols: dict[str, int], rules: List[ScanRule]):
+        self.id = scanner_id
+        self.created_at = datetime.utcnow()
+        self.symbols = symbols
+        self.rules = rules
+        self.symbol_by_conid = {conid: symbol for symbol, conid in symbols.items()}
+        # conid -> rule states for that conid
+        self.states: dict[int, List[RuleState]] = {}
+        for rule in rules:
+            for symbol in (rule.symbols or symbols):
+                conid = symbols.get(symbol.strip().upper())
+                if conid is not None:
+                    self.states.setdefault(conid, []).append(RuleState(rule))
+        self.matches: deque = deque(maxlen=SCANNER_MATCH_HISTORY)
+        self.match_count = 0
+        self.listeners: set[asyncio.Queue] = set()
+        self.dropped = 0
+        # Set on delete; open streams finish once they see it
+        self.closed = False
+
+    def on_tick(self, tick: Tick):
+        for state in self.states.get(tick.conid, ()):
+            detail = state.evaluate(tick)
+            if detail is None:
+                continue
+            match = {
+                "scanner_id": self.id,
+                "rule": state.rule.name or state.rule.kind,
+                "kind": state.rule.kind,
+                "value": state.rule.value,
+                "symbol": self.symbol_by_conid.get(tick.conid),
+                "conid": tick.conid,
+                "timestamp": datetime.utcfromtimestamp(tick.ts),
+                **detail,
+            }
+            self.matches.append(match)
+            self.match_count += 1
+            for queue in self.listeners:
+                try:
+                    queue.put_nowait(match)
+                except asyncio.QueueFull:
+                    self.dropped += 1
+
+    def summary(self) -> dict:
+        return {
+            "scanner_id": self.id,
+            "created_at": self.created_at,
+            "symbols": len(self.symbols),
+            "rules": self.rules,
+            "matches": self.match_count,
+            "listeners": len(self.listeners),
+            "dropped": self.dropped,
+        }
+
+
+_scanners: dict[str, Scanner] = {}
+
+
+def get_scanner(scanner_id: str) -> Scanner:
+    scanner = _scanners.get(scanner_id)
+    if scanner is None:
+        raise HTTPException(status_code=404, detail=f"Unknown scanner: {scanner_id}")
+    return scanner
+
+
+@app.post("/scanner")
+async def create_scanner(
+    req: ScannerRequest,
+    x_bridge_key: str = Header(None),
+):
+    """
+    Start a scanner over a watchlist. Rules without `symbols` apply to the
+    whole watchlist. Matches are streamed on /scanner/{id}/stream.
+    """
+    verify_key(x_bridge_key)
+
+    for rule in req.rules:
+        if rule.kind not in SCAN_RULE_KINDS:
+            raise HTTPException(status_code=400, detail=f"Unknown rule kind: {rule.kind}")
+
+    wanted = list(dict.fromkeys(
+        s.strip().upper() for s in req.watchlist + [s for r in req.rules for s in (r.symbols or [])]
+    ))
+    if len(wanted) > SCANNER_MAX_SYMBOLS:
+        raise HTTPException(status_code=400, detail=f"At most {SCANNER_MAX_SYMBOLS} symbols per scanner")
+
+    # Unknown symbols are reported rather than failing the whole scanner
+    resolved = await asyncio.gather(*(resolve_conid(s) for s in wanted), return_exceptions=True)
+    symbols = {s: c for s, c in zip(wanted, resolved) if isinstance(c, int)}
+
+    # Random, not a counter: scanners are per worker, and another worker's SCAN-1
+    # must be a 404 here rather than a different client's scanner
+    scanner = Scanner(f"SCAN-{os.urandom(5).hex()}", symbols, req.rules)
+    _scanners[scanner.id] = scanner
+    _quote_feed.subscribe(scanner.id, scanner.states, scanner.on_tick)
+
+    return {
+        "ok": True,
+        **scanner.summary(),
+        "unknown_symbols": [s for s in wanted if s not in symbols],
+    }
+
+
+@app.get("/scanner")
+async def list_scanners(x_bridge_key: str = Header(None)):
+    verify_key(x_bridge_key)
+    return {"ok": True, "feed": _quote_feed.status(), "data": [s.summary() for s in _scanners.values()]}
+
+
+@app.get("/scanner/{scanner_id}")
+async def scanner_status(
+    scanner_id: str,
+    limit: int = Query(50, ge=1, le=SCANNER_MATCH_HISTORY),
+    x_bridge_key: str = Header(None),
+):
+    """Scanner settings and its most recent matches (newest first)."""
+    verify_key(x_bridge_key)
+    scanner = get_scanner(scanner_id)
+    return {"ok": True, **scanner.summary(), "recent": list(reversed(scanner.matches))[:limit]}
+
+
+@app.delete("/scanner/{scanner_id}")
+async def delete_scanner(scanner_id: str, x_bridge_key: str = Header(None)):
+    verify_key(x_bridge_key)
+    scanner = get_scanner(scanner_id)
+    _quote_feed.unsubscribe(scanner.id)
+    del _scanners[scanner.id]
+    scanner.closed = True
+    for queue in scanner.listeners:
+        # Wakes idle streams; a full queue means its stream is busy and sees closed soon
+        try:
+            queue.put_nowait(None)
+        except asyncio.QueueFull:
+            pass
+    return {"ok": True, "scanner_id": scanner.id}
+
+
+@app.get("/scanner/{scanner_id}/stream")
+async def scanner_stream(
+    scanner_id: str,
+    request: Request,
+    x_bridge_key: str = Header(None),
+):
+    """Server-Sent Events: one `match` event per rule match, until the scanner is deleted."""
+    verify_key(x_bridge_key)
+    scanner = get_scanner(scanner_id)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=SCANNER_QUEUE_SIZE)
+    scanner.listeners.add(queue)
+
+    async def events():
+        try:
+            while True:
+                if scanner.closed or await request.is_disconnected():
+                    return
+                try:
+                    match = await asyncio.wait_for(queue.get(), timeout=SCANNER_STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if match is None:
+                    return
+                yield f"event: match\ndata: {json.dumps(jsonable_encoder(match))}\n\n"
+        finally:
+            scanner.listeners.discard(queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+
+
+
+# -------------------------------------------------
+
+# ALERTS
+
+# -------------------------------------------------
+
+
+# Price alerts ("AAPL above 200") evaluated on the quote feed. Per conid the
+# armed thresholds sit in two sorted price lists, one per direction; a tick
+# moving from p0 to p1 bisects out only the thresholds in between, so each
+# tick costs O(log n + k) however many alerts a symbol has. Alerts persist in
+# SQLite. Only the gateway-facing worker (single worker or the poller)
+# evaluates them; in multi-worker mode other workers write to the file and
+# the evaluator picks changes up every ALERT_SYNC_INTERVAL.
+
+ALERT_CONDITIONS = ("above", "below")
+
+
+class AlertBook:
+    """Armed thresholds for one conid, sorted by price, plus the last price seen."""
+
+    __slots__ = ("above_prices", "above_ids", "below_prices", "below_ids", "last")
+
+    def __init__(self):
+        self.above_prices: List[float] = []
+        self.above_ids: List[str] = []
+        self.below_prices: List[float] = []
+        self.below_ids: List[str] = []
+        self.last: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self.above_ids) + len(self.below_ids)
+
+    def sides(self, condition: str) -> tuple[list, list]:
+        if condition == "above":
+            return self.above_prices, self.above_ids
+        return self.below_prices, self.below_ids
+
+    def add(self, alert_id: str, condition: str, price: float):
+        prices, ids = self.sides(condition)
+        i = bisect.bisect_right(prices, price)
+        prices.insert(i, price)
+        ids.insert(i, alert_id)
+
+    def remove(self, alert_id: str, condition: str, price: float):
+        prices, ids = self.sides(condition)
+        i = bisect.bisect_left(prices, price)
+        while i < len(prices) and prices[i] == price:
+            if ids[i] == alert_id:
+                del prices[i], ids[i]
+                return
+            i += 1
+
+    def crossed(self, last: float) -> List[str]:
+        """
+        Ids of alerts whose condition became true moving to `last`:
+        above p: previous <= p < last; below p: last < p <= previous.
+        On the first price every alert already true fires.
+        """
+        previous, self.last = self.last, last
+        fired = []
+        if previous is None or last > previous:
+            lo = 0 if previous is None else bisect.bisect_left(self.above_prices, previous)
+            fired += self.above_ids[lo:bisect.bisect_left(self.above_prices, last)]
+        if previous is None or last < previous:
+            hi = len(self.below_prices) if previous is None else bisect.bisect_right(self.below_prices, previous)
+            fired += self.below_ids[bisect.bisect_right(self.below_prices, last):hi]
+        return fired
+
+
+class AlertEngine:
+    COLUMNS = ("id", "conid", "symbol", "condition", "price", "note", "repeat", "status",
+               "created_at", "updated_at", "triggered_at", "trigger_price", "trigger_count")
+
+    def __init__(self, filename: str):
+        self.conn = sqlite3.connect(filename, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS alerts ("
+            " id TEXT PRIMARY KEY, conid INTEGER NOT NULL, symbol TEXT NOT NULL,"
+            " condition TEXT NOT NULL, price REAL NOT NULL, note TEXT, repeat INTEGER NOT NULL,"
+            " status TEXT NOT NULL, created_at REAL NOT NULL, updated_at REAL NOT NULL,"
+            " triggered_at REAL, trigger_price REAL, trigger_count INTEGER NOT NULL DEFAULT 0,"
+            " seq INTEGER NOT NULL DEFAULT 0)"
+        )
+        if "seq" not in {c[1] for c in self.conn.execute("PRAGMA table_info(alerts)")}:
+            self.conn.execute("ALTER TABLE alerts ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+        self.conn.execute("DROP INDEX IF EXISTS alerts_updated")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS alerts_seq ON alerts (seq)")
+        # Armed alerts by id, and their thresholds per conid
+        self.armed: dict[str, dict] = {}
+        self.books: dict[int, AlertBook] = {}
+        self.synced_seq = -1   # rows from before the seq column have seq 0
+        # Trigger writes of the current tick, committed together by flush()
+        self.pending: List[tuple] = []
+        self.evaluating = False
+        self.recent: deque = deque(maxlen=ALERT_HISTORY)
+        self.listeners: set[asyncio.Queue] = set()
+
+    # --- storage ---
+
+    # Every create/delete takes the next change sequence number inside its own
+    # statement, i.e. under SQLite's write lock, so seq order is commit order
+    # across workers (a wall-clock stamp taken before a busy wait is not).
+    NEXT_SEQ = "(SELECT COALESCE(MAX(seq), 0) + 1 FROM alerts)"
+
+    def row(self, alert_id: str) -> Optional[dict]:
+        row = self.conn.execute(
+            f"SELECT {', '.join(self.COLUMNS)} FROM alerts WHERE id = ?", (alert_id,)
+        ).fetchone()
+        return dict(zip(self.COLUMNS, row)) if row else None
+
+    def rows(self, status: Optional[str] = None, limit: int = 500) -> List[dict]:
+        where, args = ("WHERE status = ?", (status,)) if status else ("WHERE status != 'deleted'", ())
+        cursor = self.conn.execute(
+            f"SELECT {', '.join(self.COLUMNS)} FROM alerts {where} ORDER BY created_at DESC LIMIT ?",
+            args + (limit,),
+        )
+        return [dict(zip(self.COLUMNS, r)) for r in cursor.fetchall()]
+
+    def create(self, conid: int, symbol: str, condition: str, price: float,
+               note: Optional[str], repeat: bool) -> dict:
+        now = time.time()
+        alert = {
+            "id": f"ALERT-{os.urandom(5).hex()}", "conid": conid, "symbol": symbol,
+            "condition": condition, "price": price, "note": note, "repeat": int(repeat),
+            "status": "active", "created_at": now, "updated_at": now,
+            "triggered_at": None, "trigger_price": None, "trigger_count": 0,
+        }
+        alert["seq"] = self.conn.execute(
+            f"INSERT INTO alerts ({', '.join(self.COLUMNS)}, seq)"
+            f" VALUES ({', '.join('?' * len(self.COLUMNS))}, {self.NEXT_SEQ}) RETURNING seq",
+            tuple(alert[c] for c in self.COLUMNS),
+        ).fetchone()[0]
+        if self.evaluating:
+            self.arm(alert)
+            self.fire_if_true(alert)
+            self.flush()
+            self.resubscribe()
+        return alert
+
+    def delete(self, alert_id: str) -> bool:
+        """Soft delete, so an evaluator in another worker sees it on its next sync."""
+        cursor = self.conn.execute(
+            f"UPDATE alerts SET status = 'deleted', updated_at = ?, seq = {self.NEXT_SEQ}"
+            " WHERE id = ? AND status != 'deleted'",
+            (time.time(), alert_id),
+        )
+        if self.evaluating:
+            self.disarm(alert_id)
+            self.resubscribe()
+        return cursor.rowcount > 0
+
+    # --- evaluation ---
+
+    def arm(self, alert: dict):
+        self.disarm(alert["id"])
+        self.armed[alert["id"]] = alert
+        book = self.books.get(alert["conid"])
+        if book is None:
+            book = self.books[alert["conid"]] = AlertBook()
+            latest = _quote_feed.latest.get(alert["conid"])
+            book.last = latest.last if latest is not None else None
+        book.add(alert["id"], alert["condition"], alert["price"])
+
+    def fire_if_true(self, alert: dict):
+        """Already true at the current price: fire now rather than on the next cross."""
+        latest = _quote_feed.latest.get(alert["conid"])
+        if latest is None:
+            return
+        if latest.last > alert["price"] if alert["condition"] == "above" else latest.last < alert["price"]:
+            self.trigger(alert["id"], latest.last, latest.ts)
+
+    def disarm(self, alert_id: str):
+        alert = self.armed.pop(alert_id, None)
+        if alert is None:
+            return
+        book = self.books[alert["conid"]]
+        book.remove(alert_id, alert["condition"], alert["price"])
+        if not len(book):
+            del self.books[alert["conid"]]
+
+    def resubscribe(self):
+        if self.books:
+            _quote_feed.subscribe("alerts", list(self.books), self.on_tick)
+        else:
+            _quote_feed.unsubscribe("alerts")
+
+    def sync(self):
+        """Apply alerts created, deleted or re-armed since the last sync (any worker)."""
+        cursor = self.conn.execute(
+            f"SELECT {', '.join(self.COLUMNS)}, seq FROM alerts WHERE seq > ? ORDER BY seq",
+            (self.synced_seq,),
+        )
+        changed = False
+        for values in cursor.fetchall():
+            alert = dict(zip(self.COLUMNS + ("seq",), values))
+            self.synced_seq = alert["seq"]
+            known = self.armed.get(alert["id"])
+            if alert["status"] == "active" and (known is None or known["seq"] != alert["seq"]):
+                self.arm(alert)
+                if known is None:
+                    # Created on another worker: same as create() on this one
+                    self.fire_if_true(alert)
+                changed = True
+            elif alert["status"] != "active" and known is not None:
+                self.disarm(alert["id"])
+                changed = True
+        self.flush()
+        if changed:
+            self.resubscribe()
+
+    def start(self):
+        self.evaluating = True
+        self.sync()
+        self.resubscribe()
+
+    def on_tick(self, tick: Tick):
+        book = self.books.get(tick.conid)
+        if book is None:
+            return
+        fired = book.crossed(tick.last)
+        if not fired:
+            return
+        # Pick up deletes from other workers first, so a deleted alert doesn't fire
+        self.sync()
+        for alert_id in fired:
+            self.trigger(alert_id, tick.last, tick.ts)
+        self.flush()
+
+    def trigger(self, alert_id: str, price: float, ts: float):
+        alert = self.armed.get(alert_id)
+        if alert is None:
+            return
+        alert["triggered_at"], alert["trigger_price"] = ts, price
+        alert["trigger_count"] += 1
+        if not alert["repeat"]:
+            alert["status"] = "triggered"
+            self.disarm(alert_id)
+        # Not seq: a trigger is not a change the evaluator needs to re-sync
+        self.pending.append((alert["status"], ts, price, alert["trigger_count"], alert_id))
+        event = alert_payload(alert)
+        self.recent.append(event)
+        for queue in self.listeners:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                pass
+
+    def flush(self):
+        """Write the pending triggers in one transaction. Never overwrites a delete."""
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, []
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "UPDATE alerts SET status = ?, triggered_at = ?, trigger_price = ?, trigger_count = ?"
+                " WHERE id = ? AND status != 'deleted'",
+                pending,
+            )
+
+
+_alert_engine: Optional[AlertEngine] = None
+
+
+def get_alert_engine() -> AlertEngine:
+    global _alert_engine
+    if _alert_engine is None:
+        _alert_engine = AlertEngine(ALERTS_DB_FILE)
+    return _alert_engine
+
+
+async def alert_sync_loop():
+    """Multi-worker mode: the poller evaluates alerts, including ones other workers created."""
+    engine = get_alert_engine()
+    engine.start()
+    while True:
+        try:
+            engine.sync()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Warning: alert sync failed: {e}")
+        await asyncio.sleep(ALERT_SYNC_INTERVAL)
+
+
+def alert_payload(alert: dict) -> dict:
+    return {
+        **{k: v for k, v in alert.items() if k != "seq"},
+        "repeat": bool(alert["repeat"]),
+        "created_at": datetime.utcfromtimestamp(alert["created_at"]),
+        "updated_at": datetime.utcfromtimestamp(alert["updated_at"]),
+        "triggered_at": datetime.utcfromtimestamp(alert["triggered_at"]) if alert["triggered_at"] else None,
+    }
+
+
+@app.post("/alerts")
+async def create_alert(
+    req: AlertRequest,
+    x_bridge_key: str = Header(None),
+):
+    """
+    Alert when `symbol` trades above/below `price`. One-shot alerts disarm
+    after firing; `repeat` alerts fire on every cross. An alert that is
+    already true at the last feed price fires immediately.
+    """
+    verify_key(x_bridge_key)
+
+    if req.condition not in ALERT_CONDITIONS:
+        raise HTTPException(status_code=400, detail=f"condition must be one of {', '.join(ALERT_CONDITIONS)}")
+    conid = await resolve_conid(req.symbol)
+    alert = get_alert_engine().create(conid, req.symbol.strip().upper(), req.condition, req.price, req.note, req.repeat)
+    return {"ok": True, "data": alert_payload(alert)}
+
+
+@app.get("/alerts")
+async def list_alerts(
+    status: Optional[str] = Query(None, description="active | triggered | deleted; default all but deleted"),
+    limit: int = Query(500, ge=1, le=5000),
+    x_bridge_key: str = Header(None),
+):
+    verify_key(x_bridge_key)
+    engine = get_alert_engine()
+    return {
+        "ok": True,
+        "evaluating": engine.evaluating,
+        "armed": len(engine.armed),
+        "data": [alert_payload(a) for a in engine.rows(status, limit)],
+    }
+
+
+@app.delete("/alerts/{alert_id}")
+async def delete_alert(alert_id: str, x_bridge_key: str = Header(None)):
+    verify_key(x_bridge_key)
+    if not get_alert_engine().delete(alert_id):
+        raise HTTPException(status_code=404, detail=f"Unknown alert: {alert_id}")
+    return {"ok": True, "alert_id": alert_id}
+
+
+@app.get("/alerts/stream")
+async def alerts_stream(
+    request: Request,
+    x_bridge_key: str = Header(None),
+):
+    """
+    Server-Sent Events: one `alert` event per trigger. On a worker that is
+    not evaluating alerts (multi-worker follower), triggers are read back
+    from the alerts file every ALERT_SYNC_INTERVAL instead.
+    """
+    verify_key(x_bridge_key)
+    engine = get_alert_engine()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=SCANNER_QUEUE_SIZE)
+    engine.listeners.add(queue)
+
+    def triggered_since(since: float) -> List[dict]:
+        cursor = engine.conn.execute(
+            f"SELECT {', '.join(engine.COLUMNS)} FROM alerts WHERE triggered_at > ? ORDER BY triggered_at",
+            (since,),
+        )
+        return [dict(zip(engine.COLUMNS, r)) for r in cursor.fetchall()]
+
+    async def events():
+        since = time.time()
+        last_event = time.monotonic()
+        try:
+            while True:
+                if await request.is_disconnected():
+                    return
+                if engine.evaluating:
+                    try:
+                        alerts = [await asyncio.wait_for(queue.get(), timeout=SCANNER_STREAM_HEARTBEAT)]
+                    except asyncio.TimeoutError:
+                        alerts = []
+                else:
+                    await asyncio.sleep(ALERT_SYNC_INTERVAL)
+                    rows = triggered_since(since)
+                    since = max([since] + [r["triggered_at"] for r in rows])
+                    alerts = [alert_payload(r) for r in rows]
+                for alert in alerts:
+                    yield f"event: alert\ndata: {json.dumps(jsonable_encoder(alert))}\n\n"
+                    last_event = time.monotonic()
+                if time.monotonic() - last_event >= SCANNER_STREAM_HEARTBEAT:
+                    yield ": keepalive\n\n"
+                    last_event = time.monotonic()
+        finally:
+            engine.listeners.discard(queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+
+
+
 # -------------------------------------------------
 
 # ACCOUNT / POSITIONS / BALANCES
@@ -692,7 +3640,20 @@ async def search_instruments(
 # -------------------------------------------------
 
 
+async def primary_account_id() -> str:
+    """First account from /portfolio/accounts (the "primary" account)."""
+    accts = await ib_get("portfolio/accounts")
+    if not isinstance(accts, list) or not accts:
+        raise HTTPException(status_code=500, detail="No IBKR accounts returned")
+
+    account_id = accts[0].get("accountId") or accts[0].get("id") or accts[0].get("account")
+    if not account_id:
+        raise HTTPException(status_code=500, detail="Unable to determine IBKR account id")
+    return account_id
+
+
 @app.get("/account")
+@cached_route(ttl=5, stale=30)
 async def account(x_bridge_key: str = Header(None)):
     verify(x_bridge_key)
 
@@ -740,22 +3701,11 @@ async def account(x_bridge_key: str = Header(None)):
 
 
 @app.get("/positions")
+@cached_route(ttl=5, stale=30)
 async def positions(x_bridge_key: str = Header(None)):
     verify(x_bridge_key)
 
-    # Get accounts again
-    accts = await ib_get("portfolio/accounts")
-    if not isinstance(accts, list) or not accts:
-        raise HTTPException(status_code=500, detail="No IBKR accounts returned")
-
-    account_id = (
-        accts[0].get("accountId")
-        or accts[0].get("id")
-        or accts[0].get("account")
-    )
-
-    if not account_id:
-        raise HTTPException(status_code=500, detail="Unable to determine IBKR account id")
+    account_id = await primary_account_id()
 
     # Positions endpoint
     raw_positions = await ib_get(f"portfolio/{account_id}/positions")
@@ -792,6 +3742,7 @@ async def positions(x_bridge_key: str = Header(None)):
 
 
 @app.get("/orders")
+@cached_route(ttl=2, stale=10)
 async def orders(x_bridge_key: str = Header(None)):
     verify(x_bridge_key)
 
@@ -835,6 +3786,20 @@ async def account_summary(x_bridge_key: str = Header(None)):
 
     verify_key(x_bridge_key)
 
+    if SIM_TRADING:
+        engine = get_sim_engine()
+        positions = engine.position_models()
+        return AccountSummary(
+            equity=engine.equity(),
+            cash=engine.cash,
+            margin_available=engine.cash,
+            maintenance_margin=0.0,
+            pnl_day=engine.pnl_day(time.time()),
+            pnl_unrealized=sum(p.unrealized_pnl for p in positions),
+            pnl_realized=sum(p["realized_pnl"] for p in engine.positions.values()),
+            currency="USD",
+        )
+
 
 
     # TODO: IBKR account summary
@@ -869,6 +3834,9 @@ async def account_positions(x_bridge_key: str = Header(None)):
 
     verify_key(x_bridge_key)
 
+    if SIM_TRADING:
+        return {"ok": True, "data": get_sim_engine().position_models()}
+
 
 
     # TODO: IBKR portfolio positions
@@ -959,6 +3927,1268 @@ async def account_balances(x_bridge_key: str = Header(None)):
 
 
 
+# -------------------------------------------------
+# PORTFOLIO ANALYTICS
+# -------------------------------------------------
+
+# Snapshot field ids for option Greeks: 7308 = delta, 7309 = gamma, 7310 = theta, 7311 = vega
+GREEK_FIELDS = {"delta": "7308", "gamma": "7309", "theta": "7310", "vega": "7311"}
+OPTION_ASSET_CLASSES = ("OPT", "FOP", "WAR")
+ANALYTICS_CACHE_ENTRIES = 16
+
+# Position frames per holdings version (digest of conid + quantity per row);
+# prices, Greeks and rates are applied to the cached frame on every request
+_analytics_cache: "OrderedDict[tuple, dict]" = OrderedDict()
+
+
+async def option_greeks(conids: List[int]) -> dict[int, dict]:
+    """Per-contract Greeks from /iserver/marketdata/snapshot (preflight retried once, like market_snapshots)."""
+    if not conids:
+        return {}
+    fields = ",".join(GREEK_FIELDS.values())
+
+    async def fetch(ids: List[int]) -> dict[int, dict]:
+        rows = await ib_get(
+            f"iserver/marketdata/snapshot?conids={','.join(str(c) for c in ids)}&fields={fields}",
+            fallback=False,
+        )
+        return {
+            int(row["conid"]): row
+            for row in (rows if isinstance(rows, list) else [])
+            if row.get("conid") is not None
+        }
+
+    rows = await fetch(conids)
+    missing = [c for c in conids if snapshot_price(rows.get(c, {}), GREEK_FIELDS["delta"]) is None]
+    if missing:
+        rows.update(await fetch(missing))
+    return rows
+
+
+def snapshot_version(*parts) -> str:
+    return hashlib.blake2b(json.dumps(parts, sort_keys=True, default=str).encode(), digest_size=12).hexdigest()
+
+
+def grouped_sums(groups: tuple[np.ndarray, np.ndarray], *weights: np.ndarray) -> dict[str, list[float]]:
+    """{key: [sum of each weights array]} in one bincount pass per array; groups from np.unique(keys, return_inverse=True)."""
+    labels, index = groups
+    sums = [np.bincount(index, weights=w, minlength=len(labels)) for w in weights]
+    return {str(label): [float(s[i]) for s in sums] for i, label in enumerate(labels)}
+
+
+def ledger_rates(ledger) -> tuple[Optional[str], dict[str, float]]:
+    """(base currency, {currency: rate to base}) from a /portfolio/{id}/ledger response."""
+    rates = {}
+    for currency, entry in (ledger.items() if isinstance(ledger, dict) else ()):
+        rate = entry.get("exchangerate") if isinstance(entry, dict) and currency != "BASE" else None
+        if isinstance(rate, (int, float)) and rate > 0:
+            rates[currency] = float(rate)
+    base = next((c for c, rate in rates.items() if rate == 1.0), None)
+    return base, rates
+
+
+def analytics_rows(raw_positions) -> list[dict]:
+    """Open gateway position rows parsed for analytics; malformed rows are skipped."""
+    rows = []
+    for p in raw_positions if isinstance(raw_positions, list) else ():
+        try:
+            qty = float(p.get("position") or 0.0)
+            if qty == 0.0:
+                continue
+            rows.append({
+                "conid": int(p.get("conid") or 0),
+                "symbol": (p.get("ticker") or p.get("contractDesc") or "").strip(),
+                "underlying": p.get("undSym") or p.get("ticker") or p.get("contractDesc") or "",
+                "asset_class": p.get("assetClass") or "OTHER",
+                "currency": p.get("currency") or "USD",
+                "quantity": qty,
+                "multiplier": float(p.get("multiplier") or 0.0),
+                "market_value": float(p.get("mktValue") or 0.0),
+                "unrealized_pnl": float(p.get("unrealizedPnl") or 0.0),
+            })
+        except Exception:
+            # Skip any broken lines
+            continue
+    return rows
+
+
+def holdings_version(rows: list[dict]) -> str:
+    """Digest of what is held (contract, currency, quantity), independent of prices."""
+    return snapshot_version([(r["conid"], r["symbol"], r["currency"], r["quantity"]) for r in rows])
+
+
+def position_frame(rows: list[dict]) -> dict:
+    """Price-independent arrays and groupings for compute_portfolio_analytics."""
+    asset_classes = np.array([r["asset_class"] for r in rows])
+    currencies = np.array([r["currency"] for r in rows])
+    underlyings = np.array([r["underlying"] for r in rows])
+    is_option = np.isin(asset_classes, OPTION_ASSET_CLASSES)
+    multiplier = np.array([r["multiplier"] for r in rows])
+    return {
+        "symbols": np.array([r["symbol"] for r in rows]),
+        "asset_classes": asset_classes,
+        "currencies": currencies,
+        "conids": np.array([r["conid"] for r in rows]),
+        "qty": np.array([r["quantity"] for r in rows]),
+        "is_option": is_option,
+        "multiplier": np.where(multiplier > 0, multiplier, np.where(is_option, 100.0, 1.0)),
+        "by_asset_class": np.unique(asset_classes, return_inverse=True),
+        "by_currency": np.unique(currencies, return_inverse=True),
+        "by_underlying": np.unique(underlyings, return_inverse=True),
+    }
+
+
+def compute_portfolio_analytics(rows: list[dict], greeks: dict[int, dict], top: int,
+                                base: Optional[str] = None, rates: Optional[dict[str, float]] = None,
+                                frame: Optional[dict] = None) -> dict:
+    """
+    Exposure, breakdowns, concentration and Greeks over analytics_rows(),
+    vectorized across positions. by_currency is in each currency's own units.
+    Totals, asset-class breakdowns and weights are in `currency`: the positions'
+    only currency, or `base` via `rates` (ledger exchange rates). With several
+    currencies and a missing rate they are null rather than mixed. `frame` is
+    position_frame(rows), which callers may cache per holdings_version(rows).
+    """
+    if not rows:
+        return {
+            "positions": 0,
+            "currency": None,
+            "exposure": {"gross": 0.0, "net": 0.0, "long": 0.0, "short": 0.0, "unrealized_pnl": 0.0},
+            "by_asset_class": {},
+            "by_currency": {},
+            "concentration": {"top": [], "top_share": 0.0, "hhi": 0.0},
+            "greeks": {"total": {g: 0.0 for g in GREEK_FIELDS}, "by_underlying": {}, "options_missing_greeks": 0},
+        }
+
+    frame = frame if frame is not None else position_frame(rows)
+    symbols, asset_classes, currencies = frame["symbols"], frame["asset_classes"], frame["currencies"]
+    conids, qty, is_option, multiplier = frame["conids"], frame["qty"], frame["is_option"], frame["multiplier"]
+    value = np.array([r["market_value"] for r in rows])
+    pnl = np.array([r["unrealized_pnl"] for r in rows])
+
+    distinct = set(currencies.tolist())
+    if len(distinct) == 1:
+        currency, rate = distinct.pop(), np.ones_like(value)
+    elif rates and distinct <= set(rates):
+        currency, rate = base, np.array([rates[c] for c in currencies])
+    else:
+        currency, rate = None, None
+
+    by_currency = {
+        k: {"gross": g, "net": n} for k, (g, n) in grouped_sums(frame["by_currency"], np.abs(value), value).items()
+    }
+    if rate is None:
+        # Market values in different currencies don't add up
+        exposure = {"gross": None, "net": None, "long": None, "short": None, "unrealized_pnl": None}
+        by_class = {}
+        for entry in by_currency.values():
+            entry["weight"] = None
+        concentration = {"top": [], "top_share": None, "hhi": None}
+    else:
+        value, pnl = value * rate, pnl * rate
+        abs_value = np.abs(value)
+        gross = float(abs_value.sum())
+        exposure = {
+            "gross": gross,
+            "net": float(value.sum()),
+            "long": float(value[value > 0].sum()),
+            "short": float(value[value < 0].sum()),
+            "unrealized_pnl": float(pnl.sum()),
+        }
+        by_class = {
+            k: {"gross": g, "net": n, "unrealized_pnl": u, "weight": g / gross if gross else 0.0}
+            for k, (g, n, u) in grouped_sums(frame["by_asset_class"], abs_value, value, pnl).items()
+        }
+        for k, (g,) in grouped_sums(frame["by_currency"], abs_value).items():
+            by_currency[k]["weight"] = g / gross if gross else 0.0
+
+        weights = abs_value / gross if gross else np.zeros_like(abs_value)
+        order = np.argsort(-abs_value, kind="stable")[:top]
+        concentration = {
+            "top": [
+                {"symbol": str(symbols[i]), "market_value": float(value[i]), "weight": float(weights[i])}
+                for i in order
+            ],
+            "top_share": float(weights[order].sum()),
+            "hhi": float(np.square(weights).sum()),
+        }
+
+    # Greeks: stocks contribute delta = shares; options greek x qty x multiplier
+    per_position = {}
+    for name, field in GREEK_FIELDS.items():
+        per_contract = np.array([snapshot_price(greeks.get(int(c), {}), field) or 0.0 for c in conids])
+        per_position[name] = np.where(is_option, per_contract * qty * multiplier, 0.0)
+    per_position["delta"] = per_position["delta"] + np.where(asset_classes == "STK", qty, 0.0)
+    names = list(per_position)
+    by_underlying = {
+        k: dict(zip(names, sums))
+        for k, sums in grouped_sums(frame["by_underlying"], *(per_position[n] for n in names)).items()
+    }
+
+    return {
+        "positions": len(rows),
+        "currency": currency,
+        "exposure": exposure,
+        "by_asset_class": by_class,
+        "by_currency": by_currency,
+        "concentration": concentration,
+        "greeks": {
+            "total": {n: float(per_position[n].sum()) for n in names},
+            "by_underlying": by_underlying,
+            "options_missing_greeks": int(sum(
+                1 for c, opt in zip(conids, is_option)
+                if opt and snapshot_price(greeks.get(int(c), {}), GREEK_FIELDS["delta"]) is None
+            )),
+        },
+    }
+
+
+@app.get("/portfolio/analytics")
+@cached_route(ttl=5, stale=30)
+async def portfolio_analytics(
+    top: int = Query(10, ge=1, le=100, description="Positions listed in the concentration table"),
+    x_bridge_key: str = Header(None),
+):
+    """
+    Summary analytics over the primary account's positions: gross/net/long/short
+    exposure, per-asset-class and per-currency breakdowns, top-N concentration
+    (with HHI) and option Greeks rolled up per underlying. Multi-currency
+    accounts are converted to the base currency with the ledger's exchange
+    rates. The position frame is rebuilt only when holdings change; prices,
+    Greeks and rates are applied to it on every call.
+    """
+    verify_key(x_bridge_key)
+
+    account_id = await primary_account_id()
+    rows = analytics_rows(await ib_get(f"portfolio/{account_id}/positions"))
+
+    option_conids = sorted({
+        r["conid"] for r in rows
+        if r["conid"] and r["asset_class"] in OPTION_ASSET_CLASSES
+    })
+    try:
+        greeks = await option_greeks(option_conids)
+    except HTTPException:
+        greeks = {}
+
+    base, rates = None, {}
+    if len({r["currency"] for r in rows}) > 1:
+        try:
+            base, rates = ledger_rates(await ib_get(f"portfolio/{account_id}/ledger"))
+        except HTTPException:
+            pass
+
+    version = holdings_version(rows)
+    key = (account_id, version)
+    frame = _analytics_cache.get(key)
+    if frame is None:
+        frame = _analytics_cache[key] = position_frame(rows)
+        while len(_analytics_cache) > ANALYTICS_CACHE_ENTRIES:
+            _analytics_cache.popitem(last=False)
+    else:
+        _analytics_cache.move_to_end(key)
+
+    result = compute_portfolio_analytics(rows, greeks, top, base, rates, frame)
+    return {"ok": True, "accountId": account_id, "version": version, **result}
+
+
+
+
+
+# -------------------------------------------------
+
+# EQUITY CURVE
+
+# -------------------------------------------------
+
+
+# Net liquidation per account in SQLite, one row per sample, with the running
+# peak and running max drawdown stored at insert. Each worker keeps the series
+# in memory as NumPy columns plus prefix sums of log returns, so a range query
+# is two binary searches and O(1) return/volatility; only rows newer than the
+# last one loaded are read back from disk (the poller worker writes them).
+
+YEAR_SECONDS = 365 * 24 * 3600
+
+
+class EquitySeries:
+    __slots__ = ("ts", "equity", "peak", "max_drawdown", "unrealized_pnl", "realized_pnl", "cum_ret", "cum_ret2")
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, np.empty(0))
+
+    def extend(self, rows: list):
+        """Append rows (ts, equity, peak, max_drawdown, unrealized, realized) and extend the prefix sums."""
+        data = np.array(rows, dtype=float).reshape(-1, 6)
+        equity = data[:, 1]
+        previous = self.equity[-1:] if len(self.equity) else equity[:1]
+        ret = np.diff(np.log(np.concatenate([previous, equity])))
+        base, base2 = (self.cum_ret[-1], self.cum_ret2[-1]) if len(self.cum_ret) else (0.0, 0.0)
+
+        for name, column in zip(("ts", "equity", "peak", "max_drawdown", "unrealized_pnl", "realized_pnl"), data.T):
+            setattr(self, name, np.concatenate([getattr(self, name), column]))
+        self.cum_ret = np.concatenate([self.cum_ret, base + np.cumsum(ret)])
+        self.cum_ret2 = np.concatenate([self.cum_ret2, base2 + np.cumsum(ret * ret)])
+
+
+class EquityStore:
+    def __init__(self, filename: str):
+        self.conn = sqlite3.connect(filename, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS equity ("
+            " account TEXT NOT NULL, ts REAL NOT NULL, equity REAL NOT NULL,"
+            " peak REAL NOT NULL, max_drawdown REAL NOT NULL,"
+            " unrealized_pnl REAL NOT NULL, realized_pnl REAL NOT NULL,"
+            " PRIMARY KEY (account, ts)) WITHOUT ROWID"
+        )
+        self.series: dict[str, EquitySeries] = {}
+
+    def load(self, account: str) -> EquitySeries:
+        """The account's series, including samples appended since the last load."""
+        series = self.series.setdefault(account, EquitySeries())
+        after = series.ts[-1] if len(series.ts) else -1.0
+        rows = self.conn.execute(
+            "SELECT ts, equity, peak, max_drawdown, unrealized_pnl, realized_pnl FROM equity"
+            " WHERE account = ? AND ts > ? ORDER BY ts",
+            (account, after),
+        ).fetchall()
+        if rows:
+            series.extend(rows)
+        return series
+
+    def append(self, account: str, ts: float, equity: float, unrealized_pnl: float, realized_pnl: float):
+        series = self.load(account)
+        if len(series.ts) and ts <= series.ts[-1]:
+            return
+        peak = max(equity, series.peak[-1]) if len(series.peak) else equity
+        max_drawdown = min(equity / peak - 1.0, series.max_drawdown[-1] if len(series.max_drawdown) else 0.0)
+        self.conn.execute(
+            "INSERT OR IGNORE INTO equity VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (account, ts, equity, peak, max_drawdown, unrealized_pnl, realized_pnl),
+        )
+        self.load(account)
+
+
+_equity_store: Optional[EquityStore] = None
+
+
+def get_equity_store() -> EquityStore:
+    global _equity_store
+    if _equity_store is None:
+        _equity_store = EquityStore(EQUITY_DB_FILE)
+    return _equity_store
+
+
+async def sample_equity():
+    """Record one net liquidation / P&L sample for the primary account."""
+    account_id = await primary_account_id()
+    # No last-good fallback: a stale summary would be stored under the current time
+    summary = await ib_get(f"portfolio/{account_id}/summary", fallback=False, priority=PRIORITY_HISTORY)
+    equity = summary_metric(summary, "netliquidation")
+    if equity <= 0:
+        return
+    get_equity_store().append(
+        account_id,
+        time.time(),
+        equity,
+        summary_metric(summary, "unrealizedpnl"),
+        summary_metric(summary, "realizedpnl"),
+    )
+
+
+async def equity_sampler_loop():
+    """
+    Sample every EQUITY_SAMPLE_INTERVAL while the session is authenticated.
+    Runs in the worker that talks to the gateway (single worker or poller).
+    """
+    while True:
+        if not _session_health["authenticated"]:
+            await asyncio.sleep(AUTH_RECHECK_INTERVAL)
+            continue
+        try:
+            await sample_equity()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Warning: equity sample failed: {e}")
+        await asyncio.sleep(EQUITY_SAMPLE_INTERVAL)
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: indices of n points that keep the curve's visual shape."""
+    size = len(x)
+    if n >= size or n < 3:
+        return np.arange(size)
+
+    # n - 2 buckets between the fixed first and last points
+    edges = np.linspace(1, size - 1, n - 1).astype(int)
+    chosen = np.empty(n, dtype=int)
+    chosen[0], chosen[-1] = 0, size - 1
+    a = 0
+    for i in range(n - 2):
+        start, stop = edges[i], max(edges[i + 1], edges[i] + 1)
+        next_stop = edges[i + 2] if i + 2 < len(edges) else size
+        next_x = x[stop:max(next_stop, stop + 1)].mean()
+        next_y = y[stop:max(next_stop, stop + 1)].mean()
+        area = np.abs((x[a] - next_x) * (y[start:stop] - y[a]) - (x[a] - x[start:stop]) * (next_y - y[a]))
+        a = start + int(area.argmax())
+        chosen[i + 1] = a
+    return chosen
+
+
+def minmax_indices(y: np.ndarray, n: int) -> np.ndarray:
+    """First, last, and the min and max of n/2 equal buckets (never drops a spike)."""
+    size = len(y)
+    if n >= size:
+        return np.arange(size)
+
+    edges = np.linspace(0, size, max(1, (n - 2) // 2) + 1).astype(int)
+    picks = [0, size - 1]
+    for start, stop in zip(edges[:-1], edges[1:]):
+        if stop > start:
+            segment = y[start:stop]
+            picks.extend((start + int(segment.argmin()), start + int(segment.argmax())))
+    return np.unique(picks)
+
+
+def equity_range_stats(series: EquitySeries, lo: int, hi: int) -> dict:
+    """Return, max drawdown and annualized volatility of samples [lo, hi)."""
+    count = hi - lo
+    if count < 2:
+        equity = float(series.equity[lo]) if count else None
+        return {
+            "samples": count,
+            "start_equity": equity,
+            "end_equity": equity,
+            "return": 0.0,
+            "max_drawdown": 0.0,
+            "max_drawdown_at": None,
+            "volatility": 0.0,
+            "all_time_max_drawdown": float(series.max_drawdown[hi - 1]) if count else None,
+        }
+
+    equity = series.equity[lo:hi]
+    # Within the range the peak restarts at the first sample
+    drawdown = equity / np.maximum.accumulate(equity) - 1.0
+    trough = int(drawdown.argmin())
+
+    # Log returns of samples lo+1 .. hi-1 from the prefix sums
+    periods = count - 1
+    total = series.cum_ret[hi - 1] - series.cum_ret[lo]
+    total2 = series.cum_ret2[hi - 1] - series.cum_ret2[lo]
+    variance = max(0.0, (total2 - total * total / periods) / (periods - 1)) if periods > 1 else 0.0
+    span = series.ts[hi - 1] - series.ts[lo]
+    periods_per_year = periods * YEAR_SECONDS / span if span > 0 else 0.0
+
+    return {
+        "samples": count,
+        "start_equity": float(equity[0]),
+        "end_equity": float(equity[-1]),
+        "return": float(equity[-1] / equity[0] - 1.0),
+        "max_drawdown": float(drawdown[trough]),
+        "max_drawdown_at": datetime.utcfromtimestamp(series.ts[lo + trough]),
+        "volatility": math.sqrt(variance * periods_per_year),
+        "all_time_max_drawdown": float(series.max_drawdown[hi - 1]),
+    }
+
+
+def unix_seconds(value: datetime) -> float:
+    """Naive datetimes are UTC, like every other timestamp the bridge returns."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+@app.get("/account/equity-curve")
+@cached_route(ttl=10, stale=60)
+async def account_equity_curve(
+    start: Optional[datetime] = Query(None, description="Range start (UTC); default one year before end"),
+    end: Optional[datetime] = Query(None, description="Range end (UTC); default now"),
+    points: int = Query(500, ge=10, le=5000, description="Maximum points returned"),
+    method: str = Query("lttb", pattern="^(lttb|minmax)$", description="Downsampling: lttb or minmax buckets"),
+    x_bridge_key: str = Header(None),
+):
+    """
+    Sampled net liquidation of the primary account over [start, end],
+    downsampled to at most `points`. Columns: ts (unix seconds), equity,
+    drawdown (from the all-time running peak), unrealized_pnl, realized_pnl.
+    Stats cover the requested range.
+    """
+    verify_key(x_bridge_key)
+
+    account_id = await primary_account_id()
+    series = get_equity_store().load(account_id)
+
+    end_ts = unix_seconds(end) if end else time.time()
+    start_ts = unix_seconds(start) if start else end_ts - YEAR_SECONDS
+    if start_ts > end_ts:
+        raise HTTPException(status_code=400, detail="start must be before end")
+
+    lo = int(np.searchsorted(series.ts, start_ts, side="left"))
+    hi = int(np.searchsorted(series.ts, end_ts, side="right"))
+    ts, equity = series.ts[lo:hi], series.equity[lo:hi]
+
+    if method == "minmax":
+        picks = minmax_indices(equity, points)
+    else:
+        picks = lttb_indices(ts, equity, points)
+    rows = picks + lo
+
+    return {
+        "ok": True,
+        "accountId": account_id,
+        "method": method,
+        "interval": EQUITY_SAMPLE_INTERVAL,
+        "ts": series.ts[rows].astype(int).tolist(),
+        "equity": series.equity[rows].tolist(),
+        "drawdown": (series.equity[rows] / series.peak[rows] - 1.0).tolist(),
+        "unrealized_pnl": series.unrealized_pnl[rows].tolist(),
+        "realized_pnl": series.realized_pnl[rows].tolist(),
+        "stats": equity_range_stats(series, lo, hi),
+    }
+
+
+
+
+
+# -------------------------------------------------
+
+# PAPER TRADING
+
+# -------------------------------------------------
+
+
+# In-memory matching engine behind /orders/* and /account/* when SIM_TRADING
+# is on. Orders match against the quote feed (live, or replayed through the
+# bench gateway): buys against the ask, sells against the bid, stops against
+# the last price. Resting orders of each symbol sit in price levels (sorted
+# prices + FIFO queue per price), so a tick only touches the levels it
+# crosses. Orders fill in full. Nothing here talks to the gateway except for a
+# quote when an order arrives and the feed has none.
+
+SIM_ORDER_TYPES = ("market", "limit", "stop", "stop_limit")
+SIM_TIME_IN_FORCE = ("DAY", "GTC", "IOC")
+
+
+def session_close_after(now: float) -> float:
+    """
+    Epoch seconds of the first regular-session close (SIM_SESSION_CLOSE in
+    SIM_EXCHANGE_TZ, Monday-Friday) after `now`. Exchange holidays and early
+    closes are not modelled.
+    """
+    tz = ZoneInfo(SIM_EXCHANGE_TZ)
+    local = datetime.fromtimestamp(now, tz)
+    close = local.replace(hour=SIM_SESSION_CLOSE[0], minute=SIM_SESSION_CLOSE[1], second=0, microsecond=0)
+    if close <= local:
+        close += timedelta(days=1)
+    while close.weekday() >= 5:
+        close += timedelta(days=1)
+    return close.timestamp()
+
+
+class SimOrder:
+    __slots__ = ("id", "conid", "symbol", "side", "type", "qty", "limit_price", "stop_price",
+                 "time_in_force", "status", "filled_qty", "fill_price", "created_at", "updated_at", "expires_at")
+
+    def __init__(self, order_id: str, conid: int, req: PlaceOrderRequest, now: float):
+        self.id = order_id
+        self.conid = conid
+        self.symbol = req.symbol.strip().upper()
+        self.side = req.side.lower()
+        self.type = req.type.lower()
+        self.qty = req.qty
+        self.limit_price = req.limit_price
+        self.stop_price = req.stop_price
+        self.time_in_force = (req.time_in_force or "DAY").upper()
+        self.status = "open"
+        self.filled_qty = 0.0
+        self.fill_price: Optional[float] = None
+        self.created_at = self.updated_at = now
+        # DAY orders expire at the next regular-session close
+        self.expires_at = session_close_after(now) if self.time_in_force == "DAY" else math.inf
+
+    def to_model(self) -> Order:
+        return Order(
+            id=self.id,
+            symbol=self.symbol,
+            side=self.side,
+            type=self.type,
+            status=self.status,
+            qty=self.qty,
+            filled_qty=self.filled_qty,
+            limit_price=self.limit_price,
+            stop_price=self.stop_price,
+            time_in_force=self.time_in_force,
+            created_at=datetime.utcfromtimestamp(self.created_at),
+            updated_at=datetime.utcfromtimestamp(self.updated_at),
+        )
+
+
+class PriceLevels:
+    """Orders keyed by price: sorted price list plus a FIFO queue per price."""
+
+    __slots__ = ("prices", "queues")
+
+    def __init__(self):
+        self.prices: List[float] = []
+        self.queues: dict[float, deque] = {}
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    def add(self, price: float, order: SimOrder):
+        queue = self.queues.get(price)
+        if queue is None:
+            queue = self.queues[price] = deque()
+            bisect.insort(self.prices, price)
+        queue.append(order)
+
+    def remove(self, price: float, order: SimOrder):
+        queue = self.queues.get(price)
+        if queue is None:
+            return
+        try:
+            queue.remove(order)
+        except ValueError:
+            return
+        if not queue:
+            del self.queues[price]
+            del self.prices[bisect.bisect_left(self.prices, price)]
+
+    def pop_at_or_above(self, price: float) -> List[SimOrder]:
+        """Orders at levels >= price, best (highest) level first."""
+        i = bisect.bisect_left(self.prices, price)
+        return self.pop_levels(self.prices[i:][::-1], i, len(self.prices))
+
+    def pop_at_or_below(self, price: float) -> List[SimOrder]:
+        """Orders at levels <= price, best (lowest) level first."""
+        i = bisect.bisect_right(self.prices, price)
+        return self.pop_levels(self.prices[:i], 0, i)
+
+    def pop_levels(self, levels: List[float], lo: int, hi: int) -> List[SimOrder]:
+        orders = []
+        for level in levels:
+            orders.extend(self.queues.pop(level))
+        del self.prices[lo:hi]
+        return orders
+
+
+class SimBook:
+    """Resting orders of one conid."""
+
+    __slots__ = ("buy_limits", "sell_limits", "buy_stops", "sell_stops", "markets")
+
+    def __init__(self):
+        self.buy_limits = PriceLevels()
+        self.sell_limits = PriceLevels()
+        self.buy_stops = PriceLevels()    # trigger when last >= stop
+        self.sell_stops = PriceLevels()   # trigger when last <= stop
+        self.markets: deque = deque()     # market orders waiting for a first quote
+
+    def __len__(self) -> int:
+        return (len(self.buy_limits) + len(self.sell_limits) + len(self.buy_stops)
+                + len(self.sell_stops) + len(self.markets))
+
+
+class SimEngine:
+    """
+    Orders, fills, positions and cash of one simulated account. Time comes
+    from the caller (`now`, tick.ts), so the same engine runs live on the
+    quote feed and in backtests.
+    """
+
+    def __init__(self, starting_cash: float = SIM_STARTING_CASH, fee_per_share: float = SIM_FEE_PER_SHARE,
+                 fee_min: float = SIM_FEE_MIN):
+        self.starting_cash = starting_cash
+        self.fee_per_share = fee_per_share
+        self.fee_min = fee_min
+        self.cash = starting_cash
+        self.orders: dict[str, SimOrder] = {}
+        self.open_ids: dict[str, SimOrder] = {}
+        self.trades: List[Trade] = []
+        # symbol -> {"conid", "qty", "avg_price", "realized_pnl"}
+        self.positions: dict[str, dict] = {}
+        self.books: dict[int, SimBook] = {}
+        self.marks: dict[int, float] = {}
+        self.expiries: list = []          # heap of (expires_at, order id)
+        self.order_seq = itertools.count(1)
+        self.trade_seq = itertools.count(1)
+        # Equity at the last session close, for pnl_day; rolled by roll_day()
+        self.day_start_equity = starting_cash
+        self.day_ends_at = 0.0
+        # Backtests: open of the bar being replayed, per conid (see activate)
+        self.bar_opens: dict[int, float] = {}
+        # Conids needing quotes; on_watch_change(conid, watching) is called as one
+        # enters or leaves the set (live: watch/unwatch it on the feed)
+        self.watched: set = set()
+        self.on_watch_change = None
+
+    # --- orders ---
+
+    def place(self, req: PlaceOrderRequest, conid: int, tick: Optional[Tick], now: float) -> SimOrder:
+        order = SimOrder(f"SIM-{next(self.order_seq)}", conid, req, now)
+        self.orders[order.id] = order
+        self.open_ids[order.id] = order
+        if order.expires_at != math.inf:
+            heapq.heappush(self.expiries, (order.expires_at, order.id))
+        if tick is not None:
+            self.marks[conid] = tick.last
+
+        book = self.book(conid)
+        if order.type in ("stop", "stop_limit"):
+            if tick is not None and self.stop_triggered(order, tick.last):
+                self.activate(order, tick)
+            else:
+                (book.buy_stops if order.side == "buy" else book.sell_stops).add(order.stop_price, order)
+        elif tick is None:
+            if order.type == "market":
+                book.markets.append(order)
+            else:
+                (book.buy_limits if order.side == "buy" else book.sell_limits).add(order.limit_price, order)
+        else:
+            self.activate(order, tick)
+
+        if order.status == "open" and order.time_in_force == "IOC":
+            self.unrest(order)
+            self.close(order, "cancelled", now)
+        self.prune(conid)
+        self.watch_changed(order)
+        return order
+
+    def cancel(self, order_id: str, now: float) -> Optional[SimOrder]:
+        order = self.open_ids.get(order_id)
+        if order is None:
+            return None
+        self.unrest(order)
+        self.close(order, "cancelled", now)
+        self.prune(order.conid)
+        self.watch_changed(order)
+        return order
+
+    def book(self, conid: int) -> SimBook:
+        book = self.books.get(conid)
+        if book is None:
+            book = self.books[conid] = SimBook()
+        return book
+
+    def prune(self, conid: int):
+        book = self.books.get(conid)
+        if book is not None and not len(book):
+            del self.books[conid]
+
+    def unrest(self, order: SimOrder):
+        """Take a resting order off its book (cancel, expiry)."""
+        book = self.books.get(order.conid)
+        if book is None:
+            return
+        if order in book.markets:
+            book.markets.remove(order)
+        if order.type in ("stop", "stop_limit"):
+            (book.buy_stops if order.side == "buy" else book.sell_stops).remove(order.stop_price, order)
+        if order.limit_price is not None:
+            (book.buy_limits if order.side == "buy" else book.sell_limits).remove(order.limit_price, order)
+
+    def close(self, order: SimOrder, status: str, now: float):
+        order.status = status
+        order.updated_at = now
+        self.open_ids.pop(order.id, None)
+
+    def expire(self, now: float):
+        while self.expiries and self.expiries[0][0] <= now:
+            _, order_id = heapq.heappop(self.expiries)
+            order = self.open_ids.get(order_id)
+            if order is not None:
+                self.unrest(order)
+                self.close(order, "expired", now)
+                self.prune(order.conid)
+                self.watch_changed(order)
+
+    # --- matching ---
+
+    @staticmethod
+    def stop_triggered(order: SimOrder, last: float) -> bool:
+        return last >= order.stop_price if order.side == "buy" else last <= order.stop_price
+
+    def activate(self, order: SimOrder, tick: Tick):
+        """A market order, or a triggered stop: fill at the quote if marketable, else rest as a limit."""
+        buying = order.side == "buy"
+        quote = (tick.ask if buying else tick.bid) or tick.last
+        bar_open = self.bar_opens.get(tick.conid)
+        if bar_open is not None and order.type in ("stop", "stop_limit"):
+            # Replayed bars jump between o/h/l/c; the price crossed the stop on the
+            # way unless the bar opened through it
+            quote = max(order.stop_price, bar_open) if buying else min(order.stop_price, bar_open)
+        if order.type in ("market", "stop"):
+            self.fill(order, quote, tick.ts)
+        elif (quote <= order.limit_price) if buying else (quote >= order.limit_price):
+            self.fill(order, quote, tick.ts)
+        else:
+            book = self.book(order.conid)
+            (book.buy_limits if buying else book.sell_limits).add(order.limit_price, order)
+
+    def on_tick(self, tick: Tick):
+        self.roll_day(tick.ts)
+        self.marks[tick.conid] = tick.last
+        self.expire(tick.ts)
+        book = self.books.get(tick.conid)
+        if book is None:
+            return
+        # Any order that left a book, to re-check whether the conid is still watched
+        moved: Optional[SimOrder] = None
+
+        triggered = book.buy_stops.pop_at_or_below(tick.last) + book.sell_stops.pop_at_or_above(tick.last)
+        for order in triggered:
+            self.activate(order, tick)
+            moved = order
+        while book.markets:
+            moved = book.markets.popleft()
+            self.activate(moved, tick)
+
+        # Resting limits fill at their own price once the opposite side reaches it
+        ask, bid = tick.ask or tick.last, tick.bid or tick.last
+        for order in book.buy_limits.pop_at_or_above(ask):
+            self.fill(order, order.limit_price, tick.ts)
+            moved = order
+        for order in book.sell_limits.pop_at_or_below(bid):
+            self.fill(order, order.limit_price, tick.ts)
+            moved = order
+
+        self.prune(tick.conid)
+        if moved is not None:
+            self.watch_changed(moved)
+
+    def fill(self, order: SimOrder, price: float, now: float):
+        qty = order.qty - order.filled_qty
+        fee = max(self.fee_min, self.fee_per_share * qty) if self.fee_per_share or self.fee_min else 0.0
+        signed = qty if order.side == "buy" else -qty
+
+        self.cash -= signed * price + fee
+        position = self.positions.setdefault(
+            order.symbol, {"conid": order.conid, "qty": 0.0, "avg_price": 0.0, "realized_pnl": 0.0}
+        )
+        held = position["qty"]
+        if held == 0 or (held > 0) == (signed > 0):
+            position["avg_price"] = (held * position["avg_price"] + signed * price) / (held + signed)
+        else:
+            closed = min(abs(held), abs(signed))
+            position["realized_pnl"] += closed * (price - position["avg_price"]) * (1 if held > 0 else -1)
+            if abs(signed) > abs(held):
+                # Flipped: the remainder opens at the fill price
+                position["avg_price"] = price
+        position["qty"] = held + signed
+        position["realized_pnl"] -= fee
+        self.marks[order.conid] = self.marks.get(order.conid, price)
+
+        order.filled_qty = order.qty
+        order.fill_price = price
+        self.close(order, "filled", now)
+        self.trades.append(Trade(
+            trade_id=f"SIMT-{next(self.trade_seq)}",
+            order_id=order.id,
+            symbol=order.symbol,
+            side=order.side,
+            qty=qty,
+            price=price,
+            fee=fee,
+            timestamp=datetime.utcfromtimestamp(now),
+        ))
+
+    # --- views ---
+
+    def watched_conids(self) -> set:
+        """Conids needing quotes: resting orders and open positions (for marks)."""
+        return set(self.books) | {p["conid"] for p in self.positions.values() if p["qty"]}
+
+    def watch_changed(self, order: SimOrder):
+        """Update `watched` for the conid of an order that rested, filled or left its book."""
+        conid = order.conid
+        position = self.positions.get(order.symbol)
+        watching = conid in self.books or bool(position and position["qty"])
+        if watching == (conid in self.watched):
+            return
+        if watching:
+            self.watched.add(conid)
+        else:
+            self.watched.discard(conid)
+        if self.on_watch_change is not None:
+            self.on_watch_change(conid, watching)
+
+    def position_models(self) -> List[Position]:
+        models = []
+        for symbol, p in self.positions.items():
+            if not p["qty"]:
+                continue
+            mark = self.marks.get(p["conid"], p["avg_price"])
+            models.append(Position(
+                symbol=symbol,
+                asset_class="STK",
+                qty=p["qty"],
+                avg_price=p["avg_price"],
+                market_price=mark,
+                market_value=p["qty"] * mark,
+                unrealized_pnl=p["qty"] * (mark - p["avg_price"]),
+                realized_pnl_day=p["realized_pnl"],
+                currency="USD",
+                exchange="SIM",
+            ))
+        return models
+
+    def equity(self) -> float:
+        return self.cash + sum(
+            p["qty"] * self.marks.get(p["conid"], p["avg_price"]) for p in self.positions.values()
+        )
+
+    def roll_day(self, now: float):
+        """Past the session close: snapshot equity (marks before this tick) as the new day's start."""
+        if now >= self.day_ends_at:
+            self.day_start_equity = self.equity()
+            self.day_ends_at = session_close_after(now)
+
+    def pnl_day(self, now: float) -> float:
+        self.roll_day(now)
+        return self.equity() - self.day_start_equity
+
+
+def validate_order_request(req: PlaceOrderRequest):
+    """400 for requests the matching engine can't represent."""
+    if req.side.lower() not in ("buy", "sell"):
+        raise HTTPException(status_code=400, detail="side must be buy or sell")
+    if req.type.lower() not in SIM_ORDER_TYPES:
+        raise HTTPException(status_code=400, detail=f"type must be one of {', '.join(SIM_ORDER_TYPES)}")
+    if req.qty <= 0:
+        raise HTTPException(status_code=400, detail="qty must be positive")
+    if req.type.lower() in ("limit", "stop_limit") and not req.limit_price:
+        raise HTTPException(status_code=400, detail=f"{req.type} orders need limit_price")
+    if req.type.lower() in ("stop", "stop_limit") and not req.stop_price:
+        raise HTTPException(status_code=400, detail=f"{req.type} orders need stop_price")
+    if (req.time_in_force or "DAY").upper() not in SIM_TIME_IN_FORCE:
+        raise HTTPException(status_code=400, detail=f"time_in_force must be one of {', '.join(SIM_TIME_IN_FORCE)}")
+
+
+_sim_engine: Optional[SimEngine] = None
+
+
+def get_sim_engine() -> SimEngine:
+    global _sim_engine
+    if _sim_engine is None:
+        _sim_engine = SimEngine()
+        _sim_engine.on_watch_change = sim_watch_changed
+    return _sim_engine
+
+
+def sim_watch_changed(conid: int, watching: bool):
+    if watching:
+        _quote_feed.watch("sim", conid, get_sim_engine().on_tick)
+    else:
+        _quote_feed.unwatch("sim", conid)
+
+
+async def sim_quote(conid: int) -> Optional[Tick]:
+    """Quote for an arriving order: the feed's if fresh, else one snapshot."""
+    latest = _quote_feed.latest.get(conid)
+    if latest is not None and time.time() - latest.ts < SIM_QUOTE_MAX_AGE:
+        return latest
+    try:
+        row = (await market_snapshots([conid])).get(conid, {})
+    except HTTPException:
+        return None
+    last = snapshot_price(row, "31")
+    if last is None:
+        return None
+    return Tick(conid, last, snapshot_price(row, "84"), snapshot_price(row, "86"))
+
+
+@app.get("/sim/status")
+async def sim_status(x_bridge_key: str = Header(None)):
+    """Paper account state: cash, equity, order/trade counts and resting orders per symbol."""
+    verify_key(x_bridge_key)
+    engine = get_sim_engine()
+    return {
+        "ok": True,
+        "enabled": SIM_TRADING,
+        "cash": engine.cash,
+        "equity": engine.equity(),
+        "starting_cash": engine.starting_cash,
+        "orders": len(engine.orders),
+        "open_orders": len(engine.open_ids),
+        "trades": len(engine.trades),
+        "resting_by_conid": {conid: len(book) for conid, book in engine.books.items()},
+        "feed": _quote_feed.status(),
+    }
+
+
+@app.post("/sim/reset")
+async def sim_reset(
+    starting_cash: float = Query(SIM_STARTING_CASH, gt=0),
+    x_bridge_key: str = Header(None),
+):
+    """Drop every simulated order, trade and position and start over with `starting_cash`."""
+    verify_key(x_bridge_key)
+    global _sim_engine
+    _sim_engine = None
+    engine = get_sim_engine()
+    engine.starting_cash = engine.cash = starting_cash
+    _quote_feed.unsubscribe("sim")
+    return {"ok": True, "starting_cash": starting_cash}
+
+
+
+
+
+# -------------------------------------------------
+
+# BACKTESTING
+
+# -------------------------------------------------
+
+
+# Event-driven backtests over the bar store on the paper-trading engine.
+# Strategies see each closed bar and answer with PlaceOrderRequests; the
+# engine matches them against the following bars (open, then high/low in
+# the likelier order, then close, as ticks), so fills, positions and P&L
+# follow the same rules as /orders/place in sim mode. Parameter sets run in
+# a process pool, one backtest per task.
+
+BACKTEST_MAX_RUNS = 500
+
+# Backtest workers are spawned, not forked: a fork would copy the event loop and its threads
+_backtest_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_backtest_pool() -> ProcessPoolExecutor:
+    global _backtest_pool
+    if _backtest_pool is None:
+        _backtest_pool = ProcessPoolExecutor(max_workers=BACKTEST_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _backtest_pool
+
+
+def strategy_sma_cross(bars: BarSeries, tf: str, symbol: str, params: dict):
+    """Long when the fast SMA crosses above the slow one, flat when it crosses back."""
+    fast = compute_indicator("sma", (int(params.get("fast", 10)),), tf, bars, 0, {})["value"]
+    slow = compute_indicator("sma", (int(params.get("slow", 30)),), tf, bars, 0, {})["value"]
+    qty = float(params.get("qty", 100))
+
+    def on_bar(i: int, held: float, engine: SimEngine) -> List[PlaceOrderRequest]:
+        if i == 0 or np.isnan(slow[i - 1]) or np.isnan(fast[i - 1]):
+            return []
+        if fast[i - 1] <= slow[i - 1] and fast[i] > slow[i] and held <= 0:
+            return [PlaceOrderRequest(symbol=symbol, side="buy", type="market", qty=qty - held, time_in_force="GTC")]
+        if fast[i - 1] >= slow[i - 1] and fast[i] < slow[i] and held > 0:
+            return [PlaceOrderRequest(symbol=symbol, side="sell", type="market", qty=held, time_in_force="GTC")]
+        return []
+
+    return on_bar
+
+
+def strategy_rsi_reversion(bars: BarSeries, tf: str, symbol: str, params: dict):
+    """Buy when RSI drops below `lower`, sell when it rises above `upper`."""
+    rsi = compute_indicator("rsi", (int(params.get("period", 14)),), tf, bars, 0, {})["value"]
+    lower, upper = float(params.get("lower", 30)), float(params.get("upper", 70))
+    qty = float(params.get("qty", 100))
+
+    def on_bar(i: int, held: float, engine: SimEngine) -> List[PlaceOrderRequest]:
+        if np.isnan(rsi[i]):
+            return []
+        if rsi[i] < lower and held == 0:
+            return [PlaceOrderRequest(symbol=symbol, side="buy", type="market", qty=qty, time_in_force="GTC")]
+        if rsi[i] > upper and held > 0:
+            return [PlaceOrderRequest(symbol=symbol, side="sell", type="market", qty=held, time_in_force="GTC")]
+        return []
+
+    return on_bar
+
+
+def strategy_channel_breakout(bars: BarSeries, tf: str, symbol: str, params: dict):
+    """
+    Donchian breakout with resting stop orders: while flat, a buy stop at the
+    `lookback`-bar high; while long, a sell stop at the `exit`-bar low.
+    """
+    lookback, exit_lookback = int(params.get("lookback", 20)), int(params.get("exit", 10))
+    qty = float(params.get("qty", 100))
+    highs = rolling(bars.high, lookback, 0, lambda w: w.max(axis=1))
+    lows = rolling(bars.low, exit_lookback, 0, lambda w: w.min(axis=1))
+    resting: dict = {"id": None}
+
+    def on_bar(i: int, held: float, engine: SimEngine) -> List[PlaceOrderRequest]:
+        if resting["id"] is not None:
+            engine.cancel(resting["id"], float(bars.ts[i]))
+            resting["id"] = None
+        if held == 0 and not np.isnan(highs[i]):
+            side, stop = "buy", float(highs[i]) + 0.01
+        elif held > 0 and not np.isnan(lows[i]):
+            side, stop = "sell", float(lows[i]) - 0.01
+        else:
+            return []
+        return [PlaceOrderRequest(symbol=symbol, side=side, type="stop", qty=qty if side == "buy" else held,
+                                  stop_price=round(stop, 2), time_in_force="GTC")]
+
+    def track(order: SimOrder):
+        if order.status == "open":
+            resting["id"] = order.id
+
+    on_bar.track = track
+    return on_bar
+
+
+BACKTEST_STRATEGIES = {
+    "sma_cross": strategy_sma_cross,
+    "rsi_reversion": strategy_rsi_reversion,
+    "channel_breakout": strategy_channel_breakout,
+}
+
+
+def bar_path(o: float, h: float, l: float, c: float) -> tuple:
+    """Intrabar price path: an up bar more likely made its low first."""
+    return (o, l, h, c) if c >= o else (o, h, l, c)
+
+
+def run_backtest(strategy: str, params: dict, symbol: str, tf: str, columns: dict, starting_cash: float,
+                 fee_per_share: float, points: int, include_fills: bool) -> dict:
+    """
+    One backtest (runs in a pool worker). `columns` are BarSeries arrays by
+    BAR_COLUMNS name. Returns stats, a downsampled equity curve and,
+    if asked, the fills as Trades and the orders.
+    """
+    bars = BarSeries(np.column_stack([columns[name] for name in BAR_COLUMNS]).tolist())
+    on_bar = BACKTEST_STRATEGIES[strategy](bars, tf, symbol, params)
+    track = getattr(on_bar, "track", None)
+    engine = SimEngine(starting_cash, fee_per_share, SIM_FEE_MIN if fee_per_share else 0.0)
+
+    n = len(bars)
+    equity = np.empty(n)
+    opens, highs, lows, closes = (bars.open.tolist(), bars.high.tolist(), bars.low.tolist(), bars.close.tolist())
+    for i in range(n):
+        ts = float(bars.ts[i])
+        engine.bar_opens[0] = opens[i]
+        for price in bar_path(opens[i], highs[i], lows[i], closes[i]):
+            engine.on_tick(Tick(0, price, price, price, ts=ts))
+        equity[i] = engine.equity()
+        held = engine.positions.get(symbol, {}).get("qty", 0.0)
+        for req in on_bar(i, held, engine):
+            order = engine.place(req, 0, None, ts)
+            if track is not None:
+                track(order)
+
+    result = {"strategy": strategy, "params": params, **backtest_stats(bars.ts, equity, engine, symbol)}
+    picks = lttb_indices(bars.ts.astype(float), equity, points)
+    result["equity_curve"] = {"ts": bars.ts[picks].tolist(), "equity": equity[picks].round(2).tolist()}
+    if include_fills:
+        result["fills"] = jsonable_encoder(engine.trades)
+        result["orders"] = jsonable_encoder([o.to_model() for o in engine.orders.values()])
+    return result
+
+
+def backtest_stats(ts: np.ndarray, equity: np.ndarray, engine: SimEngine, symbol: str) -> dict:
+    if len(equity) < 2:
+        return {"final_equity": engine.equity(), "return": 0.0, "max_drawdown": 0.0, "sharpe": 0.0,
+                "trades": len(engine.trades), "fees": sum(t.fee for t in engine.trades)}
+    drawdown = equity / np.maximum.accumulate(equity) - 1.0
+    returns = np.diff(equity) / equity[:-1]
+    span = float(ts[-1] - ts[0])
+    periods_per_year = (len(equity) - 1) * YEAR_SECONDS / span if span > 0 else 0.0
+    std = float(returns.std())
+    return {
+        "final_equity": round(float(equity[-1]), 2),
+        "return": float(equity[-1] / equity[0] - 1.0),
+        "max_drawdown": float(drawdown.min()),
+        "sharpe": float(returns.mean() / std * math.sqrt(periods_per_year)) if std > 0 else 0.0,
+        "trades": len(engine.trades),
+        "fees": round(sum(t.fee for t in engine.trades), 2),
+        "position": engine.positions.get(symbol, {}).get("qty", 0.0),
+    }
+
+
+def expand_param_grid(grid: dict) -> List[dict]:
+    """{"fast": [5, 10], "slow": [30]} -> [{"fast": 5, "slow": 30}, {"fast": 10, "slow": 30}]"""
+    keys = list(grid)
+    values = [v if isinstance(v, list) else [v] for v in grid.values()]
+    return [dict(zip(keys, combo)) for combo in itertools.product(*values)]
+
+
+@app.post("/backtest")
+async def backtest(
+    req: BacktestRequest,
+    x_bridge_key: str = Header(None),
+):
+    """
+    Run `strategy` over stored bars for every parameter set (explicit `params`
+    plus the product of `param_grid`), in parallel across processes. Results
+    are sorted by `sort_by`; fills and orders are returned for the best run.
+    Bars come from the bar store (fetched once if it has fewer than `bars`)
+    or from `candles` when given.
+    """
+    verify_key(x_bridge_key)
+
+    if req.strategy not in BACKTEST_STRATEGIES:
+        raise HTTPException(status_code=400, detail=f"strategy must be one of {', '.join(BACKTEST_STRATEGIES)}")
+    if req.sort_by not in ("return", "sharpe", "max_drawdown", "final_equity"):
+        raise HTTPException(status_code=400, detail="sort_by must be return, sharpe, max_drawdown or final_equity")
+    runs = list(req.params or []) + (expand_param_grid(req.param_grid) if req.param_grid else [])
+    runs = runs or [{}]
+    if len(runs) > BACKTEST_MAX_RUNS:
+        raise HTTPException(status_code=400, detail=f"At most {BACKTEST_MAX_RUNS} parameter sets per backtest")
+
+    if req.candles:
+        candles = sorted(req.candles, key=lambda c: c.ts)
+        bars = BarSeries([
+            (unix_seconds(c.ts), c.open, c.high, c.low, c.close, c.volume) for c in candles
+        ])
+    else:
+        if not req.symbol:
+            raise HTTPException(status_code=400, detail="symbol or candles required")
+        conid = await resolve_conid(req.symbol)
+        bars = get_bar_store().get(conid, req.tf)
+        if len(bars) < req.bars:
+            await fetch_history_bars(conid, req.tf, req.bars)
+            bars = get_bar_store().get(conid, req.tf)
+    first = max(0, len(bars) - req.bars)
+    columns = {name: getattr(bars, name)[first:].copy() for name in BAR_COLUMNS}
+    if len(columns["ts"]) < 2:
+        raise HTTPException(status_code=404, detail="Not enough bars to backtest")
+
+    symbol = (req.symbol or "CANDLES").strip().upper()
+    points = min(max(req.points, 10), 5000)
+    started = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    pool = get_backtest_pool()
+    try:
+        results = await asyncio.gather(*(
+            loop.run_in_executor(
+                pool, run_backtest, req.strategy, params, symbol, req.tf, columns,
+                req.starting_cash, req.fee_per_share, points, len(runs) == 1,
+            )
+            for params in runs
+        ))
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid strategy parameters: {e}")
+    # Best first for every key; max_drawdown is <= 0, so the shallowest drawdown sorts first too
+    results.sort(key=lambda r: r.get(req.sort_by, 0.0), reverse=True)
+    if len(runs) > 1:
+        # Fills only for the winner, computed again rather than shipped back for every run
+        results[0] = await loop.run_in_executor(
+            pool, run_backtest, req.strategy, results[0]["params"], symbol, req.tf, columns,
+            req.starting_cash, req.fee_per_share, points, True,
+        )
+
+    return {
+        "ok": True,
+        "symbol": symbol,
+        "tf": req.tf,
+        "bars": len(columns["ts"]),
+        "from": datetime.utcfromtimestamp(int(columns["ts"][0])),
+        "to": datetime.utcfromtimestamp(int(columns["ts"][-1])),
+        "runs": len(results),
+        "elapsed_ms": round(1000 * (time.perf_counter() - started), 1),
+        "best": results[0],
+        "results": [{k: v for k, v in r.items() if k not in ("equity_curve", "fills", "orders")} for r in results],
+    }
+
+
+
+
+
 # -------------------------------------------------
 
 # ORDERS
@@ -973,6 +5203,11 @@ async def open_orders(x_bridge_key: str = Header(None)):
 
     verify_key(x_bridge_key)
 
+    if SIM_TRADING:
+        engine = get_sim_engine()
+        engine.expire(time.time())
+        return {"ok": True, "data": [o.to_model() for o in engine.open_ids.values()]}
+
     now = datetime.utcnow()
 
 
@@ -1033,6 +5268,14 @@ async def orders_history(
 
     now = datetime.utcnow()
 
+    if SIM_TRADING:
+        since = time.time() - days * 86400
+        orders = [
+            o.to_model() for o in get_sim_engine().orders.values()
+            if o.status != "open" and o.updated_at >= since
+        ]
+        return {"ok": True, "days": days, "data": orders}
+
 
 
     # TODO: IBKR order history
@@ -1117,6 +5360,25 @@ async def place_order(
 
     verify_key(x_bridge_key)
 
+    if SIM_TRADING:
+        validate_order_request(req)
+        conid = await resolve_conid(req.symbol)
+        tick = await sim_quote(conid)
+        order = get_sim_engine().place(req, conid, tick, time.time())
+        return PlaceOrderResponse(
+            ok=True,
+            order_id=order.id,
+            status=order.status,
+            symbol=order.symbol,
+            side=order.side,
+            type=order.type,
+            qty=order.qty,
+            limit_price=order.limit_price,
+            stop_price=order.stop_price,
+            time_in_force=order.time_in_force,
+            submitted_at=datetime.utcfromtimestamp(order.created_at),
+        )
+
 
 
     # TODO: real IBKR order placement, return real order id & status
@@ -1169,6 +5431,16 @@ async def cancel_order(
 
     verify_key(x_bridge_key)
 
+    if SIM_TRADING:
+        engine = get_sim_engine()
+        order = engine.cancel(req.order_id, time.time())
+        if order is not None:
+            return CancelOrderResponse(ok=True, order_id=order.id, status=order.status)
+        order = engine.orders.get(req.order_id)
+        if order is None:
+            raise HTTPException(status_code=404, detail=f"Unknown order: {req.order_id}")
+        return CancelOrderResponse(ok=False, order_id=order.id, status=order.status)
+
 
 
     # TODO: call IBKR cancel endpoint
@@ -1197,12 +5469,14 @@ async def logout(x_bridge_key: str = Header(None)):
     """
     verify_key(x_bridge_key)
     
+    # Cached account data belongs to the session being logged out
+    invalidate_response_cache()
+    
     # Step 1: Clear Session API cache (critical - invalidates Bridge's cookie source)
     session_clear_ok = False
     try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            resp = await client.post(f"{SESSION_API_URL}/session-clear")
-            session_clear_ok = resp.status_code == 200
+        resp = await get_session_api_client().post("/session-clear")
+        session_clear_ok = resp.status_code == 200
     except Exception as e:
         # Log but continue - Gateway logout is still valuable
         print(f"Warning: Session API clear failed: {e}")
@@ -1212,18 +5486,21 @@ async def logout(x_bridge_key: str = Header(None)):
     try:
         # Gateway base URL (IB_GATEWAY_URL is "https://localhost:5000/v1/api")
         gateway_base = IB_GATEWAY_URL.replace('/v1/api', '')
-        async with httpx.AsyncClient(verify=False, timeout=10) as client:
-            # Try primary logout endpoint
-            resp1 = await client.post(f"{gateway_base}/v1/api/iserver/auth/logout")
-            if resp1.status_code in [200, 400]:  # 400 can mean already logged out, which is fine
-                gateway_logout_ok = True
-            else:
-                # Try alternative logout endpoint
-                resp2 = await client.post(f"{gateway_base}/v1/api/logout")
-                gateway_logout_ok = resp2.status_code in [200, 400]
+        client = get_gateway_client()
+        # Try primary logout endpoint
+        resp1 = await client.post(f"{gateway_base}/v1/api/iserver/auth/logout", timeout=10)
+        if resp1.status_code in [200, 400]:  # 400 can mean already logged out, which is fine
+            gateway_logout_ok = True
+        else:
+            # Try alternative logout endpoint
+            resp2 = await client.post(f"{gateway_base}/v1/api/logout", timeout=10)
+            gateway_logout_ok = resp2.status_code in [200, 400]
     except Exception as e:
         print(f"Warning: Gateway logout failed: {e}")
     
+    # The logged-out cookies are useless now; the next 401 fetches new ones
+    set_session_cookies(None, "logout")
+    
     # Return ok only if Session API was cleared (most important step)
     if not session_clear_ok:
         raise HTTPException(
@@ -1247,6 +5524,10 @@ async def get_trades(
 
     now = datetime.utcnow()
 
+    if SIM_TRADING:
+        since = now - timedelta(days=days)
+        return {"ok": True, "days": days, "data": [t for t in get_sim_engine().trades if t.timestamp >= since]}
+
 
 
     # TODO: IBKR executions
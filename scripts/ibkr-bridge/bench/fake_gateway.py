@@ -0,0 +1,239 @@
+"""
+Fake IBKR Client Portal Gateway for benchmarking the bridge.
+
+Serves the /v1/api endpoints the bridge calls (accounts, summary, positions,
+orders, secdef search, snapshot, history, auth status, tickle) with
+configurable latency and error injection. No TLS, no session.
+
+Run:
+    python3 -m uvicorn fake_gateway:app --port 5900
+
+Configure with env vars at start, or at runtime with POST /_config:
+    FAKE_GW_LATENCY_MS   base latency per call (default 20)
+    FAKE_GW_JITTER_MS    extra uniform random latency (default 10)
+    FAKE_GW_ERROR_RATE   fraction of calls answered 500 (default 0)
+    FAKE_GW_POSITIONS    positions per account (default 25)
+"""
+
+from fastapi import FastAPI, Request
+
+from fastapi.responses import JSONResponse
+
+import asyncio
+
+import os
+
+import random
+
+import time
+
+
+
+app = FastAPI(title="Fake IBKR Gateway")
+
+config = {
+    "latency_ms": float(os.environ.get("FAKE_GW_LATENCY_MS", "20")),
+    "jitter_ms": float(os.environ.get("FAKE_GW_JITTER_MS", "10")),
+    "error_rate": float(os.environ.get("FAKE_GW_ERROR_RATE", "0")),
+    "positions": int(os.environ.get("FAKE_GW_POSITIONS", "25")),
+}
+
+# Calls served per path, for checking how many requests reached the "gateway"
+stats = {}
+
+ACCOUNT_ID = "DU1234567"
+
+SYMBOLS = ["AAPL", "MSFT", "NVDA", "AMZN", "GOOGL", "META", "TSLA", "SPY", "QQQ", "IWM"]
+
+
+
+@app.middleware("http")
+async def inject_latency_and_errors(request: Request, call_next):
+    path = request.url.path
+    if path.startswith("/_"):
+        return await call_next(request)
+
+    stats[path] = stats.get(path, 0) + 1
+    delay = config["latency_ms"] + random.uniform(0, config["jitter_ms"])
+    await asyncio.sleep(delay / 1000.0)
+
+    if config["error_rate"] and random.random() < config["error_rate"]:
+        return JSONResponse({"error": "injected failure"}, status_code=500)
+    return await call_next(request)
+
+
+def conid_for(symbol: str) -> int:
+    return 100000 + sum(ord(c) * (i + 1) for i, c in enumerate(symbol.upper()))
+
+
+def price_for(conid: int) -> float:
+    # Wanders a little around a per-conid level so repeated quotes differ
+    return round(50 + conid % 400 + random.uniform(-0.5, 0.5), 2)
+
+
+
+# -------------------------------------------------
+# SESSION
+# -------------------------------------------------
+
+@app.post("/v1/api/tickle")
+async def tickle():
+    return {"session": "fake", "iserver": {"authStatus": {"authenticated": True, "connected": True}}}
+
+
+@app.get("/v1/api/iserver/auth/status")
+async def auth_status():
+    return {"authenticated": True, "connected": True, "competing": False}
+
+
+@app.post("/v1/api/iserver/reauthenticate")
+async def reauthenticate():
+    return {"message": "triggered"}
+
+
+
+# -------------------------------------------------
+# PORTFOLIO / ORDERS
+# -------------------------------------------------
+
+@app.get("/v1/api/portfolio/accounts")
+async def accounts():
+    return [{"accountId": ACCOUNT_ID, "id": ACCOUNT_ID, "currency": "USD", "type": "DEMO"}]
+
+
+@app.get("/v1/api/portfolio/{account_id}/summary")
+async def summary(account_id: str):
+    return {
+        "netliquidation": {"amount": 125000.0, "currency": "USD"},
+        "totalcashvalue": {"amount": 40000.0, "currency": "USD"},
+        "buyingpower": {"amount": 250000.0, "currency": "USD"},
+        "availablefunds": {"amount": 80000.0, "currency": "USD"},
+        "excessliquidity": {"amount": 82000.0, "currency": "USD"},
+        "initmarginreq": {"amount": 30000.0, "currency": "USD"},
+        "maintmarginreq": {"amount": 25000.0, "currency": "USD"},
+    }
+
+
+@app.get("/v1/api/portfolio/{account_id}/positions")
+@app.get("/v1/api/portfolio/{account_id}/positions/{page}")
+async def positions(account_id: str, page: int = 0):
+    rows = []
+    for i in range(config["positions"]):
+        symbol = SYMBOLS[i % len(SYMBOLS)] + ("" if i < len(SYMBOLS) else str(i))
+        conid = conid_for(symbol)
+        qty = (i % 7 + 1) * 10 * (-1 if i % 5 == 4 else 1)
+        avg = 50 + conid % 400
+        mkt = price_for(conid)
+        rows.append({
+            "acctId": account_id,
+            "conid": conid,
+            "ticker": symbol,
+            "contractDesc": symbol,
+            "position": qty,
+            "avgPrice": avg,
+            "avgCost": avg,
+            "mktPrice": mkt,
+            "mktValue": round(qty * mkt, 2),
+            "unrealizedPnl": round(qty * (mkt - avg), 2),
+            "realizedPnl": 0.0,
+            "currency": "USD",
+            "assetClass": "STK",
+        })
+    return rows
+
+
+@app.get("/v1/api/iserver/account/orders")
+async def orders():
+    return {
+        "orders": [
+            {
+                "orderId": 1000 + i,
+                "conid": conid_for(symbol),
+                "ticker": symbol,
+                "side": "BUY" if i % 2 == 0 else "SELL",
+                "orderType": "LMT",
+                "totalSize": 10,
+                "filledQuantity": 0,
+                "price": 100 + i,
+                "status": "Submitted",
+                "lastExecutionTime_r": int(time.time() * 1000),
+            }
+            for i, symbol in enumerate(SYMBOLS[:5])
+        ]
+    }
+
+
+
+# -------------------------------------------------
+# MARKET DATA
+# -------------------------------------------------
+
+@app.get("/v1/api/iserver/secdef/search")
+async def secdef_search(symbol: str):
+    return [{
+        "conid": conid_for(symbol),
+        "symbol": symbol.upper(),
+        "companyName": f"{symbol.upper()} Inc",
+        "description": "NASDAQ",
+        "sections": [{"secType": "STK"}],
+    }]
+
+
+@app.get("/v1/api/iserver/marketdata/snapshot")
+async def snapshot(conids: str, fields: str = ""):
+    rows = []
+    for conid in (int(c) for c in conids.split(",") if c):
+        last = price_for(conid)
+        rows.append({
+            "conid": conid,
+            "31": str(last),
+            "84": str(round(last - 0.01, 2)),
+            "86": str(round(last + 0.01, 2)),
+        })
+    return rows
+
+
+@app.get("/v1/api/iserver/marketdata/history")
+async def history(conid: int, bar: str = "1h", period: str = "1w", outsideRth: bool = False):
+    step = 3600
+    count = 500
+    end = int(time.time()) // step * step
+    base = 50 + conid % 400
+    bars = []
+    for i in range(count):
+        close = base + 5 * ((i * 7919) % 100 - 50) / 100
+        bars.append({
+            "t": (end - (count - 1 - i) * step) * 1000,
+            "o": round(close - 0.2, 2),
+            "h": round(close + 0.5, 2),
+            "l": round(close - 0.5, 2),
+            "c": round(close, 2),
+            "v": 1000 + (i * 31) % 500,
+        })
+    return {"symbol": str(conid), "barLength": step, "data": bars}
+
+
+
+# -------------------------------------------------
+# CONTROL
+# -------------------------------------------------
+
+@app.post("/_config")
+async def set_config(request: Request):
+    """Update latency/error settings: {"latency_ms": 50, "error_rate": 0.05, ...}"""
+    body = await request.json()
+    for key, value in body.items():
+        if key in config:
+            config[key] = type(config[key])(value)
+    return config
+
+
+@app.get("/_stats")
+async def get_stats():
+    return {"config": config, "calls": stats}
+
+
+@app.post("/_reset")
+async def reset_stats():
+    stats.clear()
+    return {"ok": True}
@@ -0,0 +1,111 @@
+"""
+Replays gateway exchanges recorded by the bridge (GATEWAY_RECORD_FILE) as a
+stand-in Client Portal Gateway, for offline benchmarks and regression tests
+on real payloads.
+
+Record (against the real gateway):
+    GATEWAY_RECORD_FILE=/tmp/gateway.jsonl.gz python3 -m uvicorn app:app --port 8000
+
+Replay:
+    REPLAY_FILE=/tmp/gateway.jsonl.gz python3 -m uvicorn replay_gateway:app --port 5900
+
+Requests are matched on method + path + query. Paths never recorded verbatim
+fall back to the same path with numbers masked (another conid or account id
+gets a recorded payload of the same shape). Repeated requests cycle through
+the recorded responses in order.
+
+    REPLAY_FILE           recording (.jsonl or .jsonl.gz), required
+    REPLAY_LATENCY_SCALE  recorded latency multiplier (default 1.0, 0 = none)
+"""
+
+from fastapi import FastAPI, Request
+
+from fastapi.responses import JSONResponse, Response
+
+import asyncio
+
+import gzip
+
+import json
+
+import os
+
+import re
+
+from itertools import cycle
+
+
+
+REPLAY_FILE = os.environ.get("REPLAY_FILE")
+REPLAY_LATENCY_SCALE = float(os.environ.get("REPLAY_LATENCY_SCALE", "1.0"))
+
+app = FastAPI(title="Replay IBKR Gateway")
+
+# Calls served per path, same shape as fake_gateway's /_stats
+stats = {}
+
+
+
+def load_recording(filename: str) -> list[dict]:
+    opener = gzip.open if filename.endswith(".gz") else open
+    with opener(filename, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def mask(path: str) -> str:
+    return re.sub(r"\d+", "#", path)
+
+
+def build_index(exchanges: list[dict]) -> tuple[dict, dict]:
+    exact, masked = {}, {}
+    for exchange in exchanges:
+        method = exchange["method"].upper()
+        path = exchange["path"].lstrip("/")
+        exact.setdefault((method, path), []).append(exchange)
+        masked.setdefault((method, mask(path)), []).append(exchange)
+    return (
+        {key: cycle(items) for key, items in exact.items()},
+        {key: cycle(items) for key, items in masked.items()},
+    )
+
+
+_exchanges = load_recording(REPLAY_FILE) if REPLAY_FILE else []
+_exact, _masked = build_index(_exchanges)
+
+
+
+@app.get("/_stats")
+async def get_stats():
+    return {
+        "recording": REPLAY_FILE,
+        "exchanges": len(_exchanges),
+        "latency_scale": REPLAY_LATENCY_SCALE,
+        "calls": stats,
+    }
+
+
+@app.post("/_reset")
+async def reset_stats():
+    stats.clear()
+    return {"ok": True}
+
+
+@app.api_route("/v1/api/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
+async def replay(path: str, request: Request):
+    query = request.url.query
+    key_path = f"{path}?{query}" if query else path
+    method = request.method
+
+    responses = _exact.get((method, key_path)) or _masked.get((method, mask(key_path)))
+    stats[request.url.path] = stats.get(request.url.path, 0) + 1
+    if responses is None:
+        return JSONResponse({"error": f"not in recording: {method} {key_path}"}, status_code=404)
+
+    exchange = next(responses)
+    if REPLAY_LATENCY_SCALE:
+        await asyncio.sleep(exchange["elapsed"] * REPLAY_LATENCY_SCALE)
+    return Response(
+        content=exchange["body"],
+        status_code=exchange["status"],
+        media_type=exchange.get("content_type") or "application/json",
+    )
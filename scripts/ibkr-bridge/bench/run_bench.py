@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Load/latency benchmark for the IBKR bridge against bench/fake_gateway.py.
+
+Starts the fake gateway and the bridge (uvicorn subprocesses, bridge pointed
+at the fake through IB_GATEWAY_URL), then drives each scenario at increasing
+concurrency for a fixed duration and reports throughput and p50/p95/p99.
+
+    cd scripts/ibkr-bridge
+    python3 bench/run_bench.py --out bench/results/$(git rev-parse --short HEAD).json
+    python3 bench/run_bench.py --compare bench/results/baseline.json
+    python3 bench/run_bench.py --replay /tmp/gateway.jsonl.gz --latency-scale 1.0
+
+Results are JSON (one row per scenario x concurrency) so runs can be diffed.
+Needs fastapi, uvicorn and httpx (same as the bridge).
+"""
+
+import argparse
+
+import asyncio
+
+import json
+
+import os
+
+import platform
+
+import subprocess
+
+import sys
+
+import time
+
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+
+
+
+BENCH_DIR = Path(__file__).resolve().parent
+BRIDGE_DIR = BENCH_DIR.parent
+
+BRIDGE_KEY = "agentyc-bridge-9u1Px"
+HEADERS = {"X-Bridge-Key": BRIDGE_KEY}
+
+SYMBOLS = ["AAPL", "MSFT", "NVDA", "AMZN", "GOOGL", "META", "TSLA", "SPY", "QQQ", "IWM"]
+
+
+# name -> (method, path, json body or None); {symbol} rotates through SYMBOLS
+SCENARIOS = {
+    "account": ("GET", "/account", None),
+    "positions": ("GET", "/positions", None),
+    "quotes": ("POST", "/quotes", {"symbols": SYMBOLS}),
+    "history": ("GET", "/history/price?symbol={symbol}&tf=1h&bars=200", None),
+}
+
+
+
+# -------------------------------------------------
+# PROCESSES
+# -------------------------------------------------
+
+def start_server(module: str, port: int, cwd: Path, env: dict) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", module, "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=str(cwd),
+        env={**os.environ, **env},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+
+
+def wait_ready(url: str, headers: dict = None, timeout: float = 20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, headers=headers, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=str(BRIDGE_DIR), stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+
+# -------------------------------------------------
+# LOAD
+# -------------------------------------------------
+
+def percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+async def drive(client: httpx.AsyncClient, scenario: str, concurrency: int, duration: float) -> dict:
+    """Run `concurrency` closed-loop workers against one scenario for `duration` seconds."""
+    method, path, body = SCENARIOS[scenario]
+    latencies = []
+    statuses = {}
+    deadline = time.perf_counter() + duration
+
+    async def worker(worker_id: int):
+        i = worker_id
+        while time.perf_counter() < deadline:
+            url = path.format(symbol=SYMBOLS[i % len(SYMBOLS)])
+            i += concurrency
+            started = time.perf_counter()
+            try:
+                resp = await client.request(method, url, json=body)
+                status = str(resp.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    errors = sum(n for status, n in statuses.items() if status != "200")
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": statuses,
+        "seconds": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(1000 * sum(latencies) / len(latencies), 2) if latencies else 0.0,
+        "p50_ms": round(1000 * percentile(latencies, 0.50), 2),
+        "p95_ms": round(1000 * percentile(latencies, 0.95), 2),
+        "p99_ms": round(1000 * percentile(latencies, 0.99), 2),
+        "max_ms": round(1000 * latencies[-1], 2) if latencies else 0.0,
+    }
+
+
+async def run(args, bridge_url: str, gateway_url: str) -> list:
+    rows = []
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    async with httpx.AsyncClient(base_url=bridge_url, headers=HEADERS, timeout=30.0, limits=limits) as client:
+        for scenario in args.scenarios:
+            if args.warmup:
+                await drive(client, scenario, 1, args.warmup)
+            for concurrency in args.concurrency:
+                before = gateway_calls(gateway_url)
+                row = await drive(client, scenario, concurrency, args.duration)
+                after = gateway_calls(gateway_url)
+                if before is not None and after is not None:
+                    row["gateway_calls"] = after - before
+                rows.append(row)
+                print(format_row(row), flush=True)
+    return rows
+
+
+def gateway_calls(gateway_url: str):
+    try:
+        stats = httpx.get(f"{gateway_url}/_stats", timeout=2.0).json()
+        return sum(stats["calls"].values())
+    except (httpx.HTTPError, ValueError, KeyError):
+        return None
+
+
+
+# -------------------------------------------------
+# REPORTING
+# -------------------------------------------------
+
+def format_row(row: dict) -> str:
+    return (
+        f"{row['scenario']:<10} c={row['concurrency']:<4} {row['requests']:>7} req "
+        f"{row['rps']:>8.1f} rps  p50 {row['p50_ms']:>8.2f}  p95 {row['p95_ms']:>8.2f}  "
+        f"p99 {row['p99_ms']:>8.2f} ms  errors {row['errors']}"
+        + (f"  gw {row['gateway_calls']}" if "gateway_calls" in row else "")
+    )
+
+
+def compare(rows: list, baseline_path: Path):
+    """Print rps and p95/p99 change against an earlier results file."""
+    baseline = json.loads(baseline_path.read_text())
+    previous = {(r["scenario"], r["concurrency"]): r for r in baseline["results"]}
+    print(f"\nvs {baseline_path} ({baseline['meta'].get('git_revision')})")
+    for row in rows:
+        old = previous.get((row["scenario"], row["concurrency"]))
+        if old is None:
+            continue
+        changes = []
+        for key in ("rps", "p95_ms", "p99_ms"):
+            if old[key]:
+                changes.append(f"{key} {100 * (row[key] - old[key]) / old[key]:+.1f}%")
+        print(f"{row['scenario']:<10} c={row['concurrency']:<4} " + "  ".join(changes))
+
+
+
+# -------------------------------------------------
+# MAIN
+# -------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        type=lambda v: [s for s in v.split(",") if s])
+    parser.add_argument("--concurrency", default="1,8,32,64",
+                        type=lambda v: [int(c) for c in v.split(",") if c])
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per scenario x concurrency")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Seconds of single-client warmup per scenario")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Fake gateway base latency")
+    parser.add_argument("--jitter-ms", type=float, default=10.0, help="Fake gateway random extra latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of fake gateway calls that 500")
+    parser.add_argument("--positions", type=int, default=25, help="Positions returned by the fake gateway")
+    parser.add_argument("--replay", type=Path,
+                        help="Serve a GATEWAY_RECORD_FILE recording (replay_gateway.py) instead of the fake gateway")
+    parser.add_argument("--latency-scale", type=float, default=1.0,
+                        help="With --replay: multiplier on recorded latencies (0 = none)")
+    parser.add_argument("--gateway-port", type=int, default=5900)
+    parser.add_argument("--bridge-port", type=int, default=8900)
+    parser.add_argument("--bridge-url", help="Benchmark an already running bridge instead of starting one")
+    parser.add_argument("--out", type=Path, help="Write results JSON here")
+    parser.add_argument("--compare", type=Path, help="Results JSON to compare against")
+    args = parser.parse_args()
+
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    gateway_url = f"http://127.0.0.1:{args.gateway_port}"
+    bridge_url = args.bridge_url or f"http://127.0.0.1:{args.bridge_port}"
+    processes = []
+    try:
+        if not args.bridge_url and args.replay:
+            processes.append(start_server("replay_gateway:app", args.gateway_port, BENCH_DIR, {
+                "REPLAY_FILE": str(args.replay.resolve()),
+                "REPLAY_LATENCY_SCALE": str(args.latency_scale),
+            }))
+        elif not args.bridge_url:
+            processes.append(start_server("fake_gateway:app", args.gateway_port, BENCH_DIR, {
+                "FAKE_GW_LATENCY_MS": str(args.latency_ms),
+                "FAKE_GW_JITTER_MS": str(args.jitter_ms),
+                "FAKE_GW_ERROR_RATE": str(args.error_rate),
+                "FAKE_GW_POSITIONS": str(args.positions),
+            }))
+        if not args.bridge_url:
+            wait_ready(f"{gateway_url}/_stats")
+            processes.append(start_server("app:app", args.bridge_port, BRIDGE_DIR, {
+                "IB_GATEWAY_URL": f"{gateway_url}/v1/api",
+                # Nothing listens here: cookie fetches fail fast and are skipped
+                "SESSION_API_URL": "http://127.0.0.1:9",
+            }))
+        wait_ready(f"{bridge_url}/health", HEADERS)
+
+        rows = asyncio.run(run(args, bridge_url, gateway_url))
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    result = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "bridge_url": bridge_url,
+            "duration": args.duration,
+            "fake_gateway": None if args.replay else {
+                "latency_ms": args.latency_ms,
+                "jitter_ms": args.jitter_ms,
+                "error_rate": args.error_rate,
+                "positions": args.positions,
+            },
+            "replay": {"file": str(args.replay), "latency_scale": args.latency_scale} if args.replay else None,
+        },
+        "results": rows,
+    }
+
+    if args.out:
+        args.out.parent.mkdir(parents=True, exist_ok=True)
+        args.out.write_text(json.dumps(result, indent=2) + "\n")
+        print(f"\nWrote {args.out}")
+    if args.compare:
+        compare(rows, args.compare)
+
+
+if __name__ == "__main__":
+    main()
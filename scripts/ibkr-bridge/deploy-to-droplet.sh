@@ -39,9 +39,9 @@ if ! command -v pip3 &> /dev/null; then
 fi
 
 # Check for required Python packages
-python3 -c "import fastapi, httpx" 2>/dev/null || {
+python3 -c "import fastapi, httpx, numpy" 2>/dev/null || {
     echo "   Installing required Python packages..."
-    pip3 install --user fastapi uvicorn httpx pydantic || {
+    pip3 install --user fastapi uvicorn httpx pydantic numpy || {
         echo "   ERROR: Failed to install Python packages"
         exit 1
     }
@@ -32,9 +32,9 @@ echo "   ✓ Using directory: $BRIDGE_DIR"
 # Step 2: Install Python dependencies
 echo ""
 echo "[2/8] Checking Python dependencies..."
-if ! python3 -c "import fastapi, httpx" 2>/dev/null; then
+if ! python3 -c "import fastapi, httpx, numpy" 2>/dev/null; then
     echo "   Installing packages..."
-    pip3 install --user fastapi uvicorn httpx pydantic 2>&1 | grep -v "already satisfied" || true
+    pip3 install --user fastapi uvicorn httpx pydantic numpy 2>&1 | grep -v "already satisfied" || true
 fi
 echo "   ✓ Dependencies OK"
 
@@ -0,0 +1,123 @@
+"""
+Alert evaluation against the in-process quote feed.
+
+Run from scripts/ibkr-bridge:  python -m pytest -q tests
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as bridge
+
+
+AAPL = 265598
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    feed = bridge.QuoteFeed()
+    monkeypatch.setattr(bridge, "_quote_feed", feed)
+    engine = bridge.AlertEngine(str(tmp_path / "alerts.db"))
+    engine.evaluating = True
+    yield engine
+    engine.conn.close()
+
+
+def run_with_feed(fn):
+    """Run fn(feed) on a loop, with a placeholder for the feed's sweep task."""
+    async def main():
+        bridge._quote_feed.task = asyncio.get_running_loop().create_future()
+        fn(bridge._quote_feed)
+    asyncio.run(main())
+
+
+def test_alert_created_after_resubscribe_sees_current_price(engine):
+    def scenario(feed):
+        feed.subscribe("alerts", [AAPL], engine.on_tick)
+        feed.publish(bridge.Tick(AAPL, 210.0))
+
+        first = engine.create(AAPL, "AAPL", "above", 200.0, None, False)
+        assert engine.row(first["id"])["status"] == "triggered"
+        # The fired alert emptied the book, so "alerts" no longer watches AAPL
+        assert AAPL not in feed.subscribers
+
+        second = engine.create(AAPL, "AAPL", "above", 190.0, None, False)
+        assert engine.row(second["id"])["status"] == "triggered"
+
+    run_with_feed(scenario)
+
+
+def test_resubscribe_keeps_quotes_of_remaining_conids(engine):
+    def scenario(feed):
+        engine.create(AAPL, "AAPL", "above", 300.0, None, False)
+        feed.publish(bridge.Tick(AAPL, 210.0))
+        engine.create(8314, "IBM", "below", 100.0, None, False)
+
+        assert feed.latest[AAPL].last == 210.0
+        assert set(feed.subscribers) == {AAPL, 8314}
+
+    run_with_feed(scenario)
+
+
+def test_sync_follows_changes_from_other_workers(engine, tmp_path):
+    worker = bridge.AlertEngine(str(tmp_path / "alerts.db"))
+
+    def scenario(feed):
+        created = worker.create(AAPL, "AAPL", "above", 300.0, None, True)
+        engine.sync()
+        assert created["id"] in engine.armed
+
+        feed.publish(bridge.Tick(AAPL, 290.0))
+        feed.publish(bridge.Tick(AAPL, 301.0))
+        assert worker.row(created["id"])["trigger_count"] == 1
+
+        worker.delete(created["id"])
+        engine.sync()
+        assert created["id"] not in engine.armed
+        assert AAPL not in feed.subscribers
+
+    run_with_feed(scenario)
+    worker.conn.close()
+
+
+@pytest.mark.parametrize("repeat", [True, False])
+def test_alert_deleted_on_another_worker_stays_deleted(engine, tmp_path, repeat):
+    worker = bridge.AlertEngine(str(tmp_path / "alerts.db"))
+
+    def scenario(feed):
+        created = worker.create(AAPL, "AAPL", "above", 300.0, None, repeat)
+        engine.sync()
+        feed.publish(bridge.Tick(AAPL, 290.0))
+
+        # Deleted by the follower; the poller sees the cross before its next sync
+        worker.delete(created["id"])
+        feed.publish(bridge.Tick(AAPL, 301.0))
+        engine.sync()
+
+        assert worker.row(created["id"])["status"] == "deleted"
+        assert worker.row(created["id"])["trigger_count"] == 0
+        assert created["id"] not in engine.armed
+        assert worker.rows() == []
+
+    run_with_feed(scenario)
+    worker.conn.close()
+
+
+def test_alert_created_on_another_worker_fires_if_already_true(engine, tmp_path):
+    worker = bridge.AlertEngine(str(tmp_path / "alerts.db"))
+
+    def scenario(feed):
+        feed.subscribe("alerts", [AAPL], engine.on_tick)
+        feed.publish(bridge.Tick(AAPL, 210.0))
+
+        created = worker.create(AAPL, "AAPL", "above", 200.0, None, False)
+        engine.sync()
+        assert worker.row(created["id"])["status"] == "triggered"
+
+    run_with_feed(scenario)
+    worker.conn.close()
@@ -0,0 +1,231 @@
+"""
+Gateway call plumbing: circuit breakers, single-flight GETs and the route
+response cache.
+
+Run from scripts/ibkr-bridge:  python -m pytest -q tests
+"""
+
+import asyncio
+import json
+import os
+import sys
+from collections import OrderedDict
+
+import pytest
+from fastapi import HTTPException
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as bridge
+
+
+# --- CircuitBreaker ---
+
+def open_breaker() -> bridge.CircuitBreaker:
+    breaker = bridge.CircuitBreaker("portfolio")
+    for _ in range(bridge.CIRCUIT_FAILURE_THRESHOLD):
+        assert breaker.allow()
+        breaker.record_failure()
+    return breaker
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = bridge.CircuitBreaker("portfolio")
+    for _ in range(bridge.CIRCUIT_FAILURE_THRESHOLD - 1):
+        breaker.record_failure()
+    breaker.record_success(0.1)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+    breaker = open_breaker()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_half_open_breaker_lets_one_probe_through():
+    breaker = open_breaker()
+    breaker.opened_at -= breaker.open_for
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()
+
+    breaker.record_success(0.1)
+    assert breaker.state == "closed" and breaker.failures == 0
+    assert breaker.allow() and breaker.allow()
+
+
+def test_failed_probe_doubles_reset_timeout_up_to_max():
+    breaker = open_breaker()
+    for expected in (2 * bridge.CIRCUIT_RESET_TIMEOUT, 4 * bridge.CIRCUIT_RESET_TIMEOUT):
+        breaker.opened_at -= breaker.open_for
+        assert breaker.allow()
+        breaker.record_failure()
+        assert (breaker.state, breaker.open_for) == ("open", expected)
+
+    breaker.open_for = bridge.CIRCUIT_RESET_TIMEOUT_MAX
+    breaker.opened_at -= breaker.open_for
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.open_for == bridge.CIRCUIT_RESET_TIMEOUT_MAX
+
+    breaker.opened_at -= breaker.open_for
+    assert breaker.allow()
+    breaker.record_success(0.1)
+    assert breaker.open_for == bridge.CIRCUIT_RESET_TIMEOUT
+
+
+def test_released_probe_frees_the_slot():
+    breaker = open_breaker()
+    breaker.opened_at -= breaker.open_for
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+
+
+@pytest.mark.parametrize("latency, timeout", [(0.05, bridge.GATEWAY_TIMEOUT_MIN), (1.0, 3.0), (9.0, bridge.GATEWAY_TIMEOUT)])
+def test_timeout_tracks_observed_p99(latency, timeout):
+    breaker = bridge.CircuitBreaker("portfolio")
+    for _ in range(bridge.LATENCY_MIN_SAMPLES - 1):
+        breaker.record_success(latency)
+    assert breaker.timeout() == bridge.GATEWAY_TIMEOUT
+    breaker.record_success(latency)
+    assert breaker.timeout() == pytest.approx(timeout)
+
+
+# --- ib_request ---
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Replaces send_gateway_request; records the priority of every upstream call."""
+    calls = []
+
+    async def send(method, path, json, fallback, priority, use_shared):
+        calls.append(priority)
+        await asyncio.sleep(0.01)
+        return {"path": path, "rows": [1, 2]}
+
+    monkeypatch.setattr(bridge, "send_gateway_request", send)
+    monkeypatch.setattr(bridge, "_gateway_inflight", {})
+    return calls
+
+
+def test_identical_gets_share_one_call_per_priority(upstream):
+    async def main():
+        return await asyncio.gather(
+            bridge.ib_get("portfolio/U1/positions", priority=bridge.PRIORITY_HISTORY),
+            bridge.ib_get("portfolio/U1/positions", priority=bridge.PRIORITY_HISTORY),
+            bridge.ib_get("portfolio/U1/positions", priority=bridge.PRIORITY_ORDER),
+            bridge.ib_get("portfolio/U1/positions"),
+        )
+
+    first, joined, urgent, default = asyncio.run(main())
+    # A higher-priority caller never waits behind a lower-priority call
+    assert upstream == [bridge.PRIORITY_HISTORY, bridge.PRIORITY_ORDER, bridge.PRIORITY_PORTFOLIO]
+    assert joined == first and joined is not first
+    joined["rows"].append(3)
+    assert first["rows"] == [1, 2]
+
+
+def test_cancelled_callers_cancel_the_shared_call(upstream):
+    async def main():
+        task = asyncio.ensure_future(bridge.ib_get("portfolio/accounts"))
+        await asyncio.sleep(0)
+        assert bridge._gateway_inflight
+        task.cancel()
+        await asyncio.sleep(0)
+        assert not bridge._gateway_inflight
+
+    asyncio.run(main())
+
+
+# --- cached_route ---
+
+@pytest.fixture
+def route(monkeypatch):
+    """A cached route counting how often it really runs; `fail` makes the next call raise."""
+    monkeypatch.setattr(bridge, "_response_cache", OrderedDict())
+    monkeypatch.setattr(bridge, "_response_inflight", {})
+    state = {"calls": 0, "fail": False}
+
+    @bridge.cached_route(ttl=5, stale=30)
+    async def counted(n: int = 1, x_bridge_key: str = None):
+        state["calls"] += 1
+        await asyncio.sleep(0.01)
+        if state["fail"]:
+            raise HTTPException(status_code=502, detail="gateway down")
+        return {"n": n, "calls": state["calls"]}
+
+    return counted, state
+
+
+def call(route, **kwargs):
+    return route(x_bridge_key=bridge.BRIDGE_KEY, **kwargs)
+
+
+def body(response) -> dict:
+    return json.loads(response.body)
+
+
+def test_cached_route_hits_until_ttl_then_serves_stale_while_refreshing(route):
+    counted, state = route
+
+    async def main():
+        miss = await call(counted)
+        hit = await call(counted)
+        assert (miss.headers["X-Cache"], hit.headers["X-Cache"]) == ("MISS", "HIT")
+        assert body(hit) == body(miss) == {"n": 1, "calls": 1}
+
+        entry = next(iter(bridge._response_cache.values()))
+        entry.stored_at -= 6
+        stale = await call(counted)
+        assert stale.headers["X-Cache"] == "STALE" and body(stale)["calls"] == 1
+        assert stale.headers["Age"] == "6"
+        await entry.refreshing
+        assert body(await call(counted)) == {"n": 1, "calls": 2}
+
+        next(iter(bridge._response_cache.values())).stored_at -= 40
+        expired = await call(counted)
+        assert expired.headers["X-Cache"] == "MISS" and body(expired)["calls"] == 3
+
+    asyncio.run(main())
+
+
+def test_cached_route_keys_on_query_params(route):
+    counted, state = route
+
+    async def main():
+        await call(counted, n=1)
+        other = await call(counted, n=2)
+        assert other.headers["X-Cache"] == "MISS" and body(other)["n"] == 2
+
+    asyncio.run(main())
+
+
+def test_concurrent_misses_share_one_computation(route):
+    counted, state = route
+
+    async def main():
+        responses = await asyncio.gather(*(call(counted) for _ in range(5)))
+        assert {r.headers["X-Cache"] for r in responses} == {"MISS"}
+
+    asyncio.run(main())
+    assert state["calls"] == 1
+
+
+def test_cached_route_checks_key_and_does_not_cache_errors(route):
+    counted, state = route
+
+    async def main():
+        await call(counted)
+        with pytest.raises(HTTPException) as e:
+            await counted(x_bridge_key="wrong")
+        assert e.value.status_code == 401
+
+        state["fail"] = True
+        with pytest.raises(HTTPException):
+            await call(counted, n=2)
+        state["fail"] = False
+        assert body(await call(counted, n=2)) == {"n": 2, "calls": 3}
+
+    asyncio.run(main())
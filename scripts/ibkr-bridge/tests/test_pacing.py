@@ -0,0 +1,116 @@
+"""
+Gateway pacing: token buckets and the priority scheduler.
+
+Run from scripts/ibkr-bridge:  python -m pytest -q tests
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as bridge
+
+
+def takes(scheduler, path, priority=bridge.PRIORITY_ORDER):
+    """Number of immediate grants for `path` until the scheduler would make a call wait."""
+    count = 0
+    bucket = scheduler.bucket_for(path)
+    while scheduler._try_take(priority, bucket, time.monotonic()) == 0:
+        count += 1
+        assert count < 1000
+    return count
+
+
+def test_workers_share_one_budget(tmp_path):
+    store = bridge.SharedStore(str(tmp_path / "shared.db"))
+    poller, follower = bridge.PacingScheduler(10.0, 10), bridge.PacingScheduler(10.0, 10)
+    poller.store = follower.store = store
+
+    # The idle follower's share is usable by the poller...
+    assert takes(poller, "portfolio/accounts") == 1
+    # ...and the follower sees what the poller spent
+    assert takes(follower, "portfolio/accounts") == 0
+    assert takes(follower, "iserver/marketdata/snapshot?conids=1") == 9
+    assert takes(poller, "iserver/marketdata/snapshot?conids=1") == 0
+
+
+def test_block_applies_to_every_worker(tmp_path):
+    store = bridge.SharedStore(str(tmp_path / "shared.db"))
+    poller, follower = bridge.PacingScheduler(10.0, 10), bridge.PacingScheduler(10.0, 10)
+    poller.store = follower.store = store
+
+    poller.block(poller.bucket_for("iserver/trades"), 15.0)
+    assert follower.would_wait("iserver/trades", bridge.PRIORITY_ORDER)
+    assert not follower.would_wait("iserver/account/orders", bridge.PRIORITY_ORDER)
+
+
+def test_lower_priorities_leave_headroom():
+    scheduler = bridge.PacingScheduler(1.0, 5)
+    # History must leave 4 tokens and portfolio 2; orders may drain the rest
+    assert takes(scheduler, "portfolio/U1/positions", bridge.PRIORITY_HISTORY) == 1
+    assert takes(scheduler, "portfolio/U1/positions", bridge.PRIORITY_PORTFOLIO) == 2
+    assert takes(scheduler, "iserver/account/order", bridge.PRIORITY_ORDER) == 2
+
+
+def test_endpoint_bucket_limits_its_paths_only():
+    scheduler = bridge.PacingScheduler(100.0, 100)
+    assert takes(scheduler, "iserver/account/orders") == 1
+    assert scheduler.would_wait("iserver/account/orders", bridge.PRIORITY_ORDER)
+    assert not scheduler.would_wait("iserver/account/orders/123", bridge.PRIORITY_ORDER)
+
+
+@pytest.mark.parametrize("method, path, priority", [
+    ("POST", "iserver/account/U1/orders", bridge.PRIORITY_ORDER),
+    ("POST", "iserver/reply/abc", bridge.PRIORITY_ORDER),
+    ("GET", "iserver/account/orders", bridge.PRIORITY_PORTFOLIO),
+    ("GET", "iserver/marketdata/snapshot?conids=1", bridge.PRIORITY_QUOTE),
+    ("GET", "iserver/marketdata/history?conid=1", bridge.PRIORITY_HISTORY),
+    ("GET", "portfolio/U1/summary", bridge.PRIORITY_PORTFOLIO),
+])
+def test_request_priority(method, path, priority):
+    assert bridge.request_priority(method, path) == priority
+
+
+def test_waiters_are_granted_in_priority_order():
+    granted = []
+
+    async def main():
+        scheduler = bridge.PacingScheduler(50.0, 1)
+        assert takes(scheduler, "portfolio/accounts/x") == 1
+
+        async def call(priority):
+            await scheduler.acquire("portfolio/accounts/x", priority)
+            granted.append(priority)
+
+        try:
+            await asyncio.wait_for(asyncio.gather(
+                call(bridge.PRIORITY_HISTORY), call(bridge.PRIORITY_PORTFOLIO),
+                call(bridge.PRIORITY_ORDER), call(bridge.PRIORITY_QUOTE),
+            ), timeout=2.0)
+        finally:
+            scheduler.stop()
+
+    asyncio.run(main())
+    assert granted == [bridge.PRIORITY_ORDER, bridge.PRIORITY_QUOTE,
+                       bridge.PRIORITY_PORTFOLIO, bridge.PRIORITY_HISTORY]
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def main():
+        scheduler = bridge.PacingScheduler(0.5, 1)
+        takes(scheduler, "portfolio/accounts/x")
+        waiter = asyncio.ensure_future(scheduler.acquire("portfolio/accounts/x", bridge.PRIORITY_ORDER))
+        await asyncio.sleep(0)
+        assert scheduler.snapshot()["waiting"] == 1
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert scheduler.snapshot()["waiting"] == 0
+        scheduler.stop()
+
+    asyncio.run(main())
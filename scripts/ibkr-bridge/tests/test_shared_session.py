@@ -0,0 +1,76 @@
+"""
+Multi-worker session state: a follower mirrors the poller's session health
+and must be able to take over the keepalive.
+
+Run from scripts/ibkr-bridge:  python -m pytest -q tests
+"""
+
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.encoders import jsonable_encoder
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as bridge
+
+
+@pytest.fixture
+def follower(tmp_path, monkeypatch):
+    """A worker on a shared file, with the gateway and Session API stubbed out."""
+    store = bridge.SharedStore(str(tmp_path / "shared.db"))
+    monkeypatch.setattr(bridge, "_shared", store)
+    monkeypatch.setattr(bridge, "_session_health", dict(bridge._session_health))
+    reauths = []
+
+    async def ib_post(path, json=None, priority=None):
+        return {}
+
+    async def refresh_auth_status():
+        bridge.record_auth_state("unauthenticated", False, {"authenticated": False})
+
+    async def trigger_ibeam_reauth():
+        reauths.append(datetime.utcnow())
+        return True
+
+    async def subscribe_session_cookies():
+        return True
+
+    monkeypatch.setattr(bridge, "ib_post", ib_post)
+    monkeypatch.setattr(bridge, "refresh_auth_status", refresh_auth_status)
+    monkeypatch.setattr(bridge, "trigger_ibeam_reauth", trigger_ibeam_reauth)
+    monkeypatch.setattr(bridge, "subscribe_session_cookies", subscribe_session_cookies)
+    yield store, reauths
+    store.conn.close()
+
+
+def publish(store, **health):
+    """What the poller's keepalive loop writes to the shared file."""
+    state = {**bridge._session_health, "state": "unauthenticated", "authenticated": False, **health}
+    store.put("state:session", {"health": jsonable_encoder(state), "raw": {"authenticated": False}})
+
+
+def test_keepalive_after_sync_triggers_reauth(follower):
+    store, reauths = follower
+    now = datetime.utcnow()
+    publish(store, consecutive_failures=5, last_check_at=now,
+            last_reauth_at=now - timedelta(seconds=bridge.REAUTH_COOLDOWN + 60))
+
+    bridge.sync_shared_session()
+    assert isinstance(bridge._session_health["last_reauth_at"], datetime)
+
+    asyncio.run(bridge.keepalive_tick())
+    assert len(reauths) == 1
+    assert bridge._session_health["reauth_count"] == 1
+
+
+def test_keepalive_after_sync_respects_reauth_cooldown(follower):
+    store, reauths = follower
+    publish(store, consecutive_failures=5, last_reauth_at=datetime.utcnow() - timedelta(seconds=10))
+
+    bridge.sync_shared_session()
+    asyncio.run(bridge.keepalive_tick())
+    assert reauths == []
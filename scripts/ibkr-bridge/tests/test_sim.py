@@ -0,0 +1,297 @@
+"""
+Paper-trading matching engine and backtests.
+
+Run from scripts/ibkr-bridge:  python -m pytest -q tests
+"""
+
+import os
+import sys
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as bridge
+
+
+AAPL = 265598
+# Wednesday 2024-05-01 14:00 New York, two hours before the session close
+NOW = datetime(2024, 5, 1, 14, 0, tzinfo=ZoneInfo("America/New_York")).timestamp()
+
+
+@pytest.fixture
+def engine():
+    return bridge.SimEngine(100000.0, 0.0, 0.0)
+
+
+def order(side, type="market", qty=10, limit=None, stop=None, tif="GTC"):
+    return bridge.PlaceOrderRequest(symbol="AAPL", side=side, type=type, qty=qty,
+                                    limit_price=limit, stop_price=stop, time_in_force=tif)
+
+
+def tick(last, bid=None, ask=None, ts=NOW):
+    return bridge.Tick(AAPL, last, bid if bid is not None else last, ask if ask is not None else last, ts=ts)
+
+
+def position(engine):
+    return engine.positions["AAPL"]
+
+
+# --- PriceLevels / SimBook ---
+
+def test_price_levels_pop_best_level_first_and_fifo_within_a_level():
+    levels = bridge.PriceLevels()
+    a, b, c, d = (object() for _ in range(4))
+    levels.add(101.0, a)
+    levels.add(100.0, b)
+    levels.add(101.0, c)
+    levels.add(99.0, d)
+    assert len(levels) == 3
+
+    assert levels.pop_at_or_above(100.0) == [a, c, b]
+    assert levels.prices == [99.0]
+    assert levels.pop_at_or_below(98.0) == []
+    assert levels.pop_at_or_below(99.0) == [d]
+    assert len(levels) == 0
+
+
+def test_price_levels_remove_drops_empty_level():
+    levels = bridge.PriceLevels()
+    a, b = object(), object()
+    levels.add(100.0, a)
+    levels.add(100.0, b)
+    levels.remove(100.0, a)
+    assert levels.prices == [100.0]
+    levels.remove(100.0, a)  # already gone: no-op
+    levels.remove(100.0, b)
+    assert levels.prices == [] and levels.queues == {}
+
+
+def test_sim_book_counts_every_resting_side(engine):
+    engine.place(order("buy", "limit", limit=90.0), AAPL, None, NOW)
+    engine.place(order("sell", "stop", stop=80.0), AAPL, None, NOW)
+    engine.place(order("buy"), AAPL, None, NOW)
+    book = engine.books[AAPL]
+    assert (len(book.buy_limits), len(book.sell_stops), len(book.markets)) == (1, 1, 1)
+    assert len(book) == 3
+
+
+# --- SimEngine matching ---
+
+def test_market_order_fills_at_the_touch(engine):
+    buy = engine.place(order("buy"), AAPL, tick(100.0, 99.9, 100.1), NOW)
+    sell = engine.place(order("sell", qty=4), AAPL, tick(100.0, 99.9, 100.1), NOW)
+    assert (buy.status, buy.fill_price) == ("filled", 100.1)
+    assert (sell.status, sell.fill_price) == ("filled", 99.9)
+    assert position(engine)["qty"] == 6
+
+
+def test_market_order_without_quote_waits_for_first_tick(engine):
+    buy = engine.place(order("buy"), AAPL, None, NOW)
+    assert buy.status == "open" and AAPL in engine.watched
+    engine.on_tick(tick(50.0, 49.9, 50.1))
+    assert (buy.status, buy.fill_price) == ("filled", 50.1)
+    assert AAPL not in engine.books
+
+
+def test_resting_limit_fills_at_its_own_price(engine):
+    buy = engine.place(order("buy", "limit", limit=95.0), AAPL, tick(100.0), NOW)
+    assert buy.status == "open"
+    engine.on_tick(tick(96.0))
+    assert buy.status == "open"
+    engine.on_tick(tick(94.0, 93.9, 94.1))
+    assert (buy.status, buy.fill_price) == ("filled", 95.0)
+
+
+def test_buy_stop_triggers_when_last_reaches_stop(engine):
+    stop = engine.place(order("buy", "stop", stop=105.0), AAPL, tick(100.0), NOW)
+    engine.on_tick(tick(104.99))
+    assert stop.status == "open"
+    engine.on_tick(tick(105.0, 104.9, 105.2))
+    assert (stop.status, stop.fill_price) == ("filled", 105.2)
+
+
+def test_sell_stop_placed_through_the_market_triggers_at_once(engine):
+    stop = engine.place(order("sell", "stop", stop=105.0), AAPL, tick(100.0, 99.9, 100.1), NOW)
+    assert (stop.status, stop.fill_price) == ("filled", 99.9)
+
+
+def test_triggered_stop_limit_rests_until_marketable(engine):
+    stop = engine.place(order("sell", "stop_limit", stop=95.0, limit=94.5), AAPL, tick(100.0), NOW)
+    # Triggered, but the bid is below the limit: rests as a sell limit
+    engine.on_tick(tick(94.0, 93.9, 94.1))
+    book = engine.books[AAPL]
+    assert stop.status == "open"
+    assert (len(book.sell_stops), book.sell_limits.prices) == (0, [94.5])
+
+    engine.on_tick(tick(94.6, 94.5, 94.7))
+    assert (stop.status, stop.fill_price) == ("filled", 94.5)
+
+
+def test_stop_limit_marketable_on_trigger_fills_at_quote(engine):
+    stop = engine.place(order("buy", "stop_limit", stop=105.0, limit=106.0), AAPL, tick(100.0), NOW)
+    engine.on_tick(tick(105.5, 105.4, 105.6))
+    assert (stop.status, stop.fill_price) == ("filled", 105.6)
+
+
+@pytest.mark.parametrize("bar_open, expected", [(102.0, 105.0), (107.0, 107.0)])
+def test_backtest_stop_fills_at_stop_or_gap_open(engine, bar_open, expected):
+    stop = engine.place(order("buy", "stop", stop=105.0), AAPL, None, NOW)
+    engine.bar_opens[AAPL] = bar_open
+    engine.on_tick(tick(bar_open))
+    engine.on_tick(tick(108.0))
+    assert (stop.status, stop.fill_price) == ("filled", expected)
+
+
+def test_sell_stop_gap_down_fills_at_open(engine):
+    stop = engine.place(order("sell", "stop", stop=95.0), AAPL, None, NOW)
+    engine.bar_opens[AAPL] = 90.0
+    engine.on_tick(tick(90.0))
+    assert (stop.status, stop.fill_price) == ("filled", 90.0)
+
+
+def test_ioc_fills_or_cancels(engine):
+    resting = engine.place(order("buy", "limit", limit=99.0, tif="IOC"), AAPL, tick(100.0), NOW)
+    assert resting.status == "cancelled"
+    assert AAPL not in engine.books and not engine.open_ids
+
+    marketable = engine.place(order("buy", "limit", limit=101.0, tif="IOC"), AAPL, tick(100.0), NOW)
+    assert (marketable.status, marketable.fill_price) == ("filled", 100.0)
+
+
+def test_day_orders_expire_at_session_close(engine):
+    day = engine.place(order("buy", "limit", limit=90.0, tif="DAY"), AAPL, tick(100.0), NOW)
+    gtc = engine.place(order("buy", "limit", limit=89.0, tif="GTC"), AAPL, tick(100.0), NOW)
+    close = datetime(2024, 5, 1, 16, 0, tzinfo=ZoneInfo("America/New_York")).timestamp()
+    assert day.expires_at == close
+
+    engine.on_tick(tick(100.0, ts=close - 1))
+    assert day.status == "open"
+    engine.on_tick(tick(100.0, ts=close))
+    assert day.status == "expired" and gtc.status == "open"
+    assert engine.books[AAPL].buy_limits.prices == [89.0]
+
+
+def test_day_order_placed_friday_evening_expires_monday():
+    friday = datetime(2024, 5, 3, 18, 0, tzinfo=ZoneInfo("America/New_York")).timestamp()
+    monday_close = datetime(2024, 5, 6, 16, 0, tzinfo=ZoneInfo("America/New_York")).timestamp()
+    assert bridge.session_close_after(friday) == monday_close
+
+
+def test_cancel_takes_order_off_the_book(engine):
+    stop = engine.place(order("sell", "stop_limit", stop=95.0, limit=94.0), AAPL, None, NOW)
+    assert engine.cancel(stop.id, NOW) is stop
+    assert stop.status == "cancelled" and AAPL not in engine.books
+    assert engine.cancel(stop.id, NOW) is None
+
+
+# --- positions and P&L ---
+
+def test_position_flip_realizes_pnl_and_reopens_at_fill_price(engine):
+    engine.place(order("buy", qty=10), AAPL, tick(100.0), NOW)
+    engine.place(order("sell", qty=15), AAPL, tick(110.0), NOW)
+    p = position(engine)
+    assert (p["qty"], p["avg_price"], p["realized_pnl"]) == (-5, 110.0, 100.0)
+
+    engine.place(order("buy", qty=5), AAPL, tick(105.0), NOW)
+    p = position(engine)
+    assert (p["qty"], p["realized_pnl"]) == (0, 125.0)
+    assert engine.cash == pytest.approx(100125.0)
+    assert engine.position_models() == []
+
+
+def test_adding_to_a_position_averages_its_price(engine):
+    engine.place(order("buy", qty=10), AAPL, tick(100.0), NOW)
+    engine.place(order("buy", qty=30), AAPL, tick(104.0), NOW)
+    assert position(engine)["avg_price"] == pytest.approx(103.0)
+
+    engine.on_tick(tick(110.0))
+    [model] = engine.position_models()
+    assert model.unrealized_pnl == pytest.approx(40 * 7.0)
+    assert engine.equity() == pytest.approx(100000.0 + 40 * 7.0)
+
+
+def test_fees_reduce_cash_and_realized_pnl():
+    engine = bridge.SimEngine(100000.0, 0.005, 1.0)
+    engine.place(order("buy", qty=100), AAPL, tick(10.0), NOW)        # fee 1.0 (minimum)
+    engine.place(order("sell", qty=100), AAPL, tick(11.0), NOW)       # fee 1.0
+    assert position(engine)["realized_pnl"] == pytest.approx(100.0 - 2.0)
+    assert engine.cash == pytest.approx(100098.0)
+    assert [t.fee for t in engine.trades] == [1.0, 1.0]
+
+
+def test_pnl_day_restarts_at_session_close(engine):
+    engine.place(order("buy", qty=10), AAPL, tick(100.0), NOW)
+    engine.on_tick(tick(103.0, ts=NOW + 60))
+    assert engine.pnl_day(NOW + 60) == pytest.approx(30.0)
+
+    next_day = NOW + 86400
+    engine.on_tick(tick(104.0, ts=next_day))
+    # Equity at the close (marks before this tick) is the new day's start
+    assert engine.pnl_day(next_day) == pytest.approx(10.0)
+
+
+def test_watch_changes_follow_books_and_positions(engine):
+    changes = []
+    engine.on_watch_change = lambda conid, watching: changes.append((conid, watching))
+    buy = engine.place(order("buy", "limit", limit=95.0), AAPL, tick(100.0), NOW)
+    engine.on_tick(tick(94.0))
+    assert buy.status == "filled"
+    # Still watched for marks while the position is open
+    assert changes == [(AAPL, True)]
+
+    engine.place(order("sell"), AAPL, tick(96.0), NOW)
+    assert changes == [(AAPL, True), (AAPL, False)]
+
+
+# --- backtests ---
+
+def bar_columns(closes, start=1714572000, step=86400):
+    closes = np.array(closes, dtype=float)
+    opens = np.concatenate([[closes[0]], closes[:-1]])
+    return {
+        "ts": np.arange(len(closes)) * step + start,
+        "open": opens,
+        "high": np.maximum(opens, closes) + 0.5,
+        "low": np.minimum(opens, closes) - 0.5,
+        "close": closes,
+        "volume": np.full(len(closes), 1000.0),
+    }
+
+
+def test_run_backtest_round_trip_at_next_bar_opens():
+    closes = [100.0] * 5 + [101.0, 103.0, 106.0, 110.0, 115.0] + [112.0, 108.0, 103.0, 97.0, 90.0]
+    columns = bar_columns(closes)
+    result = bridge.run_backtest("sma_cross", {"fast": 2, "slow": 4, "qty": 10}, "TEST", "1d",
+                                 columns, 10000.0, 0.0, 50, True)
+
+    fills = result["fills"]
+    assert [f["side"] for f in fills] == ["buy", "sell"]
+    opens = set(columns["open"].tolist())
+    assert all(f["price"] in opens for f in fills)
+    assert result["position"] == 0.0
+    assert result["final_equity"] == pytest.approx(10000.0 + 10 * (fills[1]["price"] - fills[0]["price"]))
+    assert result["trades"] == 2 and result["fees"] == 0.0
+    assert result["max_drawdown"] <= 0.0
+    assert len(result["equity_curve"]["ts"]) == len(closes)
+    assert all(o["status"] == "filled" for o in result["orders"])
+
+
+def test_run_backtest_channel_breakout_uses_resting_stops():
+    closes = [100.0, 100.5, 100.0, 100.5, 100.0, 104.0, 108.0, 112.0, 111.0, 104.0, 98.0, 95.0]
+    result = bridge.run_backtest("channel_breakout", {"lookback": 3, "exit": 2, "qty": 5}, "TEST", "1d",
+                                 bar_columns(closes), 10000.0, 0.005, 5, True)
+
+    sides = [f["side"] for f in result["fills"]]
+    assert sides == ["buy", "sell"]
+    # Neither bar gapped through its stop, so both filled at the stop price
+    filled = [o for o in result["orders"] if o["status"] == "filled"]
+    assert [f["price"] for f in result["fills"]] == [o["stop_price"] for o in filled]
+    # Unfilled stops were cancelled when the next bar re-placed them
+    assert {o["status"] for o in result["orders"]} == {"filled", "cancelled", "open"}
+    assert sum(o["status"] == "open" for o in result["orders"]) == 1
+    assert result["fees"] == pytest.approx(2.0)
+    assert len(result["equity_curve"]["ts"]) == 5